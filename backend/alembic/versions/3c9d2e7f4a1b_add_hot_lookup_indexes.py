@@ -0,0 +1,38 @@
+"""Add indexes for hot lookups
+
+Revision ID: 3c9d2e7f4a1b
+Revises: ffd6e7bca23d
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d2e7f4a1b'
+down_revision = 'ffd6e7bca23d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Built concurrently so live tables are not locked against writes.
+    # users.firebase_uid is already backed by its unique constraint's index.
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_subscriptions_stripe_subscription_id'), 'subscriptions', ['stripe_subscription_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_subscriptions_user_id_status', 'subscriptions', ['user_id', 'status'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_subscriptions_active_user_id', 'subscriptions', ['user_id', 'created_at'], unique=False, postgresql_where=sa.text("status = 'ACTIVE'"), postgresql_concurrently=True)
+        op.create_index(op.f('ix_subscription_plans_stripe_price_id'), 'subscription_plans', ['stripe_price_id'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_projects_owner_id'), 'projects', ['owner_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_project_members_user_id', 'project_members', ['user_id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_project_members_user_id', table_name='project_members', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_projects_owner_id'), table_name='projects', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_subscription_plans_stripe_price_id'), table_name='subscription_plans', postgresql_concurrently=True)
+        op.drop_index('ix_subscriptions_active_user_id', table_name='subscriptions', postgresql_concurrently=True)
+        op.drop_index('ix_subscriptions_user_id_status', table_name='subscriptions', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_subscriptions_stripe_subscription_id'), table_name='subscriptions', postgresql_concurrently=True)
@@ -0,0 +1,24 @@
+"""Add last_event_at to subscriptions
+
+Revision ID: 3e7b9c1d5a8f
+Revises: 7c2f9a4e1b5d
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e7b9c1d5a8f'
+down_revision = '7c2f9a4e1b5d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('subscriptions', sa.Column('last_event_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('subscriptions', 'last_event_at')
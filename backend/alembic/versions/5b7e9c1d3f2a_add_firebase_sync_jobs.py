@@ -0,0 +1,35 @@
+"""Add firebase_sync_jobs table
+
+Revision ID: 5b7e9c1d3f2a
+Revises: 8e1f5a2b6c3d
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e9c1d3f2a'
+down_revision = '8e1f5a2b6c3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('firebase_sync_jobs',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(op.f('ix_firebase_sync_jobs_next_attempt_at'), 'firebase_sync_jobs', ['next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_firebase_sync_jobs_next_attempt_at'), table_name='firebase_sync_jobs')
+    op.drop_table('firebase_sync_jobs')
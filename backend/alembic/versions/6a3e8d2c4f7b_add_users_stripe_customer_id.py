@@ -0,0 +1,30 @@
+"""Add users.stripe_customer_id
+
+Revision ID: 6a3e8d2c4f7b
+Revises: 2f8c4b6d9a7e
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a3e8d2c4f7b'
+down_revision = '2f8c4b6d9a7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Nullable without a default, so adding it doesn't rewrite the table.
+    # Filled lazily and by app/scripts/backfill_stripe_customers.py
+    op.add_column('users', sa.Column('stripe_customer_id', sa.String(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_users_stripe_customer_id'), 'users', ['stripe_customer_id'], unique=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_users_stripe_customer_id'), table_name='users', postgresql_concurrently=True)
+    op.drop_column('users', 'stripe_customer_id')
@@ -0,0 +1,42 @@
+"""Add stripe_events inbox
+
+Revision ID: 7c2f9a4e1b5d
+Revises: 4d8b1f6e9c2a
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2f9a4e1b5d'
+down_revision = '4d8b1f6e9c2a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('stripe_events',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('type', sa.String(), nullable=False),
+    sa.Column('stripe_subscription_id', sa.String(), nullable=True),
+    sa.Column('stripe_created_at', sa.DateTime(), nullable=False),
+    sa.Column('received_at', sa.DateTime(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stripe_events_pending', 'stripe_events', ['next_attempt_at'], unique=False, postgresql_where=sa.text('processed_at IS NULL'))
+    op.create_index('ix_stripe_events_pending_subscription', 'stripe_events', ['stripe_subscription_id', 'stripe_created_at', 'received_at'], unique=False, postgresql_where=sa.text('processed_at IS NULL'))
+    op.create_index(op.f('ix_stripe_events_processed_at'), 'stripe_events', ['processed_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_stripe_events_processed_at'), table_name='stripe_events')
+    op.drop_index('ix_stripe_events_pending_subscription', table_name='stripe_events', postgresql_where=sa.text('processed_at IS NULL'))
+    op.drop_index('ix_stripe_events_pending', table_name='stripe_events', postgresql_where=sa.text('processed_at IS NULL'))
+    op.drop_table('stripe_events')
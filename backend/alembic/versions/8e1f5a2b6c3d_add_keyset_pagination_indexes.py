@@ -0,0 +1,31 @@
+"""Add keyset pagination indexes
+
+Revision ID: 8e1f5a2b6c3d
+Revises: 3c9d2e7f4a1b
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e1f5a2b6c3d'
+down_revision = '3c9d2e7f4a1b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The owner index is superseded by the composite one, which leads with owner_id
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_projects_owner_id_created_at_id', 'projects', ['owner_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_projects_owner_id', table_name='projects', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_projects_owner_id', 'projects', ['owner_id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_projects_owner_id_created_at_id', table_name='projects', postgresql_concurrently=True)
+        op.drop_index('ix_users_created_at_id', table_name='users', postgresql_concurrently=True)
@@ -1,15 +1,31 @@
 from datetime import timedelta
-from typing import Any
+from typing import Any, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.core.dependencies import get_current_user, get_db
-from app.core.security import create_access_token, get_password_hash, verify_password
+from app.core.dependencies import (
+    SessionReleasingRoute,
+    get_async_db,
+    get_current_user,
+    security,
+)
+from app.core.principal import Principal
+from app.core.hashing import password_hasher
+from app.core.refresh_tokens import (
+    issue_refresh_token,
+    revoke_refresh_token_family,
+    rotate_refresh_token,
+)
+from app.core.revocation import revoke_access_token
+from app.core.security import create_user_access_token, is_app_token, verify_token
 from app.db.models.user import User
-from app.schemas.token import Token
+from app.workers.firebase_sync import enqueue_firebase_sync
+from app.schemas.token import LogoutRequest, RefreshRequest, Token
 from app.schemas.user import User as UserSchema
 from app.schemas.user import UserCreate, UserLogin, GoogleLogin
 from app.core.firebase_admin import (
@@ -19,18 +35,25 @@ from app.core.firebase_admin import (
     get_firebase_user_by_email,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
 @router.post("/login", response_model=Token)
-def login(
-    db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()
+async def login(
+    db: AsyncSession = Depends(get_async_db),
+    form_data: OAuth2PasswordRequestForm = Depends(),
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    result = await db.execute(select(User).where(User.email == form_data.username))
+    user = result.scalars().first()
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update(
+            form_data.password, user.hashed_password
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -40,47 +63,42 @@ def login(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
         )
+    if new_hash:
+        # Stored with another BCRYPT_ROUNDS, keep it at the configured cost
+        user.hashed_password = new_hash
 
-    # Ensure user has a Firebase UID
+    # The Firebase account is linked or created by the sync worker
     if not user.firebase_uid:
-        try:
-            # Initialize Firebase Admin SDK
-            initialize_firebase_admin()
-
-            # Check if user already exists in Firebase
-            firebase_user = get_firebase_user_by_email(user.email)
+        await enqueue_firebase_sync(db, user.id)
 
-            if firebase_user:
-                # User exists in Firebase, update our database with the Firebase UID
-                user.firebase_uid = firebase_user.uid
-            else:
-                # Create a new Firebase user
-                firebase_user = create_firebase_user(user.email, form_data.password)
-                user.firebase_uid = firebase_user.uid
-
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        except Exception as e:
-            # Log the error but don't fail the login
-            print(f"Error syncing user with Firebase: {str(e)}")
+    refresh_token = await issue_refresh_token(db, user.id)
+    await db.commit()
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return {
-        "access_token": create_access_token(
-            subject=user.id, expires_delta=access_token_expires
+        "access_token": create_user_access_token(
+            user, expires_delta=access_token_expires
         ),
         "token_type": "bearer",
+        "refresh_token": refresh_token,
     }
 
 
 @router.post("/login/email", response_model=Token)
-def login_email(user_in: UserLogin, db: Session = Depends(get_db)) -> Any:
+async def login_email(
+    user_in: UserLogin, db: AsyncSession = Depends(get_async_db)
+) -> Any:
     """
     Login with email and password.
     """
-    user = db.query(User).filter(User.email == user_in.email).first()
-    if not user or not verify_password(user_in.password, user.hashed_password):
+    result = await db.execute(select(User).where(User.email == user_in.email))
+    user = result.scalars().first()
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update(
+            user_in.password, user.hashed_password
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -89,47 +107,37 @@ def login_email(user_in: UserLogin, db: Session = Depends(get_db)) -> Any:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
         )
+    if new_hash:
+        # Stored with another BCRYPT_ROUNDS, keep it at the configured cost
+        user.hashed_password = new_hash
 
-    # Ensure user has a Firebase UID
+    # The Firebase account is linked or created by the sync worker
     if not user.firebase_uid:
-        try:
-            # Initialize Firebase Admin SDK
-            initialize_firebase_admin()
-
-            # Check if user already exists in Firebase
-            firebase_user = get_firebase_user_by_email(user.email)
+        await enqueue_firebase_sync(db, user.id)
 
-            if firebase_user:
-                # User exists in Firebase, update our database with the Firebase UID
-                user.firebase_uid = firebase_user.uid
-            else:
-                # Create a new Firebase user
-                firebase_user = create_firebase_user(user.email, user_in.password)
-                user.firebase_uid = firebase_user.uid
-
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        except Exception as e:
-            # Log the error but don't fail the login
-            print(f"Error syncing user with Firebase: {str(e)}")
+    refresh_token = await issue_refresh_token(db, user.id)
+    await db.commit()
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return {
-        "access_token": create_access_token(
-            subject=user.id, expires_delta=access_token_expires
+        "access_token": create_user_access_token(
+            user, expires_delta=access_token_expires
         ),
         "token_type": "bearer",
+        "refresh_token": refresh_token,
     }
 
 
 @router.post("/register", response_model=Token)
-def register(user_in: UserCreate, db: Session = Depends(get_db)) -> Any:
+async def register(
+    user_in: UserCreate, db: AsyncSession = Depends(get_async_db)
+) -> Any:
     """
     Register a new user.
     """
     # Check if user already exists in our database
-    user = db.query(User).filter(User.email == user_in.email).first()
+    result = await db.execute(select(User).where(User.email == user_in.email))
+    user = result.scalars().first()
     if user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -143,35 +151,45 @@ def register(user_in: UserCreate, db: Session = Depends(get_db)) -> Any:
         # Check if user already exists in Firebase
         firebase_user = None
         try:
-            firebase_user = get_firebase_user_by_email(user_in.email)
+            firebase_user = await run_in_threadpool(
+                get_firebase_user_by_email, user_in.email
+            )
         except Exception:
             # User doesn't exist in Firebase, which is fine for registration
             pass
 
         if not firebase_user:
             # Create a new Firebase user
-            firebase_user = create_firebase_user(user_in.email, user_in.password)
+            firebase_user = await run_in_threadpool(
+                create_firebase_user, user_in.email, user_in.password
+            )
 
         # Create user in our database with Firebase UID
         new_user = User(
             email=user_in.email,
-            hashed_password=get_password_hash(user_in.password),
+            hashed_password=await password_hasher.hash(user_in.password),
             full_name=user_in.full_name,
             is_active=True,
             is_superuser=False,
             firebase_uid=firebase_user.uid,
         )
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
+
+        refresh_token = await issue_refresh_token(db, new_user.id)
+        await db.commit()
 
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         return {
-            "access_token": create_access_token(
-                subject=new_user.id, expires_delta=access_token_expires
+            "access_token": create_user_access_token(
+                new_user, expires_delta=access_token_expires
             ),
             "token_type": "bearer",
+            "refresh_token": refresh_token,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -180,7 +198,9 @@ def register(user_in: UserCreate, db: Session = Depends(get_db)) -> Any:
 
 
 @router.post("/google", response_model=Token)
-def google_login(google_in: GoogleLogin, db: Session = Depends(get_db)) -> Any:
+async def google_login(
+    google_in: GoogleLogin, db: AsyncSession = Depends(get_async_db)
+) -> Any:
     """
     Login with Google ID token.
     """
@@ -189,21 +209,27 @@ def google_login(google_in: GoogleLogin, db: Session = Depends(get_db)) -> Any:
         initialize_firebase_admin()
 
         # Verify the ID token
-        user_info = verify_firebase_token(google_in.id_token)
+        user_info = await run_in_threadpool(verify_firebase_token, google_in.id_token)
 
         # Check if user exists in our database
-        user = db.query(User).filter(User.firebase_uid == user_info["uid"]).first()
+        result = await db.execute(
+            select(User).where(User.firebase_uid == user_info["uid"])
+        )
+        user = result.scalars().first()
 
         # If user doesn't exist by firebase_uid, try to find by email
         if not user:
-            user = db.query(User).filter(User.email == user_info["email"]).first()
+            result = await db.execute(
+                select(User).where(User.email == user_info["email"])
+            )
+            user = result.scalars().first()
 
             # If found by email but no firebase_uid, update the user with the firebase_uid
             if user:
                 user.firebase_uid = user_info["uid"]
                 db.add(user)
-                db.commit()
-                db.refresh(user)
+                await db.commit()
+                await db.refresh(user)
 
         # If user still doesn't exist, create them
         if not user:
@@ -215,16 +241,20 @@ def google_login(google_in: GoogleLogin, db: Session = Depends(get_db)) -> Any:
                 is_superuser=False,
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
+
+        # Create access and refresh tokens
+        refresh_token = await issue_refresh_token(db, user.id)
+        await db.commit()
 
-        # Create access token
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         return {
-            "access_token": create_access_token(
-                subject=user.id, expires_delta=access_token_expires
+            "access_token": create_user_access_token(
+                user, expires_delta=access_token_expires
             ),
             "token_type": "bearer",
+            "refresh_token": refresh_token,
         }
     except Exception as e:
         raise HTTPException(
@@ -233,26 +263,61 @@ def google_login(google_in: GoogleLogin, db: Session = Depends(get_db)) -> Any:
         )
 
 
+@router.post("/refresh", response_model=Token)
+async def refresh(
+    refresh_in: RefreshRequest, db: AsyncSession = Depends(get_async_db)
+) -> Any:
+    """
+    Exchange a refresh token for a new access token and the next refresh token.
+    """
+    user, refresh_token = await rotate_refresh_token(db, refresh_in.refresh_token)
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return {
+        "access_token": create_user_access_token(
+            user, expires_delta=access_token_expires
+        ),
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+    }
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    logout_in: Optional[LogoutRequest] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+) -> None:
+    """
+    Revoke the access token the request was made with, and the refresh token
+    family if one is given. Firebase ID tokens can't be revoked one by one.
+    """
+    token = credentials.credentials
+    if is_app_token(token):
+        payload = verify_token(token)
+        if payload is not None and payload.jti is not None:
+            await revoke_access_token(db, payload.jti, payload.exp)
+    if logout_in is not None and logout_in.refresh_token:
+        await revoke_refresh_token_family(db, logout_in.refresh_token, current_user.id)
+    await db.commit()
+
+
 @router.get("/me", response_model=UserSchema)
 async def get_me(
-    current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)
-):
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+) -> Any:
     """
     Get current user information
     """
-    # Check if user exists in our database
-    user = db.query(User).filter(User.firebase_uid == current_user["uid"]).first()
-
-    # If user doesn't exist, create them
+    # Principals from Firebase tokens were loaded from the users row. App
+    # tokens only carry claims, the full profile has to be read
+    if current_user.created_at is not None:
+        return current_user
+    user = await db.get(User, current_user.id)
     if not user:
-        user = User(
-            email=current_user["email"],
-            full_name=current_user["name"],
-            firebase_uid=current_user["uid"],
-            is_active=True,
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found in database",
         )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-
     return user
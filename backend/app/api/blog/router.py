@@ -1,17 +1,12 @@
 from typing import Any, Dict, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-
-from app.core.dependencies import get_current_active_superuser, get_current_user, get_db
-from app.db.models.user import User
+from fastapi import APIRouter, HTTPException, status
 
 router = APIRouter()
 
 
 @router.get("/articles", response_model=List[Dict[str, Any]])
 def get_articles(
-    db: Session = Depends(get_db),
     skip: int = 0,
     limit: int = 10,
 ) -> Any:
@@ -38,7 +33,6 @@ def get_articles(
 @router.get("/articles/{slug}", response_model=Dict[str, Any])
 def get_article(
     slug: str,
-    db: Session = Depends(get_db),
 ) -> Any:
     """
     Retrieve a specific blog article by slug.
@@ -0,0 +1 @@
+# Internal API package
@@ -0,0 +1,86 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends
+
+from app.core.dependencies import get_current_active_superuser
+from app.core.principal import Principal, principal_cache
+from app.core import firebase_admin
+from app.core.firebase_admin import token_cache
+from app.core.hashing import password_hasher
+from app.core.loop_monitor import loop_monitor
+from app.core.ratelimit import rate_limit_store, rate_limited, rejected_tokens
+from app.core.revocation import revocation_list
+from app.core import stripe_client
+from app.db.pool import get_pool_stats
+from app.db.routing import replica_router
+from app.db.session import replica_engine
+
+router = APIRouter()
+
+
+@router.get("/stats/pool", response_model=Dict[str, Dict[str, Any]])
+async def read_pool_stats(
+    current_user: Principal = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Connection pool gauges and checkout counters per engine. Only for superusers.
+    """
+    return get_pool_stats()
+
+
+@router.get("/stats/replica", response_model=Dict[str, Any])
+async def read_replica_stats(
+    current_user: Principal = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Replica lag as last measured and the lag threshold. Only for superusers.
+    """
+    return {
+        "configured": replica_engine is not None,
+        "lag_seconds": replica_router.lag,
+        "max_lag_seconds": replica_router.max_lag,
+        "serving_reads": replica_router.use_replica(None),
+    }
+
+
+@router.get("/stats/loop", response_model=Dict[str, Any])
+async def read_loop_stats(
+    current_user: Principal = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Event loop lag samples and the stacks of recent stalls. Only for superusers.
+    """
+    return loop_monitor.stats()
+
+
+@router.get("/stats/stripe", response_model=Dict[str, Any])
+async def read_stripe_stats(
+    current_user: Principal = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Latency per Stripe call and the circuit breaker's state. Only for superusers.
+    """
+    return stripe_client.stats()
+
+
+@router.get("/stats/auth", response_model=Dict[str, Dict[str, Any]])
+async def read_auth_stats(
+    current_user: Principal = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Hit/miss counters and size of the auth caches. Only for superusers.
+    """
+    stats = {
+        "token_cache": token_cache.stats(),
+        "principal_cache": principal_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "revocation_list": revocation_list.stats(),
+        "rate_limit": {
+            **rate_limit_store.stats(),
+            "rejected": dict(rate_limited),
+        },
+        "rejected_tokens": rejected_tokens.stats(),
+    }
+    if firebase_admin.token_verifier is not None:
+        stats["token_verifier"] = firebase_admin.token_verifier.stats()
+    return stats
@@ -1,28 +1,36 @@
 from typing import Any, List
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-import stripe
 import logging
 
 from app.core.config import settings
-from app.core.dependencies import get_current_active_superuser, get_current_user, get_db
+from app.core.dependencies import (
+    SessionReleasingRoute,
+    get_async_db,
+    get_read_db,
+    get_current_active_superuser,
+    get_current_user,
+)
+from app.core.pagination import PageParams
+from app.core.principal import Principal
 from app.core.stripe import (
-    cancel_subscription,
-    create_subscription,
-    get_customer_invoices,
-    get_stripe_customer,
+    cancel_subscription_async,
+    create_subscription_async,
+    get_customer_id,
     handle_webhook_event,
-    create_checkout_session,
+    create_checkout_session_async,
 )
+from app.db.models.invoice import Invoice
 from app.db.models.subscription import (
     Subscription,
     SubscriptionPlan,
     SubscriptionStatus,
 )
-from app.db.models.user import User
+from app.schemas.invoice import Invoice as InvoiceSchema
 from app.schemas.subscription import (
     Subscription as SubscriptionSchema,
     SubscriptionPlan as SubscriptionPlanSchema,
@@ -30,6 +38,7 @@ from app.schemas.subscription import (
     SubscriptionPlanCreate,
     SubscriptionRequest,
 )
+from app.workers.stripe_events import enqueue_stripe_event
 
 logger = logging.getLogger(__name__)
 
@@ -39,33 +48,32 @@ class CheckoutSessionResponse(BaseModel):
     checkout_url: str
 
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
 @router.get("/plans", response_model=List[SubscriptionPlanSchema])
-def get_subscription_plans(
-    db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100,
+async def get_subscription_plans(
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    page: PageParams = Depends(),
 ) -> Any:
     """
     Retrieve subscription plans.
     """
-    plans = (
-        db.query(SubscriptionPlan)
-        .filter(SubscriptionPlan.is_active == True)
-        .offset(skip)
-        .limit(limit)
-        .all()
+    result = await db.execute(
+        page.apply(
+            select(SubscriptionPlan).where(SubscriptionPlan.is_active == True),
+            SubscriptionPlan,
+        )
     )
-    return plans
+    return page.page(response, result.scalars().all())
 
 
 @router.post("/plans", response_model=SubscriptionPlanSchema)
-def create_subscription_plan(
+async def create_subscription_plan(
     plan_in: SubscriptionPlanCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_superuser),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_superuser),
 ) -> Any:
     """
     Create new subscription plan. Only for superusers.
@@ -79,65 +87,64 @@ def create_subscription_plan(
         is_active=plan_in.is_active,
     )
     db.add(plan)
-    db.commit()
-    db.refresh(plan)
+    await db.commit()
+    await db.refresh(plan)
     return plan
 
 
 @router.get("/subscriptions", response_model=List[SubscriptionSchema])
-def get_user_subscriptions(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def get_user_subscriptions(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Retrieve current user's most relevant subscription (active or latest canceled).
     """
     # First try to find an active subscription
-    active_subscription = (
-        db.query(Subscription)
-        .filter(
+    result = await db.execute(
+        select(Subscription)
+        .where(
             Subscription.user_id == current_user.id,
             Subscription.status == SubscriptionStatus.ACTIVE,
         )
         .order_by(Subscription.created_at.desc())
-        .first()
     )
+    active_subscription = result.scalars().first()
 
     if active_subscription:
         return [active_subscription]
 
     # If no active subscription, get the most recent canceled one
-    latest_canceled = (
-        db.query(Subscription)
-        .filter(
+    result = await db.execute(
+        select(Subscription)
+        .where(
             Subscription.user_id == current_user.id,
             Subscription.status == SubscriptionStatus.CANCELED,
         )
         .order_by(Subscription.updated_at.desc())
-        .first()
     )
+    latest_canceled = result.scalars().first()
 
     return [latest_canceled] if latest_canceled else []
 
 
 @router.post("/subscribe", response_model=SubscriptionSchema)
-def create_user_subscription(
+async def create_user_subscription(
     subscription_in: SubscriptionRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Create a new subscription for the current user.
     """
     # Check if plan exists
-    plan = (
-        db.query(SubscriptionPlan)
-        .filter(
+    result = await db.execute(
+        select(SubscriptionPlan).where(
             SubscriptionPlan.id == subscription_in.plan_id,
             SubscriptionPlan.is_active == True,
         )
-        .first()
     )
+    plan = result.scalars().first()
 
     if not plan:
         raise HTTPException(
@@ -152,15 +159,14 @@ def create_user_subscription(
         )
 
     # Check if user already has an active subscription for this plan
-    existing_subscription = (
-        db.query(Subscription)
-        .filter(
+    result = await db.execute(
+        select(Subscription).where(
             Subscription.user_id == current_user.id,
             Subscription.plan_id == plan.id,
             Subscription.status == SubscriptionStatus.ACTIVE,
         )
-        .first()
     )
+    existing_subscription = result.scalars().first()
 
     if existing_subscription:
         raise HTTPException(
@@ -169,14 +175,13 @@ def create_user_subscription(
         )
 
     # Create or get Stripe customer
-    stripe_customer = get_stripe_customer(
-        email=current_user.email,
-        name=current_user.full_name,
-    )
+    customer_id = await get_customer_id(db, current_user)
+    # Don't hold a connection while Stripe answers
+    await db.release()
 
     # Create Stripe subscription
-    stripe_sub = create_subscription(
-        customer_id=stripe_customer.id,
+    stripe_sub = await create_subscription_async(
+        customer_id=customer_id,
         price_id=plan.stripe_price_id,
     )
 
@@ -191,28 +196,27 @@ def create_user_subscription(
     )
 
     db.add(subscription)
-    db.commit()
-    db.refresh(subscription)
+    await db.commit()
+    await db.refresh(subscription)
     return subscription
 
 
 @router.post("/cancel", response_model=SubscriptionSchema)
-def cancel_user_subscription(
+async def cancel_user_subscription(
     subscription_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Cancel a subscription.
     """
-    subscription = (
-        db.query(Subscription)
-        .filter(
+    result = await db.execute(
+        select(Subscription).where(
             Subscription.id == subscription_id,
             Subscription.user_id == current_user.id,
         )
-        .first()
     )
+    subscription = result.scalars().first()
 
     if not subscription:
         raise HTTPException(
@@ -228,51 +232,49 @@ def cancel_user_subscription(
 
     # Cancel subscription in Stripe
     if subscription.stripe_subscription_id:
-        cancel_subscription(subscription.stripe_subscription_id)
+        await db.release()
+        await cancel_subscription_async(subscription.stripe_subscription_id)
 
     # Update subscription status in database
     subscription.status = SubscriptionStatus.CANCELED
     subscription.cancel_at_period_end = True
 
     db.add(subscription)
-    db.commit()
-    db.refresh(subscription)
+    await db.commit()
+    await db.refresh(subscription)
     return subscription
 
 
-@router.get("/invoices", response_model=List[dict])
-def get_user_invoices(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+@router.get("/invoices", response_model=List[InvoiceSchema])
+async def get_user_invoices(
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+    page: PageParams = Depends(),
 ) -> Any:
     """
-    Retrieve current user's invoices.
+    Retrieve current user's invoices, newest first.
     """
-    # Get active subscription to get Stripe customer ID
-    active_subscription = (
-        db.query(Subscription)
-        .filter(
-            Subscription.user_id == current_user.id,
-            Subscription.status == SubscriptionStatus.ACTIVE,
+    # Mirrored from invoice.* webhooks, see app.core.invoices
+    result = await db.execute(
+        page.apply(
+            select(Invoice).where(Invoice.user_id == current_user.id),
+            Invoice,
+            descending=True,
         )
-        .first()
     )
-
-    if not active_subscription or not active_subscription.stripe_subscription_id:
-        return []
-
-    # Get Stripe customer
-    stripe_customer = get_stripe_customer(email=current_user.email)
-
-    # Get invoices from Stripe
-    invoices = get_customer_invoices(customer_id=stripe_customer.id)
-    return invoices.data
+    return page.page(response, result.scalars().all())
 
 
 @router.post("/webhook")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)) -> dict:
+async def stripe_webhook(
+    request: Request, db: AsyncSession = Depends(get_async_db)
+) -> dict:
     """
     Handle Stripe webhooks.
+
+    Verified events are stored and acknowledged right away, the worker in
+    app.workers.stripe_events applies them. Redeliveries are dropped.
     """
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
@@ -284,194 +286,17 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)) -> dic
             detail="No Stripe signature found",
         )
 
+    event = handle_webhook_event(payload, sig_header)
     try:
-        event = handle_webhook_event(payload, sig_header)
-        logger.info(f"Successfully verified webhook: {event.type}")
-
-        # Handle the event
-        if event.type == "customer.subscription.updated":
-            subscription_data = event.data.object
-            logger.info(f"Processing subscription update: {subscription_data['id']}")
-            db_subscription = (
-                db.query(Subscription)
-                .filter(Subscription.stripe_subscription_id == subscription_data["id"])
-                .first()
-            )
-
-            if db_subscription:
-                # Update subscription status
-                if subscription_data["status"] == "active":
-                    db_subscription.status = SubscriptionStatus.ACTIVE
-                elif subscription_data["status"] == "past_due":
-                    db_subscription.status = SubscriptionStatus.PAST_DUE
-                elif subscription_data["status"] == "unpaid":
-                    db_subscription.status = SubscriptionStatus.UNPAID
-                elif subscription_data["status"] == "canceled":
-                    db_subscription.status = SubscriptionStatus.CANCELED
-
-                # Update period dates
-                db_subscription.current_period_start = datetime.fromtimestamp(
-                    subscription_data["current_period_start"]
-                )
-                db_subscription.current_period_end = datetime.fromtimestamp(
-                    subscription_data["current_period_end"]
-                )
-                db_subscription.cancel_at_period_end = subscription_data[
-                    "cancel_at_period_end"
-                ]
-
-                db.add(db_subscription)
-                db.commit()
-                logger.info(
-                    f"Updated subscription {db_subscription.id} with status {db_subscription.status}"
-                )
-
-        elif event.type == "customer.subscription.created":
-            try:
-                subscription_data = event.data.object
-                logger.info(f"Processing new subscription: {subscription_data.id}")
-
-                # Get the customer email from the subscription data
-                customer = stripe.Customer.retrieve(subscription_data.customer)
-                logger.info(f"Retrieved customer: {customer.email}")
-
-                # Find the user by email
-                user = db.query(User).filter(User.email == customer.email).first()
-                if not user:
-                    logger.error(f"User not found for email: {customer.email}")
-                    return {"status": "error", "message": "User not found"}
-
-                # Cancel any existing active subscriptions
-                existing_active_subs = (
-                    db.query(Subscription)
-                    .filter(
-                        Subscription.user_id == user.id,
-                        Subscription.status == SubscriptionStatus.ACTIVE,
-                    )
-                    .all()
-                )
-
-                for existing_sub in existing_active_subs:
-                    if existing_sub.stripe_subscription_id:
-                        try:
-                            # Cancel in Stripe
-                            cancel_subscription(existing_sub.stripe_subscription_id)
-                        except Exception as e:
-                            logger.error(
-                                f"Error canceling Stripe subscription: {str(e)}"
-                            )
-
-                    # Update in database
-                    existing_sub.status = SubscriptionStatus.CANCELED
-                    existing_sub.cancel_at_period_end = True
-                    db.add(existing_sub)
-
-                # Get the price ID from the subscription items
-                subscription_items = subscription_data.get("items", {})
-                if not subscription_items or not subscription_items.get("data"):
-                    logger.error("No subscription items found")
-                    return {"status": "error", "message": "No subscription items found"}
-
-                price_id = subscription_items["data"][0]["price"]["id"]
-                logger.info(f"Retrieved price ID from subscription: {price_id}")
-
-                # Find the plan by Stripe Price ID
-                plan = (
-                    db.query(SubscriptionPlan)
-                    .filter(SubscriptionPlan.stripe_price_id == price_id)
-                    .first()
-                )
-                if not plan:
-                    logger.error(f"Plan not found for price_id: {price_id}")
-                    return {"status": "error", "message": "Plan not found"}
-
-                # Create new subscription in database
-                new_subscription = Subscription(
-                    user_id=user.id,
-                    plan_id=plan.id,
-                    status=(
-                        SubscriptionStatus.ACTIVE
-                        if subscription_data.status == "active"
-                        else SubscriptionStatus.UNPAID
-                    ),
-                    stripe_subscription_id=subscription_data.id,
-                    current_period_start=datetime.fromtimestamp(
-                        subscription_data.current_period_start
-                    ),
-                    current_period_end=datetime.fromtimestamp(
-                        subscription_data.current_period_end
-                    ),
-                    cancel_at_period_end=subscription_data.cancel_at_period_end,
-                )
-
-                db.add(new_subscription)
-                db.commit()
-                logger.info(f"Created new subscription in database for user {user.id}")
-                return {"status": "success"}
-
-            except Exception as e:
-                logger.error(f"Error in subscription.created webhook: {str(e)}")
-                logger.exception("Full traceback:")
-                db.rollback()
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Error processing subscription creation: {str(e)}",
-                )
-
-        elif event.type == "customer.subscription.deleted":
-            subscription_data = event.data.object
-            db_subscription = (
-                db.query(Subscription)
-                .filter(Subscription.stripe_subscription_id == subscription_data.id)
-                .first()
-            )
-
-            if db_subscription:
-                db_subscription.status = SubscriptionStatus.CANCELED
-                db_subscription.cancel_at_period_end = True
-                db.add(db_subscription)
-                db.commit()
-
-        elif event.type == "invoice.payment_succeeded":
-            invoice_data = event.data.object
-            if invoice_data.subscription:
-                db_subscription = (
-                    db.query(Subscription)
-                    .filter(
-                        Subscription.stripe_subscription_id == invoice_data.subscription
-                    )
-                    .first()
-                )
-
-                if db_subscription:
-                    db_subscription.status = SubscriptionStatus.ACTIVE
-                    db.add(db_subscription)
-                    db.commit()
-
-        elif event.type == "invoice.payment_failed":
-            invoice_data = event.data.object
-            if invoice_data.subscription:
-                db_subscription = (
-                    db.query(Subscription)
-                    .filter(
-                        Subscription.stripe_subscription_id == invoice_data.subscription
-                    )
-                    .first()
-                )
-
-                if db_subscription:
-                    db_subscription.status = SubscriptionStatus.PAST_DUE
-                    db.add(db_subscription)
-                    db.commit()
-
-        return {"status": "success"}
-
+        await enqueue_stripe_event(db, event, payload)
+        await db.commit()
     except Exception as e:
-        logger.error(f"Error processing webhook: {e}")
+        logger.error(f"Error storing webhook {event.id}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error processing webhook",
         )
+    return {"status": "success"}
 
 
 @router.post(
@@ -479,21 +304,20 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)) -> dic
 )
 async def create_subscription_checkout(
     plan_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Create a Stripe Checkout session for subscription purchase.
     """
     # Get the subscription plan
-    plan = (
-        db.query(SubscriptionPlan)
-        .filter(
+    result = await db.execute(
+        select(SubscriptionPlan).where(
             SubscriptionPlan.id == plan_id,
             SubscriptionPlan.is_active == True,
         )
-        .first()
     )
+    plan = result.scalars().first()
 
     if not plan:
         raise HTTPException(
@@ -508,15 +332,14 @@ async def create_subscription_checkout(
         )
 
     # Check if user already has an active subscription for this plan
-    existing_subscription = (
-        db.query(Subscription)
-        .filter(
+    result = await db.execute(
+        select(Subscription).where(
             Subscription.user_id == current_user.id,
             Subscription.plan_id == plan.id,
             Subscription.status == SubscriptionStatus.ACTIVE,
         )
-        .first()
     )
+    existing_subscription = result.scalars().first()
 
     if existing_subscription:
         raise HTTPException(
@@ -525,14 +348,12 @@ async def create_subscription_checkout(
         )
 
     # Create or get Stripe customer
-    stripe_customer = get_stripe_customer(
-        email=current_user.email,
-        name=current_user.full_name,
-    )
+    customer_id = await get_customer_id(db, current_user)
+    await db.release()
 
     # Create Stripe Checkout session
-    session = create_checkout_session(
-        customer_id=stripe_customer.id,
+    session = await create_checkout_session_async(
+        customer_id=customer_id,
         price_id=plan.stripe_price_id,
         success_url=f"{settings.FRONTEND_URL}/dashboard?session_id={{CHECKOUT_SESSION_ID}}",
         cancel_url=f"{settings.FRONTEND_URL}/dashboard",
@@ -1,56 +1,130 @@
-from typing import Any, List
-
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-
-from app.core.dependencies import get_current_user, get_db
+from typing import Any, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import exists, func, select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.expression import Exists, ScalarSelect
+
+from app.core.dependencies import (
+    SessionReleasingRoute,
+    get_async_db,
+    get_current_user,
+    get_read_db,
+)
+from app.core.pagination import TOTAL_COUNT_HEADER, PageParams
+from app.core.principal import Principal
+from app.db.aggregates import id_array
 from app.db.models.user import User
 from app.db.models.project import Project, project_members
+from app.db.statements import insert_ignoring_conflicts
 from app.schemas.project import (
     Project as ProjectSchema,
     ProjectCreate,
     ProjectUpdate,
     ProjectWithMembers,
     ProjectMember,
+    ProjectMemberResult,
+    ProjectMembersAction,
+    ProjectMembersBatch,
+    ProjectMembersBatchResult,
+    ProjectMemberStatus,
+    ProjectRole,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
-@router.get("/", response_model=List[ProjectSchema])
-def read_projects(
-    db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100,
-    current_user: User = Depends(get_current_user),
-) -> Any:
+def member_ids_of(project_id: Any) -> ScalarSelect:
+    """
+    Ids of a project's members as one list value, without loading User rows.
+    """
+    return (
+        select(id_array(project_members.c.user_id))
+        .where(project_members.c.project_id == project_id)
+        .scalar_subquery()
+    )
+
+
+def is_member(project_id: Any, user_id: int) -> Exists:
     """
-    Retrieve projects.
+    EXISTS check for a row in project_members.
     """
-    # Get projects where user is owner or member
-    owned_projects = db.query(Project).filter(Project.owner_id == current_user.id).all()
-
-    # Get projects where user is a member
-    member_projects = (
-        db.query(Project)
-        .join(project_members)
-        .filter(project_members.c.user_id == current_user.id)
-        .all()
+    return exists().where(
+        project_members.c.project_id == project_id,
+        project_members.c.user_id == user_id,
     )
 
-    # Combine and deduplicate
-    all_projects = list(
-        {project.id: project for project in owned_projects + member_projects}.values()
+
+async def check_member(
+    db: AsyncSession, project_id: int, user_id: int
+) -> Tuple[bool, bool]:
+    """
+    Return whether the user exists and whether they are a member of the project.
+    """
+    result = await db.execute(
+        select(exists().where(User.id == user_id), is_member(project_id, user_id))
     )
+    user_exists, member = result.one()
+    return user_exists, member
+
 
-    return all_projects[skip : skip + limit]
+def project_with_members(project: Project, member_ids: List[int]) -> ProjectWithMembers:
+    """
+    Build the response from loaded columns, project.members is never touched.
+    """
+    fields = {name: getattr(project, name) for name in ProjectSchema.model_fields}
+    return ProjectWithMembers(**fields, members=member_ids)
+
+
+@router.get("/", response_model=List[ProjectSchema])
+async def read_projects(
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    page: PageParams = Depends(),
+    role: Optional[ProjectRole] = None,
+    with_total: bool = False,
+    current_user: Principal = Depends(get_current_user),
+) -> Any:
+    """
+    Retrieve projects the user owns or is a member of.
+
+    `role` narrows the list to owned or member projects. With `with_total`
+    the number of matching projects is sent in the X-Total-Count header.
+    """
+    owned_ids = select(Project.id).where(Project.owner_id == current_user.id)
+    member_ids = select(project_members.c.project_id).where(
+        project_members.c.user_id == current_user.id
+    )
+    if role == ProjectRole.OWNER:
+        condition = Project.owner_id == current_user.id
+    elif role == ProjectRole.MEMBER:
+        condition = Project.id.in_(member_ids)
+    else:
+        # UNION dedups owned and member projects in the database
+        condition = Project.id.in_(union(owned_ids, member_ids))
+    query = select(Project).where(condition)
+
+    if not with_total:
+        result = await db.execute(page.apply(query, Project))
+        return page.page(response, result.scalars().all())
+
+    # The window count runs before the page is cut, in the same round trip
+    counted = query.add_columns(func.count().over().label("total")).subquery()
+    project = aliased(Project, counted)
+    result = await db.execute(page.apply(select(project, counted.c.total), project))
+    rows = result.all()
+    # An empty page past the end can't tell the total, so it is left out
+    if rows or (page.after is None and not page.skip):
+        response.headers[TOTAL_COUNT_HEADER] = str(rows[0].total if rows else 0)
+    return page.page(response, [row[0] for row in rows])
 
 
 @router.post("/", response_model=ProjectSchema)
-def create_project(
+async def create_project(
     project_in: ProjectCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Create new project.
@@ -60,61 +134,57 @@ def create_project(
         owner_id=current_user.id,
     )
     db.add(project)
-    db.commit()
-    db.refresh(project)
+    await db.commit()
+    await db.refresh(project)
     return project
 
 
 @router.get("/{project_id}", response_model=ProjectWithMembers)
-def read_project(
+async def read_project(
     project_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Get project by ID.
     """
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
+    # Project, member ids and the membership check in one round trip
+    result = await db.execute(
+        select(
+            Project,
+            member_ids_of(Project.id),
+            is_member(Project.id, current_user.id),
+        ).where(Project.id == project_id)
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found",
         )
+    project, member_ids, current_user_is_member = row
 
     # Check if user is owner or member
-    if project.owner_id != current_user.id and current_user.id not in [
-        member.id for member in project.members
-    ]:
+    if project.owner_id != current_user.id and not current_user_is_member:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions",
         )
 
-    # Get member IDs
-    member_ids = [member.id for member in project.members]
-
-    # Create response with members
-    project_data = {
-        k: v
-        for k, v in project.__dict__.items()
-        if not k.startswith("_") and k != "members"
-    }
-    response = ProjectWithMembers(**project_data, members=member_ids)
-
-    return response
+    return project_with_members(project, member_ids)
 
 
 @router.put("/{project_id}", response_model=ProjectSchema)
-def update_project(
+async def update_project(
     project_id: int,
     project_in: ProjectUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Update a project.
     """
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await db.get(Project, project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -133,21 +203,21 @@ def update_project(
         setattr(project, field, value)
 
     db.add(project)
-    db.commit()
-    db.refresh(project)
+    await db.commit()
+    await db.refresh(project)
     return project
 
 
 @router.delete("/{project_id}", response_model=ProjectSchema)
-def delete_project(
+async def delete_project(
     project_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Delete a project.
     """
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await db.get(Project, project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -161,22 +231,22 @@ def delete_project(
             detail="Not enough permissions",
         )
 
-    db.delete(project)
-    db.commit()
+    await db.delete(project)
+    await db.commit()
     return project
 
 
 @router.post("/{project_id}/members", response_model=ProjectWithMembers)
-def add_project_member(
+async def add_project_member(
     project_id: int,
     member_in: ProjectMember,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Add a member to the project.
     """
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await db.get(Project, project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -190,52 +260,43 @@ def add_project_member(
             detail="Not enough permissions",
         )
 
-    # Check if user exists
-    user = db.query(User).filter(User.id == member_in.user_id).first()
-    if not user:
+    user_exists, already_member = await check_member(db, project.id, member_in.user_id)
+    if not user_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found",
         )
 
     # Check if user is already a member
-    if user in project.members:
+    if already_member:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User is already a member of this project",
         )
 
     # Add user to project members
-    project.members.append(user)
-    db.add(project)
-    db.commit()
-    db.refresh(project)
-
-    # Get member IDs
-    member_ids = [member.id for member in project.members]
-
-    # Create response with members
-    project_data = {
-        k: v
-        for k, v in project.__dict__.items()
-        if not k.startswith("_") and k != "members"
-    }
-    response = ProjectWithMembers(**project_data, members=member_ids)
+    await db.execute(
+        project_members.insert().values(
+            project_id=project.id, user_id=member_in.user_id
+        )
+    )
+    await db.commit()
 
-    return response
+    member_ids = await db.scalar(select(member_ids_of(project.id)))
+    return project_with_members(project, member_ids)
 
 
 @router.delete("/{project_id}/members/{user_id}", response_model=ProjectWithMembers)
-def remove_project_member(
+async def remove_project_member(
     project_id: int,
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Remove a member from the project.
     """
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await db.get(Project, project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -249,36 +310,104 @@ def remove_project_member(
             detail="Not enough permissions",
         )
 
-    # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    user_exists, current_member = await check_member(db, project.id, user_id)
+    if not user_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found",
         )
 
     # Check if user is a member
-    if user not in project.members:
+    if not current_member:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User is not a member of this project",
         )
 
     # Remove user from project members
-    project.members.remove(user)
-    db.add(project)
-    db.commit()
-    db.refresh(project)
+    await db.execute(
+        project_members.delete().where(
+            project_members.c.project_id == project.id,
+            project_members.c.user_id == user_id,
+        )
+    )
+    await db.commit()
+
+    member_ids = await db.scalar(select(member_ids_of(project.id)))
+    return project_with_members(project, member_ids)
 
-    # Get member IDs
-    member_ids = [member.id for member in project.members]
 
-    # Create response with members
-    project_data = {
-        k: v
-        for k, v in project.__dict__.items()
-        if not k.startswith("_") and k != "members"
-    }
-    response = ProjectWithMembers(**project_data, members=member_ids)
+@router.post("/{project_id}/members/batch", response_model=ProjectMembersBatchResult)
+async def batch_project_members(
+    project_id: int,
+    batch_in: ProjectMembersBatch,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+) -> Any:
+    """
+    Add or remove many members at once, with a result for every user id.
+    """
+    project = await db.get(Project, project_id)
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found",
+        )
+
+    # Only owner can change members
+    if project.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions",
+        )
+
+    # Drop duplicates but keep the order the ids were sent in
+    user_ids = list(dict.fromkeys(batch_in.user_ids))
+
+    # Validate all ids in one query
+    result = await db.execute(select(User.id).where(User.id.in_(user_ids)))
+    found_ids = set(result.scalars())
+    existing_ids = [user_id for user_id in user_ids if user_id in found_ids]
+
+    if batch_in.action == ProjectMembersAction.ADD:
+        done_status = ProjectMemberStatus.ADDED
+        skipped_status = ProjectMemberStatus.ALREADY_MEMBER
+        statement = (
+            insert_ignoring_conflicts(db, project_members)
+            .values(
+                [
+                    {"project_id": project.id, "user_id": user_id}
+                    for user_id in existing_ids
+                ]
+            )
+            .returning(project_members.c.user_id)
+        )
+    else:
+        done_status = ProjectMemberStatus.REMOVED
+        skipped_status = ProjectMemberStatus.NOT_MEMBER
+        statement = (
+            project_members.delete()
+            .where(
+                project_members.c.project_id == project.id,
+                project_members.c.user_id.in_(existing_ids),
+            )
+            .returning(project_members.c.user_id)
+        )
 
-    return response
+    changed_ids = set()
+    if existing_ids:
+        result = await db.execute(statement)
+        changed_ids = set(result.scalars())
+        await db.commit()
+
+    results = []
+    for user_id in user_ids:
+        if user_id in changed_ids:
+            member_status = done_status
+        elif user_id in found_ids:
+            member_status = skipped_status
+        else:
+            member_status = ProjectMemberStatus.USER_NOT_FOUND
+        results.append(ProjectMemberResult(user_id=user_id, status=member_status))
+
+    return ProjectMembersBatchResult(results=results)
@@ -1,43 +1,57 @@
 from typing import Any, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-
-from app.core.dependencies import get_current_active_superuser, get_current_user, get_db
-from app.core.security import get_password_hash
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.dependencies import (
+    SessionReleasingRoute,
+    get_async_db,
+    get_read_db,
+    get_current_active_superuser,
+    get_current_user,
+    get_current_user_row,
+)
+from app.core.hashing import password_hasher
+from app.core.pagination import PageParams
+from app.core.principal import Principal, invalidate_principal
+from app.core.refresh_tokens import revoke_refresh_tokens
+from app.core.revocation import revoke_user_tokens
 from app.db.models.user import User
 from app.schemas.user import User as UserSchema
 from app.schemas.user import UserCreate, UserUpdate
 from app.db.models.subscription import Subscription, SubscriptionStatus
 from app.core.firebase_admin import delete_firebase_user
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
 @router.get("/", response_model=List[UserSchema])
-def read_users(
-    db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100,
-    current_user: User = Depends(get_current_active_superuser),
+async def read_users(
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    page: PageParams = Depends(),
+    current_user: Principal = Depends(get_current_active_superuser),
 ) -> Any:
     """
     Retrieve users. Only for superusers.
     """
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+    result = await db.execute(page.apply(select(User), User))
+    return page.page(response, result.scalars().all())
 
 
 @router.post("/", response_model=UserSchema)
-def create_user(
+async def create_user(
     user_in: UserCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_superuser),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_superuser),
 ) -> Any:
     """
     Create new user. Only for superusers.
     """
-    user = db.query(User).filter(User.email == user_in.email).first()
+    result = await db.execute(select(User).where(User.email == user_in.email))
+    user = result.scalars().first()
     if user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -46,35 +60,34 @@ def create_user(
 
     user = User(
         email=user_in.email,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await password_hasher.hash(user_in.password),
         full_name=user_in.full_name,
         is_active=user_in.is_active,
         is_superuser=user_in.is_superuser,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
 @router.delete("/me", response_model=UserSchema)
-def delete_current_user(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def delete_current_user(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_row),
 ) -> Any:
     """
     Delete current user's own account.
     Checks if user has no active subscriptions before deletion.
     """
     # Check for active subscriptions
-    active_subscription = (
-        db.query(Subscription)
-        .filter(
+    result = await db.execute(
+        select(Subscription).where(
             Subscription.user_id == current_user.id,
             Subscription.status == SubscriptionStatus.ACTIVE,
         )
-        .first()
     )
+    active_subscription = result.scalars().first()
 
     if active_subscription:
         raise HTTPException(
@@ -84,7 +97,7 @@ def delete_current_user(
 
     # Delete from Firebase first
     try:
-        delete_firebase_user(current_user.firebase_uid)
+        await run_in_threadpool(delete_firebase_user, current_user.firebase_uid)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -92,21 +105,23 @@ def delete_current_user(
         )
 
     # Then delete from database
-    db.delete(current_user)
-    db.commit()
+    await revoke_user_tokens(db, current_user.id)
+    await db.delete(current_user)
+    await db.commit()
+    invalidate_principal(current_user.firebase_uid)
     return current_user
 
 
 @router.get("/{user_id}", response_model=UserSchema)
-def read_user(
+async def read_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Get a specific user by id.
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -124,16 +139,16 @@ def read_user(
 
 
 @router.put("/{user_id}", response_model=UserSchema)
-def update_user(
+async def update_user(
     user_id: int,
     user_in: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ) -> Any:
     """
     Update a user.
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -153,37 +168,50 @@ def update_user(
     if user_in.full_name is not None:
         user.full_name = user_in.full_name
     if user_in.password is not None:
-        user.hashed_password = get_password_hash(user_in.password)
+        user.hashed_password = await password_hasher.hash(user_in.password)
 
-    # Only superusers can update these fields
+    # Only superusers can update these fields. The schema defaults them, so
+    # only the ones the request sets are applied
+    superuser_changed = False
     if current_user.is_superuser:
-        if user_in.is_active is not None:
+        if "is_active" in user_in.model_fields_set and user_in.is_active is not None:
             user.is_active = user_in.is_active
-        if user_in.is_superuser is not None:
+        if "is_superuser" in user_in.model_fields_set:
+            superuser_changed = user.is_superuser != user_in.is_superuser
             user.is_superuser = user_in.is_superuser
 
+    # A new password or deactivation ends existing sessions right away, as
+    # does a superuser change: app access tokens carry the flag
+    if user_in.password is not None or not user.is_active or superuser_changed:
+        await revoke_refresh_tokens(db, user_id=user.id)
+        await revoke_user_tokens(db, user.id)
+
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    # Email, name and superuser/active flags are all part of the principal
+    invalidate_principal(user.firebase_uid)
     return user
 
 
 @router.delete("/{user_id}", response_model=UserSchema)
-def delete_user(
+async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_superuser),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_superuser),
 ) -> Any:
     """
     Delete a user. Only for superusers.
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found",
         )
 
-    db.delete(user)
-    db.commit()
+    await revoke_user_tokens(db, user.id)
+    await db.delete(user)
+    await db.commit()
+    invalidate_principal(user.firebase_uid)
     return user
@@ -0,0 +1,64 @@
+import hashlib
+import math
+from typing import Any, Dict, Iterable
+
+
+class BloomFilter:
+    """
+    Set membership with false positives but no false negatives.
+
+    Sized for `capacity` keys at `error_rate`:
+        bits   m = -n ln p / (ln 2)^2
+        hashes k = m / n * ln 2
+    e.g. 10M keys take 11.4 MiB at 1% (k=7) or 17.1 MiB at 0.1% (k=10),
+    where a set of the same jti strings takes over 1 GiB. The k positions
+    come from one blake2b digest split into two 64-bit halves and combined
+    by double hashing. Keys can't be removed, stale ones go with a rebuild.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size_bits = max(
+            int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8
+        )
+        self.hash_count = max(int(round(self.size_bits / capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size_bits + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size_bits
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "hash_count": self.hash_count,
+            "size_bytes": len(self._bits),
+        }
@@ -35,6 +35,15 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "webapp_skeleton")
     SQLALCHEMY_DATABASE_URI: Optional[PostgresDsn] = None
 
+    # Read replica, reads stay on the primary when unset
+    POSTGRES_REPLICA_SERVER: Optional[str] = None
+    SQLALCHEMY_REPLICA_DATABASE_URI: Optional[PostgresDsn] = None
+    # Above this lag reads fall back to the primary
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_LAG_CHECK_INTERVAL: float = 2.0
+    # How long a user's reads stay on the primary after they write
+    READ_YOUR_WRITES_SECONDS: float = 10.0
+
     @model_validator(mode="after")
     def assemble_db_connection(self) -> "Settings":
         if not self.SQLALCHEMY_DATABASE_URI:
@@ -47,23 +56,149 @@ class Settings(BaseSettings):
             )
             # Print for debugging
             print(f"Database URI: {self.SQLALCHEMY_DATABASE_URI}")
+        if self.POSTGRES_REPLICA_SERVER and not self.SQLALCHEMY_REPLICA_DATABASE_URI:
+            self.SQLALCHEMY_REPLICA_DATABASE_URI = PostgresDsn.build(
+                scheme="postgresql",
+                username=self.POSTGRES_USER,
+                password=self.POSTGRES_PASSWORD,
+                host=self.POSTGRES_REPLICA_SERVER,
+                path=self.POSTGRES_DB,
+            )
         return self
 
+    # Connection pool
+    # Pools are sized from the per-worker share of DB_MAX_CONNECTIONS, so the
+    # worker count has to match what uvicorn/gunicorn is actually started with
+    WEB_CONCURRENCY: int = 1
+    # Threads in the anyio limiter serving sync handlers, per worker
+    THREADPOOL_SIZE: int = 40
+    # Connections the primary's engines may hold together across all workers,
+    # and the replica's engine on its own
+    DB_MAX_CONNECTIONS: int = 100
+    # The sync engine's part of a worker's share, only scripts and sync handlers
+    # use it and the async engine gets the rest
+    DB_SYNC_MAX_CONNECTIONS: int = 10
+    # Fixed pool size per worker, overrides the computed size within the share
+    DB_POOL_SIZE: Optional[int] = None
+    DB_POOL_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    # Recycle connections before server/LB idle timeouts can cut them
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Transaction pooling through PgBouncer: no server-side prepared statements
+    DB_PGBOUNCER: bool = False
+
+    # Event loop lag sampling (app.core.loop_monitor), in seconds. Stalls
+    # longer than the threshold are logged with the stack that caused them
+    LOOP_LAG_MONITOR_ENABLED: bool = True
+    LOOP_LAG_SAMPLE_INTERVAL: float = 0.1
+    LOOP_LAG_THRESHOLD: float = 0.1
+    LOOP_LAG_STALLS_KEPT: int = 20
+
     # JWT
     SECRET_KEY: str = os.getenv(
         "SECRET_KEY", "your-secret-key-here-change-in-production"
     )
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Refresh tokens rotate on every use, this bounds an idle session
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    # Revoked tokens are kept in a per-process Bloom filter, so requests with
+    # tokens that aren't revoked never read revoked_tokens. 1M entries at 1%
+    # take 1.1 MiB, 10M take 11.4 MiB
+    REVOCATION_BLOOM_CAPACITY: int = 1_000_000
+    REVOCATION_BLOOM_ERROR_RATE: float = 0.01
+    # How often revocations made by other workers are picked up
+    REVOCATION_SYNC_INTERVAL: float = 5.0
+    # Expired entries are pruned and the filter rebuilt this often
+    REVOCATION_REBUILD_INTERVAL: float = 3600.0
+
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    # Processes hashing passwords per worker, 0 hashes in the threadpool instead
+    PASSWORD_HASH_WORKERS: int = 2
+    # Hashes queued or running beyond this are rejected with 503
+    PASSWORD_HASH_MAX_PENDING: int = 32
+    PASSWORD_HASH_RETRY_AFTER: int = 2
+    # Authenticated users are cached per process by firebase_uid; changes made
+    # through another worker show up here after at most this many seconds
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: int = 30
+
+    # Rate limiting (app.core.ratelimit): token buckets holding a minute's
+    # allowance and refilled continuously
+    RATE_LIMIT_ENABLED: bool = True
+    # "memory" keeps buckets per worker, "redis" shares them (redis extra)
+    RATE_LIMIT_STORAGE: str = "memory"
+    RATE_LIMIT_REDIS_URL: Optional[str] = None
+    RATE_LIMIT_MEMORY_KEYS: int = 100000
+    # Requests per minute: any request by IP, each auth route by IP, logins
+    # and registrations by email, rejected bearer tokens by IP
+    RATE_LIMIT_PER_IP: int = 600
+    RATE_LIMIT_AUTH_PER_IP: int = 20
+    RATE_LIMIT_LOGIN_PER_EMAIL: int = 10
+    RATE_LIMIT_AUTH_FAILURES_PER_IP: int = 30
+    # Take the client IP from the last X-Forwarded-For hop, behind a proxy only
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool = False
+    # Bearer tokens that failed verification are rejected from memory for a while
+    REJECTED_TOKEN_CACHE_SIZE: int = 10000
+    REJECTED_TOKEN_CACHE_TTL: int = 60
 
     # Firebase
     FIREBASE_SERVICE_ACCOUNT_PATH: str = os.path.join(
         Path(__file__).resolve().parent.parent.parent, "firebase-service-account.json"
     )
+    # Defaults to the project of the service account
+    FIREBASE_PROJECT_ID: Optional[str] = None
+    # Verify ID tokens against preloaded Google keys instead of the Admin SDK
+    FIREBASE_LOCAL_VERIFICATION: bool = True
+    # Verified ID token claims are cached per process, up to the token's exp
+    FIREBASE_TOKEN_CACHE_SIZE: int = 10000
+    FIREBASE_TOKEN_CACHE_TTL: int = 3600
+    # Background linking of password users to Firebase accounts (app.workers)
+    FIREBASE_SYNC_POLL_INTERVAL: float = 5.0
+    FIREBASE_SYNC_BATCH_SIZE: int = 20
+    # Retries back off exponentially from the base delay up to the max, in seconds
+    FIREBASE_SYNC_RETRY_BASE: float = 30.0
+    FIREBASE_SYNC_RETRY_MAX: float = 3600.0
 
     # Stripe
     STRIPE_API_KEY: Optional[str] = os.getenv("STRIPE_API_KEY")
     STRIPE_WEBHOOK_SECRET: Optional[str] = os.getenv("STRIPE_WEBHOOK_SECRET")
+    # Keep-alive connections to Stripe shared by the threadpool, per worker.
+    # Below THREADPOOL_SIZE, connections of threads past it are discarded
+    STRIPE_POOL_SIZE: int = 40
+    # Connections the async client keeps open, more concurrent calls wait for one
+    STRIPE_ASYNC_MAX_CONNECTIONS: int = 100
+    # Seconds per request sent. Writes wait up to STRIPE_TIMEOUT for a
+    # response, reads up to STRIPE_READ_TIMEOUT
+    STRIPE_CONNECT_TIMEOUT: float = 3.0
+    STRIPE_TIMEOUT: float = 20.0
+    STRIPE_READ_TIMEOUT: float = 5.0
+    # Retries of connection errors, 409s and 5xx, with jittered backoff
+    STRIPE_MAX_NETWORK_RETRIES: int = 2
+    # Consecutive failures that open the circuit, and seconds until it's tried
+    STRIPE_BREAKER_THRESHOLD: int = 5
+    STRIPE_BREAKER_RESET_TIMEOUT: float = 30.0
+    # Calls per wrapper the latency percentiles are taken over
+    STRIPE_LATENCY_SAMPLES: int = 1000
+    # Webhook events are stored by the endpoint and applied by app.workers.stripe_events
+    STRIPE_EVENT_WORKERS: int = 4
+    STRIPE_EVENT_BATCH_SIZE: int = 20
+    STRIPE_EVENT_POLL_INTERVAL: float = 1.0
+    # A subscription's events wait this long so a burst (renewal, plan change)
+    # is applied as one update with the newest state, in seconds
+    STRIPE_EVENT_COALESCE_WINDOW: float = 2.0
+    # Seconds a worker holds the batches it claimed before others may take
+    # them. Keep it well over a batch's worst case, two Stripe calls of up to
+    # STRIPE_TIMEOUT * (STRIPE_MAX_NETWORK_RETRIES + 1), 2 minutes by default
+    STRIPE_EVENT_LEASE: float = 300.0
+    # Failed events are retried with exponential backoff, then given up on
+    STRIPE_EVENT_RETRY_BASE: float = 10.0
+    STRIPE_EVENT_RETRY_MAX: float = 3600.0
+    STRIPE_EVENT_MAX_ATTEMPTS: int = 10
+    # Processed events are kept to drop Stripe's redeliveries, for up to 3 days
+    STRIPE_EVENT_RETENTION_DAYS: int = 7
 
     model_config = SettingsConfigDict(
         case_sensitive=True,
@@ -1,6 +1,10 @@
-from typing import Generator, Optional
+import asyncio
+import functools
+from typing import Any, AsyncGenerator, Callable, Generator, Optional, Tuple
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
 from fastapi.security import (
     OAuth2PasswordBearer,
     HTTPBearer,
@@ -8,14 +12,25 @@ from fastapi.security import (
 )
 from jose import jwt
 from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.core.security import verify_token
-from app.db.session import SessionLocal
+from app.core.principal import Principal, principal_cache
+from app.core.ratelimit import client_ip, record_auth_failure, rejected_tokens
+from app.core.revocation import revocation_list
+from app.core.security import ACCESS_TOKEN_TYPE, is_app_token, verify_token
+from app.db.lazy import LazySession, request_sessions
+from app.db.routing import current_user_id
+from app.db.session import AsyncSessionLocal, ReadSessionLocal, SessionLocal
 from app.db.models.user import User
 from app.schemas.token import TokenPayload
-from app.core.firebase_admin import verify_firebase_token
+from app.core.firebase_admin import (
+    get_cached_firebase_token,
+    token_cache_key,
+    verify_firebase_token_uncached,
+)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
@@ -33,26 +48,119 @@ def get_db() -> Generator:
         db.close()
 
 
-def get_current_user(
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency for getting an async DB session, created on first use.
+    """
+    db = LazySession(AsyncSessionLocal)
+    try:
+        yield db
+    finally:
+        await db.release()
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency for read-only handlers, served by the replica when it is safe.
+    """
+    db = LazySession(ReadSessionLocal)
+    try:
+        yield db
+    finally:
+        await db.release()
+
+
+def release_sessions_after(endpoint: Callable) -> Callable:
+    """
+    Wrap an async endpoint so the request's sessions are released when it returns.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            for db in request_sessions.get() or ():
+                await db.release()
+
+    return wrapper
+
+
+class SessionReleasingRoute(APIRoute):
+    """
+    Route class that gives connections back as soon as the endpoint returns.
+
+    Without it sessions are closed in dependency teardown, which only runs
+    after the response has been serialized and sent. Responses are built from
+    attributes already loaded, so nothing may lazy-load after the handler.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any):
+        if asyncio.iscoroutinefunction(endpoint):
+            endpoint = release_sessions_after(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        route_handler = super().get_route_handler()
+
+        async def session_tracking_handler(request: Request) -> Response:
+            token = request_sessions.set([])
+            try:
+                return await route_handler(request)
+            finally:
+                request_sessions.reset(token)
+
+        return session_tracking_handler
+
+
+async def get_current_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-) -> User:
+    db: AsyncSession = Depends(get_async_db),
+) -> Principal:
     """
-    Dependency to get the current user from Firebase token and database
+    Dependency to get the current user from an app-issued or Firebase token.
+
+    App tokens are checked with HMAC and carry the user's claims, so they need
+    no database read. Firebase tokens are resolved to a user by firebase_uid.
+    Either kind is rejected once revoked, see app.core.revocation.
     """
+    token = credentials.credentials
+    token_key = token_cache_key(token)
+    # The same bad token again is turned away before any verification
+    rejection = rejected_tokens.get(token_key)
+    if rejection is not None:
+        await record_auth_failure(client_ip(request.scope))
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=rejection,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     try:
-        token = credentials.credentials
-        user_info = verify_firebase_token(token)
+        if token.count(".") != 2:
+            raise ValueError("Malformed token")
+        if is_app_token(token):
+            payload = verify_token(token)
+            if payload is None or payload.type != ACCESS_TOKEN_TYPE:
+                raise ValueError("Invalid or expired token")
+            principal = Principal.from_token(payload)
+            jti, issued_at = payload.jti, payload.iat
+        else:
+            principal, issued_at = await get_firebase_principal(token, db)
+            jti = None
 
-        # Get user from database using Firebase UID
-        user = db.query(User).filter(User.firebase_uid == user_info["uid"]).first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found in database",
-            )
-        return user
+        # Only reads revoked_tokens when the Bloom filter matches
+        if await revocation_list.is_revoked(db, principal.id, jti, issued_at):
+            raise ValueError("Token has been revoked")
+
+        # Lets replica routing keep this user's reads on the primary after writes
+        current_user_id.set(principal.id)
+        return principal
     except ValueError as e:
+        # Invalid, expired or revoked: the same token will fail again. Other
+        # errors may be transient and aren't remembered
+        rejected_tokens.set(token_key, str(e))
+        await record_auth_failure(client_ip(request.scope))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=str(e),
@@ -66,9 +174,59 @@ def get_current_user(
         )
 
 
-def get_current_active_superuser(
-    current_user: User = Depends(get_current_user),
+async def get_firebase_principal(
+    token: str, db: AsyncSession
+) -> Tuple[Principal, Optional[float]]:
+    """
+    Resolve a Firebase ID token to its user, and return the token's iat.
+    """
+    # Tokens seen before are answered from the cache on the event loop.
+    # Verification may fetch Google certs, so misses go to the threadpool.
+    # The lazy session is untouched until here, so bad tokens cost no checkout
+    user_info = get_cached_firebase_token(token)
+    if user_info is None:
+        user_info = await run_in_threadpool(verify_firebase_token_uncached, token)
+
+    principal = principal_cache.get(user_info["uid"])
+    if principal is None:
+        # Get user from database using Firebase UID
+        result = await db.execute(
+            select(User).where(User.firebase_uid == user_info["uid"])
+        )
+        user = result.scalars().first()
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found in database",
+            )
+        # End the lookup transaction so the connection isn't held while
+        # the handler does non-DB work
+        await db.commit()
+        principal = Principal.from_user(user)
+        principal_cache.set(user_info["uid"], principal)
+    return principal, user_info.get("iat")
+
+
+async def get_current_user_row(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ) -> User:
+    """
+    Dependency for handlers that need the current user's ORM row, e.g. to
+    delete it, loaded in the request's session.
+    """
+    user = await db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found in database",
+        )
+    return user
+
+
+async def get_current_active_superuser(
+    current_user: Principal = Depends(get_current_user),
+) -> Principal:
     """
     Dependency for getting the current authenticated superuser.
     """
@@ -1,27 +1,217 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+
 import firebase_admin
+import httpx
+from fastapi.concurrency import run_in_threadpool
 from firebase_admin import credentials, auth
+from jose import jwk, jwt
+from jose.backends.base import Key
+from app.core.cache import TTLCache
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Certificates Firebase ID tokens are signed with, rotated by Google
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+
+# Verified claims by token hash; clients resend the same ID token for an hour
+token_cache = TTLCache(
+    maxsize=settings.FIREBASE_TOKEN_CACHE_SIZE,
+    ttl=settings.FIREBASE_TOKEN_CACHE_TTL,
+)
+
+
+class KeySource:
+    """Where a FirebaseTokenVerifier gets its signing keys from"""
+
+    def fetch(self) -> Tuple[Dict[str, str], float]:
+        """Return PEM keys or certificates by key id, and how many seconds they are valid"""
+        raise NotImplementedError
+
+
+class GoogleCertsKeySource(KeySource):
+    """Google's published certificates, valid for the max-age they are served with"""
+
+    def __init__(self, url: str = GOOGLE_CERTS_URL, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self) -> Tuple[Dict[str, str], float]:
+        response = httpx.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        match = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+        return response.json(), float(match.group(1)) if match else 3600.0
+
+
+class StaticKeySource(KeySource):
+    """A fixed key set, e.g. locally generated RSA keys in tests and benchmarks"""
+
+    def __init__(self, keys: Dict[str, str], max_age: float = 86400.0):
+        self.keys = keys
+        self.max_age = max_age
+
+    def fetch(self) -> Tuple[Dict[str, str], float]:
+        return dict(self.keys), self.max_age
+
+
+class FirebaseTokenVerifier:
+    """
+    Verifies Firebase ID tokens against an in-memory key set, CPU only.
+
+    Keys are parsed once per refresh and refreshed in the background
+    `refresh_margin` seconds before they expire, so no request waits on
+    fetching certificates.
+    """
+
+    def __init__(
+        self,
+        project_id: str,
+        key_source: KeySource,
+        refresh_margin: float = 300.0,
+        retry_interval: float = 30.0,
+    ):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.key_source = key_source
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.expires_at = 0.0
+        self.refresh_failures = 0
+        self._keys: Dict[str, Key] = {}
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._keys) and time.time() < self.expires_at
+
+    def refresh(self) -> None:
+        """Fetch and parse the key set, blocking"""
+        keys, max_age = self.key_source.fetch()
+        # Swap the whole dict so concurrent verifications never see a partial set
+        self._keys = {kid: jwk.construct(pem, "RS256") for kid, pem in keys.items()}
+        self.expires_at = time.time() + max_age
+
+    async def load(self) -> None:
+        """Refresh the key set from the event loop, logging instead of raising"""
+        try:
+            await run_in_threadpool(self.refresh)
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.warning(f"Could not refresh Firebase signing keys: {str(e)}")
+
+    async def keep_fresh(self) -> None:
+        """Refresh the key set shortly before it expires, forever"""
+        while True:
+            if self.ready:
+                delay = self.expires_at - time.time() - self.refresh_margin
+            else:
+                delay = self.retry_interval
+            await asyncio.sleep(min(max(delay, self.retry_interval), 86400.0))
+            await self.load()
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Verify signature and claims the way the Admin SDK does, without I/O"""
+        try:
+            header = jwt.get_unverified_header(token)
+            key = self._keys.get(header.get("kid"))
+            if header.get("alg") != "RS256" or key is None:
+                raise ValueError("Token is not signed with a known Firebase key")
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                options={"verify_at_hash": False},
+            )
+        except jwt.JWTError as e:
+            raise ValueError(str(e))
+        subject = claims.get("sub")
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise ValueError("Token has an invalid subject")
+        if claims.get("auth_time", 0) > time.time():
+            raise ValueError("Token has an auth_time in the future")
+        claims["uid"] = subject
+        return claims
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "keys": len(self._keys),
+            "expires_in": max(self.expires_at - time.time(), 0.0),
+            "refresh_failures": self.refresh_failures,
+        }
+
+
+# Local verifier used in place of auth.verify_id_token once its keys are loaded
+token_verifier: Optional[FirebaseTokenVerifier] = None
+
+
+def configure_token_verifier(verifier: Optional[FirebaseTokenVerifier]) -> None:
+    """Install the verifier used for ID tokens, None goes back to the SDK"""
+    global token_verifier
+    token_verifier = verifier
+
 
 def initialize_firebase_admin():
     """Initialize Firebase Admin SDK"""
     if not firebase_admin._apps:
         cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT_PATH)
         firebase_admin.initialize_app(cred)
+    if settings.FIREBASE_LOCAL_VERIFICATION and token_verifier is None:
+        project_id = settings.FIREBASE_PROJECT_ID or firebase_admin.get_app().project_id
+        configure_token_verifier(
+            FirebaseTokenVerifier(project_id, GoogleCertsKeySource())
+        )
+
+
+def token_cache_key(token: str) -> bytes:
+    """Cache key for a token, so raw tokens are never kept in memory"""
+    return hashlib.sha256(token.encode()).digest()
+
+
+def get_cached_firebase_token(token: str) -> Optional[dict]:
+    """Return user info of an already verified, unexpired token, without I/O"""
+    return token_cache.get(token_cache_key(token))
 
 
 def verify_firebase_token(token: str) -> dict:
     """Verify Firebase ID token and return user info"""
+    user_info = get_cached_firebase_token(token)
+    if user_info is None:
+        user_info = verify_firebase_token_uncached(token)
+    return user_info
+
+
+def verify_firebase_token_uncached(token: str) -> dict:
+    """Verify Firebase ID token and cache the user info"""
     try:
-        decoded_token = auth.verify_id_token(token)
-        return {
-            "uid": decoded_token["uid"],
-            "email": decoded_token.get("email"),
-            "name": decoded_token.get("name"),
-            "picture": decoded_token.get("picture"),
-        }
-    except Exception as e:
+        if token_verifier is not None and token_verifier.ready:
+            decoded_token = token_verifier.verify(token)
+        else:
+            decoded_token = auth.verify_id_token(token)
+    except (ValueError, auth.InvalidIdTokenError, auth.UserDisabledError) as e:
+        # Only a bad token becomes ValueError, which callers remember as
+        # rejected. Key fetch and other transient errors propagate as they are
         raise ValueError(f"Invalid token: {str(e)}")
+    user_info = {
+        "uid": decoded_token["uid"],
+        "email": decoded_token.get("email"),
+        "name": decoded_token.get("name"),
+        "picture": decoded_token.get("picture"),
+        # Checked against revocations made after the token was issued
+        "iat": decoded_token.get("iat"),
+    }
+    # Never serve the claims past the token's own expiry
+    token_cache.set(token_cache_key(token), user_info, expires_at=decoded_token["exp"])
+    return user_info
 
 
 def create_firebase_user(email: str, password: str):
@@ -37,6 +227,32 @@ def create_firebase_user(email: str, password: str):
         raise ValueError(f"Error creating Firebase user: {str(e)}")
 
 
+def import_firebase_user(
+    uid: str,
+    email: str,
+    password_hash: Optional[str] = None,
+    display_name: Optional[str] = None,
+) -> str:
+    """Create a Firebase user from a stored bcrypt hash, importing an existing uid overwrites it"""
+    try:
+        record = auth.ImportUserRecord(
+            uid=uid,
+            email=email,
+            email_verified=False,
+            display_name=display_name,
+            password_hash=password_hash.encode() if password_hash else None,
+        )
+        result = auth.import_users(
+            [record],
+            hash_alg=auth.UserImportHash.bcrypt() if password_hash else None,
+        )
+    except Exception as e:
+        raise ValueError(f"Error importing Firebase user: {str(e)}")
+    if result.failure_count:
+        raise ValueError(f"Error importing Firebase user: {result.errors[0].reason}")
+    return uid
+
+
 def get_firebase_user_by_email(email: str):
     """Get Firebase user by email"""
     try:
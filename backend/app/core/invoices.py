@@ -0,0 +1,98 @@
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import case, delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.expression import Insert
+
+from app.db.models.invoice import Invoice
+from app.db.models.user import User
+from app.db.statements import upsert
+
+logger = logging.getLogger(__name__)
+
+# Stripe sends several invoice events within the same second, in any order.
+# Between rows of equal last_event_at, the one further along wins
+STATUS_ORDER = {"draft": 0, "open": 1, "paid": 2, "uncollectible": 2, "void": 2}
+
+
+def from_timestamp(value: Optional[int]) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, tz=timezone.utc) if value else None
+
+
+def invoice_values(
+    invoice: Dict[str, Any], user_id: int, event_at: datetime
+) -> Dict[str, Any]:
+    """
+    The invoices row for a Stripe invoice object, as of event_at.
+    """
+    return {
+        "stripe_invoice_id": invoice["id"],
+        "user_id": user_id,
+        "stripe_subscription_id": invoice.get("subscription"),
+        "number": invoice.get("number"),
+        "status": invoice.get("status"),
+        "currency": invoice["currency"],
+        "amount_due": invoice["amount_due"],
+        "amount_paid": invoice["amount_paid"],
+        "hosted_invoice_url": invoice.get("hosted_invoice_url"),
+        "invoice_pdf": invoice.get("invoice_pdf"),
+        "period_start": from_timestamp(invoice.get("period_start")),
+        "period_end": from_timestamp(invoice.get("period_end")),
+        "created_at": from_timestamp(invoice["created"]),
+        "last_event_at": event_at,
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+def upsert_invoice(db: Any, values: Dict[str, Any]) -> Insert:
+    """
+    Insert or update an invoices row unless it already holds newer data.
+    Works with sync and async sessions.
+    """
+    current = Invoice.__table__.c
+
+    def status_rank(status: Any) -> Any:
+        return case(STATUS_ORDER, value=status, else_=0)
+
+    return upsert(
+        db,
+        Invoice.__table__,
+        ["stripe_invoice_id"],
+        values,
+        where=lambda excluded: or_(
+            excluded.last_event_at > current.last_event_at,
+            (excluded.last_event_at == current.last_event_at)
+            & (status_rank(excluded.status) >= status_rank(current.status)),
+        ),
+    )
+
+
+async def record_invoice(
+    db: AsyncSession, invoice: Dict[str, Any], event_at: datetime
+) -> bool:
+    """
+    Mirror a Stripe invoice from a webhook event created at event_at. False
+    if its customer isn't linked to a user. The caller commits.
+    """
+    result = await db.execute(
+        select(User.id).where(User.stripe_customer_id == invoice["customer"])
+    )
+    user_id = result.scalar()
+    if user_id is None:
+        logger.warning(
+            f"No user for customer {invoice['customer']} of invoice {invoice['id']}"
+        )
+        return False
+    await db.execute(upsert_invoice(db, invoice_values(invoice, user_id, event_at)))
+    return True
+
+
+async def delete_invoice(db: AsyncSession, stripe_invoice_id: str) -> None:
+    """
+    Drop a deleted draft invoice. The caller commits.
+    """
+    await db.execute(
+        delete(Invoice).where(Invoice.stripe_invoice_id == stripe_invoice_id)
+    )
@@ -0,0 +1,157 @@
+import asyncio
+import gc
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop runs callbacks and catches what blocks it.
+
+    A task sleeps for `interval` and records how much later than asked it
+    woke up, the scheduling delay every other request saw at that moment.
+    A watchdog thread watches the task's heartbeat: once the loop has not
+    come back for `threshold` seconds, it snapshots the loop thread's stack
+    with sys._current_frames() and the task the loop was running. That is
+    taken while the loop is still stuck, so it points at the blocking call
+    itself rather than whatever ran after it. The last `keep` stalls are kept.
+
+    Garbage collections are timed too: a stall taken during one shows
+    wherever the collection was triggered, not what caused it, and is
+    marked as such.
+    """
+
+    def __init__(self, interval: float, threshold: float, keep: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = 0
+        self.slow_samples = 0
+        self.max_lag = 0.0
+        self.last_lag: Optional[float] = None
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self._beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        self._gc_started: Optional[float] = None
+        self.gc_pauses = 0
+        self.max_gc_pause = 0.0
+
+    def record(self, lag: float) -> None:
+        self.samples += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        if lag >= self.threshold:
+            self.slow_samples += 1
+
+    async def sample(self) -> None:
+        """
+        Measure scheduling delay every interval, forever.
+        """
+        while True:
+            self._beat = started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            self.record(max(self._beat - started - self.interval, 0.0))
+
+    def on_gc(self, phase: str, info: Dict[str, Any]) -> None:
+        if phase == "start":
+            self._gc_started = time.monotonic()
+        elif self._gc_started is not None:
+            pause = time.monotonic() - self._gc_started
+            self._gc_started = None
+            self.gc_pauses += 1
+            self.max_gc_pause = max(self.max_gc_pause, pause)
+
+    def capture(self, blocked_for: float) -> Dict[str, Any]:
+        """
+        The stack and task of the loop thread right now, called off the loop.
+        """
+        frame = sys._current_frames().get(self._loop_thread)
+        stack: List[str] = traceback.format_stack(frame) if frame is not None else []
+        try:
+            # Only reads the loop's current task, safe from another thread
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        return {
+            "at": time.time(),
+            "blocked_for": round(blocked_for, 4),
+            "in_gc": self._gc_started is not None,
+            "task": task.get_name() if task is not None else None,
+            "coroutine": (
+                getattr(task.get_coro(), "__qualname__", None)
+                if task is not None
+                else None
+            ),
+            "stack": [line.rstrip() for line in stack],
+        }
+
+    def watch(self) -> None:
+        # One capture per stall: the beat it was taken for
+        captured_beat = None
+        check_every = min(self.threshold, self.interval) / 2
+        while not self._stop.wait(check_every):
+            beat = self._beat
+            blocked_for = time.monotonic() - beat - self.interval
+            if blocked_for < self.threshold or beat == captured_beat:
+                continue
+            captured_beat = beat
+            stall = self.capture(blocked_for)
+            self.stalls.append(stall)
+            where = stall["coroutine"] or "a callback"
+            if stall["in_gc"]:
+                where = f"garbage collection, triggered in {where}"
+            logger.warning(
+                f"Event loop blocked for over {blocked_for * 1000:.0f} ms in "
+                f"{where}:\n" + "\n".join(stall["stack"])
+            )
+
+    async def run(self) -> None:
+        """
+        Sample from the running loop with the watchdog alongside until cancelled.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._watchdog = threading.Thread(
+            target=self.watch, name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+        gc.callbacks.append(self.on_gc)
+        try:
+            await self.sample()
+        finally:
+            gc.callbacks.remove(self.on_gc)
+            self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "samples": self.samples,
+            "slow_samples": self.slow_samples,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "gc_pauses": self.gc_pauses,
+            "max_gc_pause": self.max_gc_pause,
+            "stalls": list(self.stalls),
+        }
+
+
+loop_monitor = LoopLagMonitor(
+    interval=settings.LOOP_LAG_SAMPLE_INTERVAL,
+    threshold=settings.LOOP_LAG_THRESHOLD,
+    keep=settings.LOOP_LAG_STALLS_KEPT,
+)
@@ -0,0 +1,79 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Select, tuple_
+
+# Response header carrying the cursor of the next page, absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Response header with the number of matching rows, for endpoints that count
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """
+    Encode the sort key of the last row of a page as an opaque cursor.
+    """
+    raw = json.dumps([created_at.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor produced by encode_cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+class PageParams:
+    """
+    Dependency for list endpoints, sorted by (created_at, id), ascending
+    unless the endpoint applies it descending.
+
+    Pass the X-Next-Cursor header of a response back as `cursor` to get the
+    next page. `skip` is still honoured when no cursor is given, but it makes
+    the database walk past every skipped row.
+    """
+
+    def __init__(self, cursor: Optional[str] = None, skip: int = 0, limit: int = 100):
+        self.after = decode_cursor(cursor) if cursor else None
+        self.skip = 0 if self.after is not None else skip
+        self.limit = limit
+
+    def apply(self, query: Select, model: Any, descending: bool = False) -> Select:
+        """
+        Order and limit a query in SQL, one extra row tells if there is a next page.
+        """
+        key = tuple_(model.created_at, model.id)
+        if descending:
+            query = query.order_by(model.created_at.desc(), model.id.desc())
+            if self.after is not None:
+                query = query.where(key < self.after)
+        else:
+            query = query.order_by(model.created_at, model.id)
+            if self.after is not None:
+                query = query.where(key > self.after)
+        return query.offset(self.skip).limit(self.limit + 1)
+
+    def page(self, response: Response, rows: Sequence[Any]) -> List[Any]:
+        """
+        Cut the rows to the page and set the next cursor header if more remain.
+        """
+        items = list(rows[: self.limit])
+        if len(rows) > self.limit and items:
+            last = items[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+                last.created_at, last.id
+            )
+        return items
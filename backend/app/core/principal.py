@@ -0,0 +1,85 @@
+from datetime import datetime
+from typing import Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.models.user import User
+from app.schemas.token import TokenPayload
+
+
+class Principal:
+    """
+    The authenticated user as seen by handlers: plain attributes copied from
+    the users row, safe to share between requests and to use after the
+    session that loaded it is gone.
+    """
+
+    __slots__ = (
+        "id",
+        "firebase_uid",
+        "email",
+        "full_name",
+        "is_active",
+        "is_superuser",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        firebase_uid: Optional[str],
+        email: str,
+        full_name: Optional[str],
+        is_active: bool,
+        is_superuser: bool,
+        created_at: Optional[datetime],
+        updated_at: Optional[datetime],
+    ):
+        self.id = id
+        self.firebase_uid = firebase_uid
+        self.email = email
+        self.full_name = full_name
+        self.is_active = is_active
+        self.is_superuser = is_superuser
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(*(getattr(user, name) for name in cls.__slots__))
+
+    @classmethod
+    def from_token(cls, payload: TokenPayload) -> "Principal":
+        """
+        Build a principal from the claims of an app-issued access token.
+
+        Tokens are only issued to active users and carry no firebase_uid or
+        timestamps, those stay None.
+        """
+        return cls(
+            id=int(payload.sub),
+            firebase_uid=None,
+            email=payload.email,
+            full_name=payload.name,
+            is_active=True,
+            is_superuser=payload.su,
+            created_at=None,
+            updated_at=None,
+        )
+
+
+# Principals by firebase_uid. Invalidation only reaches this process, so the
+# TTL bounds how long other workers may serve a changed user
+principal_cache = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+)
+
+
+def invalidate_principal(firebase_uid: Optional[str]) -> None:
+    """
+    Drop a user's cached principal after their row changed.
+    """
+    if firebase_uid is not None:
+        principal_cache.pop(firebase_uid)
@@ -0,0 +1,292 @@
+import json
+import math
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+# Login bodies are tiny, anything larger isn't parsed for an email
+MAX_PARSED_BODY = 16 * 1024
+
+
+class Limit(NamedTuple):
+    """
+    A token bucket holding up to `burst` requests, refilled at `rate` per second.
+    """
+
+    rate: float
+    burst: float
+
+    @classmethod
+    def per_minute(cls, count: int) -> "Limit":
+        return cls(rate=count / 60.0, burst=float(count))
+
+
+class RateLimitStore:
+    """
+    Where buckets live. take() spends `cost` tokens if the bucket has them and
+    returns 0, or returns the seconds until it would. A cost of 0 only checks
+    that at least one token is left.
+    """
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+def refill(
+    tokens: float, updated: float, now: float, limit: Limit, cost: float
+) -> Tuple[float, float]:
+    """
+    Shared bucket arithmetic: the new token count and the wait, 0 if allowed.
+    """
+    tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+    needed = max(cost, 1.0)
+    if tokens < needed:
+        return tokens, (needed - tokens) / limit.rate
+    return tokens - cost, 0.0
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """
+    Buckets in this worker only, so each limit applies per worker. Only used
+    from the event loop, so no locking. The least recently used buckets are
+    dropped past maxsize, which refills them.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (limit.burst, now))
+        tokens, wait = refill(tokens, updated, now, limit, cost)
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "buckets": len(self._buckets)}
+
+
+# Same arithmetic as refill(), run atomically next to the data.
+# KEYS[1] bucket; ARGV rate, burst, cost, now. Returns the wait as a string.
+TOKEN_BUCKET_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cost, now = tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+local needed = math.max(cost, 1)
+local wait = 0
+if tokens < needed then
+    wait = (needed - tokens) / rate
+else
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """
+    Buckets shared by all workers in Redis, updated by one Lua script call.
+
+    Takes any client with redis-py's asyncio eval(script, numkeys, *args), so
+    a local stand-in can replace the server.
+    """
+
+    def __init__(self, client: Any, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisRateLimitStore":
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError(
+                "RATE_LIMIT_STORAGE=redis needs the redis package, "
+                "install the backend with the redis extra"
+            )
+        return cls(redis.from_url(url))
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        wait = await self.client.eval(
+            TOKEN_BUCKET_SCRIPT,
+            1,
+            self.prefix + key,
+            limit.rate,
+            limit.burst,
+            cost,
+            time.time(),
+        )
+        return float(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis"}
+
+
+def get_rate_limit_store() -> RateLimitStore:
+    if settings.RATE_LIMIT_STORAGE == "redis":
+        if not settings.RATE_LIMIT_REDIS_URL:
+            raise RuntimeError("RATE_LIMIT_STORAGE=redis needs RATE_LIMIT_REDIS_URL")
+        return RedisRateLimitStore.from_url(settings.RATE_LIMIT_REDIS_URL)
+    return MemoryRateLimitStore(maxsize=settings.RATE_LIMIT_MEMORY_KEYS)
+
+
+rate_limit_store = get_rate_limit_store()
+
+# Bearer tokens that failed verification recently, by token_cache_key digest.
+# Per worker and short-lived: it only saves re-verifying the same bad token
+rejected_tokens = TTLCache(
+    maxsize=settings.REJECTED_TOKEN_CACHE_SIZE,
+    ttl=settings.REJECTED_TOKEN_CACHE_TTL,
+)
+
+AUTH_FAILURES = Limit.per_minute(settings.RATE_LIMIT_AUTH_FAILURES_PER_IP)
+
+# Requests answered with 429, by the bucket that ran out
+rate_limited: Counter = Counter()
+
+
+def client_ip(scope: Scope) -> str:
+    if settings.RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded:
+            # The last hop is the one our proxy added
+            return forwarded.split(",")[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def record_auth_failure(ip: str) -> None:
+    """
+    Charge a rejected bearer token to the client's failure bucket.
+    """
+    await rate_limit_store.take(f"authfail:{ip}", AUTH_FAILURES)
+
+
+def login_email(content_type: str, body: bytes) -> Optional[str]:
+    """
+    The email a login or registration body is for, if it can be read.
+    """
+    try:
+        if content_type.startswith("application/json"):
+            email = json.loads(body).get("email")
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            email = parse_qs(body.decode()).get("username", [None])[0]
+        else:
+            return None
+    except (ValueError, AttributeError):
+        return None
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+class RateLimitMiddleware:
+    """
+    Token-bucket rate limiting in front of routing, answering 429 with
+    Retry-After. Checked in order, cheapest first:
+
+    - every request, per client IP;
+    - requests with a bearer token from an IP whose recent tokens kept
+      failing verification, before any of them is verified again;
+    - each auth route, per client IP;
+    - login and registration, per email in the body, however many IPs the
+      attempts come from.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        prefix = f"{settings.API_V1_STR}/auth"
+        self.auth_paths = {
+            f"{prefix}/login",
+            f"{prefix}/login/email",
+            f"{prefix}/register",
+            f"{prefix}/google",
+            f"{prefix}/refresh",
+        }
+        self.email_paths = {
+            f"{prefix}/login",
+            f"{prefix}/login/email",
+            f"{prefix}/register",
+        }
+        self.per_ip = Limit.per_minute(settings.RATE_LIMIT_PER_IP)
+        self.auth_per_ip = Limit.per_minute(settings.RATE_LIMIT_AUTH_PER_IP)
+        self.per_email = Limit.per_minute(settings.RATE_LIMIT_LOGIN_PER_EMAIL)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        store = rate_limit_store
+        ip = client_ip(scope)
+        path = scope["path"]
+        headers = Headers(scope=scope)
+
+        bucket = "ip"
+        wait = await store.take(f"ip:{ip}", self.per_ip)
+        if not wait and headers.get("authorization"):
+            bucket = "authfail"
+            wait = await store.take(f"authfail:{ip}", AUTH_FAILURES, cost=0)
+        if not wait and path in self.auth_paths:
+            bucket = "route"
+            wait = await store.take(f"route:{path}:{ip}", self.auth_per_ip)
+        if not wait and path in self.email_paths and scope["method"] == "POST":
+            body, receive = await self.buffer_body(receive)
+            email = login_email(headers.get("content-type", ""), body)
+            if email:
+                bucket = "email"
+                wait = await store.take(f"email:{email}", self.per_email)
+
+        if wait:
+            rate_limited[bucket] += 1
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+    async def buffer_body(self, receive: Receive) -> Tuple[bytes, Receive]:
+        """
+        Read the request body and return it with a receive that replays it.
+        """
+        messages: List[Message] = []
+        size = 0
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            size += len(message.get("body", b""))
+            if not message.get("more_body") or size > MAX_PARSED_BODY:
+                break
+        body = b"".join(m.get("body", b"") for m in messages)
+        if size > MAX_PARSED_BODY:
+            body = b""
+
+        async def replay() -> Message:
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return body, replay
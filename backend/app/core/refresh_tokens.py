@@ -0,0 +1,144 @@
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models.refresh_token import RefreshToken
+from app.db.models.user import User
+
+
+def hash_refresh_token(token: str) -> str:
+    """
+    HMAC of a refresh token, what the table stores and is looked up by.
+
+    Tokens are 256 random bits, so a keyed hash is enough; a leaked table
+    can't be used to mint or recognise tokens without SECRET_KEY.
+    """
+    return hmac.new(
+        settings.SECRET_KEY.encode(), token.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def invalid_refresh_token(detail: str = "Invalid refresh token") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def issue_refresh_token(
+    db: AsyncSession, user_id: int, family_id: Optional[str] = None
+) -> str:
+    """
+    Add a new refresh token for the user, starting a family unless one is given.
+
+    The caller commits.
+    """
+    token = secrets.token_urlsafe(32)
+    db.add(
+        RefreshToken(
+            user_id=user_id,
+            family_id=family_id or secrets.token_hex(16),
+            token_hash=hash_refresh_token(token),
+            expires_at=datetime.now(timezone.utc)
+            + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+    )
+    return token
+
+
+async def revoke_refresh_tokens(
+    db: AsyncSession,
+    user_id: Optional[int] = None,
+    family_id: Optional[str] = None,
+) -> None:
+    """
+    Revoke every live refresh token of a user or of one family.
+
+    The caller commits.
+    """
+    query = update(RefreshToken).where(RefreshToken.revoked_at.is_(None))
+    if user_id is not None:
+        query = query.where(RefreshToken.user_id == user_id)
+    if family_id is not None:
+        query = query.where(RefreshToken.family_id == family_id)
+    await db.execute(query.values(revoked_at=datetime.now(timezone.utc)))
+
+
+async def revoke_refresh_token_family(
+    db: AsyncSession, token: str, user_id: int
+) -> None:
+    """
+    Revoke a refresh token and the rest of its family, if it is the user's.
+
+    The caller commits.
+    """
+    result = await db.execute(
+        select(RefreshToken.family_id).where(
+            RefreshToken.token_hash == hash_refresh_token(token),
+            RefreshToken.user_id == user_id,
+        )
+    )
+    family_id = result.scalar()
+    if family_id is not None:
+        await revoke_refresh_tokens(db, family_id=family_id)
+
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Tuple[User, str]:
+    """
+    Spend a refresh token and return its user with the next token of the family.
+
+    One lookup by the unique token_hash loads the token and its user. The
+    token is revoked with a conditional UPDATE, so of two concurrent
+    refreshes with the same token only one wins; the other, like any later
+    use of a spent token, is treated as reuse and revokes the family.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(RefreshToken, User)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == hash_refresh_token(token))
+    )
+    row = result.first()
+    if row is None:
+        raise invalid_refresh_token()
+    refresh_token, user = row
+    # Stored as naive UTC
+    if refresh_token.expires_at <= now.replace(tzinfo=None):
+        raise invalid_refresh_token("Refresh token expired")
+
+    spent = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == refresh_token.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+        .returning(RefreshToken.id)
+    )
+    if spent.first() is None:
+        await revoke_refresh_tokens(db, family_id=refresh_token.family_id)
+        await db.commit()
+        raise invalid_refresh_token("Refresh token reuse detected")
+    if not user.is_active:
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
+        )
+
+    # Spent tokens are only kept for reuse detection, until they expire
+    await db.execute(
+        delete(RefreshToken).where(
+            RefreshToken.family_id == refresh_token.family_id,
+            RefreshToken.expires_at <= now,
+        )
+        # Matching loaded objects in Python would compare naive and aware times
+        .execution_options(synchronize_session=False)
+    )
+    new_token = await issue_refresh_token(db, user.id, refresh_token.family_id)
+    await db.commit()
+    return user, new_token
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.bloom import BloomFilter
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.models.revoked_token import RevokedToken
+from app.db.session import AsyncSessionLocal
+from app.db.statements import upsert
+
+logger = logging.getLogger(__name__)
+
+# Firebase ID tokens live for an hour, user markers have to outlast them too
+FIREBASE_TOKEN_LIFETIME = timedelta(hours=1)
+
+# Session.info key of the revocations written but not committed yet
+PENDING_REVOCATIONS = "pending_revocations"
+
+
+def user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def utcnow() -> datetime:
+    # revoked_tokens holds naive UTC, compare against the same
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class RevocationList:
+    """
+    Answers "is this token revoked?" without a query for tokens that aren't.
+
+    Every key in revoked_tokens is also in a per-process Bloom filter. A miss
+    is final; a hit is confirmed against the table and the answer cached
+    until the next rebuild. Revocations made here are added once their
+    session commits, those of other workers within REVOCATION_SYNC_INTERVAL.
+    Until the first load succeeds every lookup goes to the table.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        error_rate: float,
+        sync_interval: float,
+        rebuild_interval: float,
+        sync_overlap: float = 60.0,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        # Rows committed late or stamped by a skewed clock are still picked up
+        self.sync_overlap = timedelta(seconds=sync_overlap)
+        self.filter = BloomFilter(capacity, error_rate)
+        # Confirmed lookups, key -> revoked_at timestamp, or 0.0 if not revoked
+        self.confirmed = TTLCache(maxsize=100_000, ttl=rebuild_interval)
+        self.ready = False
+        self.synced_at: Optional[datetime] = None
+        self.lookups = 0
+        self.filter_hits = 0
+        self.false_positives = 0
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        """
+        Prune expired rows and replace the filter with one built from the rest.
+        """
+        now = utcnow()
+        await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+        result = await db.execute(select(RevokedToken.key))
+        keys = result.scalars().all()
+        await db.commit()
+        # Grow before the false positive rate does
+        bloom = BloomFilter(max(self.capacity, 2 * len(keys)), self.error_rate)
+        # A few microseconds per key, too long to hold the event loop for
+        await run_in_threadpool(bloom.update, keys)
+        self.filter = bloom
+        self.confirmed.clear()
+        self.synced_at = now
+        self.ready = True
+
+    async def sync(self, db: AsyncSession) -> None:
+        """
+        Add the keys revoked since the last sync, by any worker.
+        """
+        now = utcnow()
+        result = await db.execute(
+            select(RevokedToken.key).where(
+                RevokedToken.revoked_at >= self.synced_at - self.sync_overlap
+            )
+        )
+        for key in result.scalars():
+            if key not in self.filter:
+                self.filter.add(key)
+            # May have been confirmed as not revoked before
+            self.confirmed.pop(key)
+        await db.commit()
+        self.synced_at = now
+
+    async def load(self) -> None:
+        """Build the filter from the event loop, logging instead of raising"""
+        try:
+            async with AsyncSessionLocal() as db:
+                await self.rebuild(db)
+        except Exception as e:
+            logger.warning(f"Could not load revoked tokens: {str(e)}")
+
+    async def keep_synced(self) -> None:
+        """
+        Sync every sync_interval and rebuild every rebuild_interval, forever.
+        """
+        rebuilt_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                async with AsyncSessionLocal() as db:
+                    if (
+                        not self.ready
+                        or self.filter.full
+                        or time.monotonic() - rebuilt_at >= self.rebuild_interval
+                    ):
+                        await self.rebuild(db)
+                        rebuilt_at = time.monotonic()
+                    else:
+                        await self.sync(db)
+            except Exception as e:
+                logger.warning(f"Could not sync revoked tokens: {str(e)}")
+
+    async def revoke(self, db: AsyncSession, key: str, expires_at: datetime) -> None:
+        """
+        Record a revocation until expires_at. The caller commits; this process
+        only treats the key as revoked once it has.
+        """
+        now = datetime.now(timezone.utc)
+        await db.execute(
+            upsert(
+                db,
+                RevokedToken.__table__,
+                ["key"],
+                {"key": key, "revoked_at": now, "expires_at": expires_at},
+            )
+        )
+        db.info.setdefault(PENDING_REVOCATIONS, []).append((self, key, now.timestamp()))
+
+    def apply(self, key: str, revoked_at: float) -> None:
+        self.filter.add(key)
+        self.confirmed.set(key, revoked_at)
+
+    async def _confirm(self, db: AsyncSession, keys: List[str]) -> Dict[str, float]:
+        revoked: Dict[str, float] = {}
+        missing = []
+        for key in keys:
+            cached = self.confirmed.get(key)
+            if cached is None:
+                missing.append(key)
+            else:
+                revoked[key] = cached
+        if missing:
+            result = await db.execute(
+                select(RevokedToken.key, RevokedToken.revoked_at).where(
+                    RevokedToken.key.in_(missing)
+                )
+            )
+            found = dict(result.all())
+            # Don't hold the connection for the rest of the request
+            await db.commit()
+            for key in missing:
+                revoked_at = found.get(key)
+                revoked[key] = (
+                    revoked_at.replace(tzinfo=timezone.utc).timestamp()
+                    if revoked_at is not None
+                    else 0.0
+                )
+                if self.ready:
+                    self.confirmed.set(key, revoked[key])
+        return revoked
+
+    async def is_revoked(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        jti: Optional[str] = None,
+        issued_at: Optional[float] = None,
+    ) -> bool:
+        """
+        Whether the token with this jti, or every token of the user issued by
+        issued_at, was revoked.
+        """
+        self.lookups += 1
+        keys = [
+            key
+            for key in (jti, user_key(user_id))
+            if key is not None and (not self.ready or key in self.filter)
+        ]
+        if not keys:
+            return False
+        self.filter_hits += 1
+        revoked = await self._confirm(db, keys)
+        if jti is not None and revoked.get(jti):
+            return True
+        marker = revoked.get(user_key(user_id))
+        if marker:
+            # iat has whole seconds: a token from the second of the revocation
+            # may be the one issued right after it, e.g. on password change
+            return issued_at is not None and issued_at < int(marker)
+        if not any(revoked.values()):
+            self.false_positives += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "lookups": self.lookups,
+            "filter_hits": self.filter_hits,
+            "false_positives": self.false_positives,
+            "filter": self.filter.stats(),
+            "confirmed": self.confirmed.stats(),
+        }
+
+
+@event.listens_for(Session, "after_commit")
+def apply_pending_revocations(session: Session) -> None:
+    for revocations, key, revoked_at in session.info.pop(PENDING_REVOCATIONS, ()):
+        revocations.apply(key, revoked_at)
+
+
+@event.listens_for(Session, "after_rollback")
+def drop_pending_revocations(session: Session) -> None:
+    session.info.pop(PENDING_REVOCATIONS, None)
+
+
+revocation_list = RevocationList(
+    capacity=settings.REVOCATION_BLOOM_CAPACITY,
+    error_rate=settings.REVOCATION_BLOOM_ERROR_RATE,
+    sync_interval=settings.REVOCATION_SYNC_INTERVAL,
+    rebuild_interval=settings.REVOCATION_REBUILD_INTERVAL,
+)
+
+
+async def revoke_access_token(db: AsyncSession, jti: str, expires_at: int) -> None:
+    """
+    Revoke one app-issued access token until its exp. The caller commits.
+    """
+    await revocation_list.revoke(
+        db, jti, datetime.fromtimestamp(expires_at, tz=timezone.utc)
+    )
+
+
+async def revoke_user_tokens(db: AsyncSession, user_id: int) -> None:
+    """
+    Revoke every access token issued to a user so far, app-issued or
+    Firebase. The caller commits.
+    """
+    lifetime = max(
+        timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        FIREBASE_TOKEN_LIFETIME,
+    )
+    await revocation_list.revoke(
+        db, user_key(user_id), datetime.now(timezone.utc) + lifetime
+    )
@@ -1,5 +1,6 @@
+import secrets
 from datetime import datetime, timedelta, timezone
-from typing import Any, Optional, Union
+from typing import Any, Dict, Optional, Tuple, Union
 
 from jose import jwt
 from passlib.context import CryptContext
@@ -8,28 +9,81 @@ from pydantic import ValidationError
 from app.core.config import settings
 from app.schemas.token import TokenPayload
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with any other cost are upgraded (or downgraded) on next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+# Marks app-issued access tokens, so other HS256 tokens signed with the same
+# key can't be used to authenticate requests
+ACCESS_TOKEN_TYPE = "access"
 
 
 def create_access_token(
-    subject: Union[str, Any], expires_delta: Optional[timedelta] = None
+    subject: Union[str, Any],
+    expires_delta: Optional[timedelta] = None,
+    claims: Optional[Dict[str, Any]] = None,
 ) -> str:
     """
     Create a JWT access token.
     """
+    now = datetime.now(timezone.utc)
     if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.now(timezone.utc) + timedelta(
-            minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
-        )
-    to_encode = {"exp": expire, "sub": str(subject)}
+        expire = now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode = {
+        "exp": expire,
+        "iat": now,
+        # Lets a single token be revoked, see app.core.revocation
+        "jti": secrets.token_urlsafe(16),
+        "sub": str(subject),
+        "type": ACCESS_TOKEN_TYPE,
+    }
+    if claims:
+        to_encode.update(claims)
     encoded_jwt = jwt.encode(
         to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM
     )
     return encoded_jwt
 
 
+def create_user_access_token(
+    user: Any, expires_delta: Optional[timedelta] = None
+) -> str:
+    """
+    Create an access token carrying what requests need to know about the user,
+    so get_current_user can authenticate it without a database read.
+    """
+    return create_access_token(
+        subject=user.id,
+        expires_delta=expires_delta,
+        claims={
+            "su": bool(user.is_superuser),
+            "email": user.email,
+            "name": user.full_name,
+        },
+    )
+
+
+def is_app_token(token: str) -> bool:
+    """
+    Whether a bearer token was issued by us rather than by Firebase.
+
+    Only the unverified header is read: Firebase ID tokens are RS256, ours use
+    settings.ALGORITHM. The token still has to pass verification afterwards.
+    """
+    try:
+        return jwt.get_unverified_header(token).get("alg") == settings.ALGORITHM
+    except jwt.JWTError:
+        return False
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify a password against a hash.
@@ -37,6 +91,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(
+    plain_password: str, hashed_password: Optional[str]
+) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and return a new hash if the stored one uses an old cost.
+    """
+    if not hashed_password:
+        return False, None
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     """
     Hash a password.
@@ -1,8 +1,16 @@
+from typing import Optional
+
 import stripe
 from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
 from app.core.config import settings
+from app.core.principal import Principal
+from app.core.stripe_client import install, stripe_call
+from app.db.models.user import User
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -11,9 +19,13 @@ logger = logging.getLogger(__name__)
 # Initialize Stripe with the API key
 logger.info(f"Initializing Stripe with API key: {settings.STRIPE_API_KEY[:10]}...")
 stripe.api_key = settings.STRIPE_API_KEY
+install()
 
 
-def get_stripe_customer(email: str, name: str = None) -> stripe.Customer:
+@stripe_call("get_stripe_customer")
+def get_stripe_customer(
+    email: str, name: str = None, user_id: Optional[int] = None
+) -> stripe.Customer:
     """
     Get or create a Stripe customer for the given email.
     """
@@ -23,27 +35,163 @@ def get_stripe_customer(email: str, name: str = None) -> stripe.Customer:
 
         # Search for existing customer
         customers = stripe.Customer.list(email=email, limit=1)
-        if customers.data:
+        if customers.data and customer_matches(customers.data[0], user_id):
             logger.info("Found existing customer")
             return customers.data[0]
 
         # Create new customer if none exists
         logger.info("Creating new customer")
-        customer_data = {"email": email}
-        if name:
-            customer_data["name"] = name
+        return stripe.Customer.create(**customer_params(email, name, user_id))
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error creating Stripe customer") from e
+
+
+@stripe_call("get_stripe_customer")
+async def get_stripe_customer_async(
+    email: str, name: str = None, user_id: Optional[int] = None
+) -> stripe.Customer:
+    """
+    Get or create a Stripe customer for the given email, without blocking.
+    """
+    try:
+        customers = await stripe.Customer.list_async(email=email, limit=1)
+        if customers.data and customer_matches(customers.data[0], user_id):
+            return customers.data[0]
+        return await stripe.Customer.create_async(
+            **customer_params(email, name, user_id)
+        )
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error creating Stripe customer") from e
+
 
-        return stripe.Customer.create(**customer_data)
+@stripe_call("create_stripe_customer")
+async def create_stripe_customer_async(
+    email: str, name: Optional[str], user_id: int
+) -> stripe.Customer:
+    """
+    Create a Stripe customer of the user's own, without looking one up by email.
+    """
+    try:
+        return await stripe.Customer.create_async(
+            **customer_params(
+                email, name, user_id, idempotency_key=f"customer-user-{user_id}-own"
+            )
+        )
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error creating Stripe customer") from e
+
+
+@stripe_call("get_customer", timeout=settings.STRIPE_READ_TIMEOUT)
+def get_customer(customer_id: str) -> stripe.Customer:
+    """
+    Get a Stripe customer by ID.
+    """
+    try:
+        return stripe.Customer.retrieve(customer_id)
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error retrieving Stripe customer") from e
+
+
+@stripe_call("get_customer", timeout=settings.STRIPE_READ_TIMEOUT)
+async def get_customer_async(customer_id: str) -> stripe.Customer:
+    """
+    Get a Stripe customer by ID, without blocking.
+    """
+    try:
+        return await stripe.Customer.retrieve_async(customer_id)
     except stripe.error.StripeError as e:
-        logger.error(f"Stripe error: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        logger.error(f"Error code: {getattr(e, 'code', 'unknown')}")
+        raise request_error(e, "Error retrieving Stripe customer") from e
+
+
+def customer_matches(customer: stripe.Customer, user_id: Optional[int]) -> bool:
+    # Customers created for another user, e.g. one who had this email before
+    owner = (customer.get("metadata") or {}).get("user_id")
+    return user_id is None or owner is None or owner == str(user_id)
+
+
+def customer_params(
+    email: str,
+    name: Optional[str],
+    user_id: Optional[int],
+    idempotency_key: Optional[str] = None,
+) -> dict:
+    customer_data = {"email": email}
+    if name:
+        customer_data["name"] = name
+    if user_id is not None:
+        customer_data["metadata"] = {"user_id": str(user_id)}
+        # Concurrent first checkouts of one user create a single customer
+        customer_data["idempotency_key"] = idempotency_key or f"customer-user-{user_id}"
+    return customer_data
+
+
+def request_error(e: stripe.error.StripeError, message: str) -> HTTPException:
+    """
+    The 400 a wrapper raises for a Stripe error, logged with its type and code.
+    """
+    logger.error(f"Stripe error: {str(e)}")
+    logger.error(f"Error type: {type(e).__name__}")
+    logger.error(f"Error code: {getattr(e, 'code', 'unknown')}")
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"{message}: {str(e)}",
+    )
+
+
+async def get_customer_id(db: AsyncSession, user: Principal) -> str:
+    """
+    The user's Stripe customer ID. Read from the users row; the first time,
+    looked up or created in Stripe and stored there.
+    """
+    result = await db.execute(select(User.stripe_customer_id).where(User.id == user.id))
+    customer_id = result.scalar()
+    if customer_id:
+        return customer_id
+
+    customer = await get_stripe_customer_async(
+        email=user.email, name=user.full_name, user_id=user.id
+    )
+    customer_id = await store_customer_id(db, user.id, customer.id)
+    if customer_id is None:
+        # Already stored on another user, e.g. one who had this email before
+        logger.warning(f"Stripe customer {customer.id} belongs to another user")
+        customer = await create_stripe_customer_async(
+            email=user.email, name=user.full_name, user_id=user.id
+        )
+        customer_id = await store_customer_id(db, user.id, customer.id)
+    if customer_id is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error creating Stripe customer: {str(e)}",
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Stripe customer belongs to another user",
+        )
+    return customer_id
+
+
+async def store_customer_id(
+    db: AsyncSession, user_id: int, customer_id: str
+) -> Optional[str]:
+    """
+    Store the customer on the user unless it has one, and return the one it
+    has. None if the customer is stored on another user.
+    """
+    try:
+        await db.execute(
+            update(User)
+            .where(User.id == user_id, User.stripe_customer_id.is_(None))
+            .values(stripe_customer_id=customer_id)
         )
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return None
+    # A concurrent request may have stored another one first
+    result = await db.execute(select(User.stripe_customer_id).where(User.id == user_id))
+    stored = result.scalar()
+    await db.commit()
+    return stored
 
 
+@stripe_call("create_checkout_session")
 def create_checkout_session(
     customer_id: str,
     price_id: str,
@@ -54,30 +202,53 @@ def create_checkout_session(
     Create a Stripe Checkout session for subscription purchase.
     """
     try:
-        session = stripe.checkout.Session.create(
-            customer=customer_id,
-            payment_method_types=["card"],
-            line_items=[
-                {
-                    "price": price_id,
-                    "quantity": 1,
-                }
-            ],
-            mode="subscription",
-            success_url=success_url,
-            cancel_url=cancel_url,
-            subscription_data={
-                "trial_period_days": None,  # Set to a number if you want to offer a trial
-            },
+        return stripe.checkout.Session.create(
+            **checkout_session_params(customer_id, price_id, success_url, cancel_url)
         )
-        return session
     except stripe.error.StripeError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error creating checkout session: {str(e)}",
+        raise request_error(e, "Error creating checkout session") from e
+
+
+@stripe_call("create_checkout_session")
+async def create_checkout_session_async(
+    customer_id: str,
+    price_id: str,
+    success_url: str,
+    cancel_url: str,
+) -> stripe.checkout.Session:
+    """
+    Create a Stripe Checkout session for subscription purchase, without blocking.
+    """
+    try:
+        return await stripe.checkout.Session.create_async(
+            **checkout_session_params(customer_id, price_id, success_url, cancel_url)
         )
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error creating checkout session") from e
 
 
+def checkout_session_params(
+    customer_id: str, price_id: str, success_url: str, cancel_url: str
+) -> dict:
+    return {
+        "customer": customer_id,
+        "payment_method_types": ["card"],
+        "line_items": [
+            {
+                "price": price_id,
+                "quantity": 1,
+            }
+        ],
+        "mode": "subscription",
+        "success_url": success_url,
+        "cancel_url": cancel_url,
+        "subscription_data": {
+            "trial_period_days": None,  # Set to a number if you want to offer a trial
+        },
+    }
+
+
+@stripe_call("create_subscription")
 def create_subscription(
     customer_id: str,
     price_id: str,
@@ -87,36 +258,68 @@ def create_subscription(
     Create a new Stripe subscription for a customer.
     """
     try:
-        subscription_data = {
-            "customer": customer_id,
-            "items": [{"price": price_id}],
-            "expand": ["latest_invoice.payment_intent"],
-        }
+        return stripe.Subscription.create(
+            **subscription_params(customer_id, price_id, trial_days)
+        )
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error creating subscription") from e
 
-        if trial_days:
-            subscription_data["trial_period_days"] = trial_days
 
-        return stripe.Subscription.create(**subscription_data)
-    except stripe.error.StripeError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error creating subscription: {str(e)}",
+@stripe_call("create_subscription")
+async def create_subscription_async(
+    customer_id: str,
+    price_id: str,
+    trial_days: int = None,
+) -> stripe.Subscription:
+    """
+    Create a new Stripe subscription for a customer, without blocking.
+    """
+    try:
+        return await stripe.Subscription.create_async(
+            **subscription_params(customer_id, price_id, trial_days)
         )
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error creating subscription") from e
+
+
+def subscription_params(
+    customer_id: str, price_id: str, trial_days: Optional[int]
+) -> dict:
+    subscription_data = {
+        "customer": customer_id,
+        "items": [{"price": price_id}],
+        "expand": ["latest_invoice.payment_intent"],
+    }
+    if trial_days:
+        subscription_data["trial_period_days"] = trial_days
+    return subscription_data
 
 
+@stripe_call("cancel_subscription")
 def cancel_subscription(subscription_id: str) -> stripe.Subscription:
     """
     Cancel a Stripe subscription.
     """
     try:
-        return stripe.Subscription.delete(subscription_id)
+        # DELETE /v1/subscriptions/{id}, as the deprecated Subscription.delete
+        return stripe.Subscription.cancel(subscription_id)
     except stripe.error.StripeError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error canceling subscription: {str(e)}",
-        )
+        raise request_error(e, "Error canceling subscription") from e
 
 
+@stripe_call("cancel_subscription")
+async def cancel_subscription_async(subscription_id: str) -> stripe.Subscription:
+    """
+    Cancel a Stripe subscription, without blocking.
+    """
+    try:
+        # DELETE /v1/subscriptions/{id}, as the deprecated Subscription.delete
+        return await stripe.Subscription.cancel_async(subscription_id)
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error canceling subscription") from e
+
+
+@stripe_call("get_subscription", timeout=settings.STRIPE_READ_TIMEOUT)
 def get_subscription(subscription_id: str) -> stripe.Subscription:
     """
     Get a Stripe subscription by ID.
@@ -124,12 +327,21 @@ def get_subscription(subscription_id: str) -> stripe.Subscription:
     try:
         return stripe.Subscription.retrieve(subscription_id)
     except stripe.error.StripeError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error retrieving subscription: {str(e)}",
-        )
+        raise request_error(e, "Error retrieving subscription") from e
 
 
+@stripe_call("get_subscription", timeout=settings.STRIPE_READ_TIMEOUT)
+async def get_subscription_async(subscription_id: str) -> stripe.Subscription:
+    """
+    Get a Stripe subscription by ID, without blocking.
+    """
+    try:
+        return await stripe.Subscription.retrieve_async(subscription_id)
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error retrieving subscription") from e
+
+
+@stripe_call("get_customer_invoices", timeout=settings.STRIPE_READ_TIMEOUT)
 def get_customer_invoices(customer_id: str, limit: int = 10) -> list:
     """
     Get a customer's invoices.
@@ -137,10 +349,18 @@ def get_customer_invoices(customer_id: str, limit: int = 10) -> list:
     try:
         return stripe.Invoice.list(customer=customer_id, limit=limit)
     except stripe.error.StripeError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error retrieving invoices: {str(e)}",
-        )
+        raise request_error(e, "Error retrieving invoices") from e
+
+
+@stripe_call("get_customer_invoices", timeout=settings.STRIPE_READ_TIMEOUT)
+async def get_customer_invoices_async(customer_id: str, limit: int = 10) -> list:
+    """
+    Get a customer's invoices, without blocking.
+    """
+    try:
+        return await stripe.Invoice.list_async(customer=customer_id, limit=limit)
+    except stripe.error.StripeError as e:
+        raise request_error(e, "Error retrieving invoices") from e
 
 
 def handle_webhook_event(payload: bytes, sig_header: str) -> dict:
@@ -167,7 +387,4 @@ def handle_webhook_event(payload: bytes, sig_header: str) -> dict:
         )
     except Exception as e:
         logger.error(f"Webhook error: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Webhook error: {str(e)}",
-        )
+        raise request_error(e, "Webhook error") from e
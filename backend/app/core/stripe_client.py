@@ -0,0 +1,425 @@
+import asyncio
+import functools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+
+import httpx
+import requests
+import stripe
+from fastapi import HTTPException, status
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Connections per httpx client of AsyncStripeHTTPClient
+CONNECTIONS_PER_CLIENT = 20
+
+# Read timeout of the Stripe requests made by the current call
+call_timeout: ContextVar[Optional[float]] = ContextVar(
+    "stripe_call_timeout", default=None
+)
+
+
+class CircuitBreaker:
+    """
+    Stops calling Stripe after `threshold` calls in a row fail with a
+    connection error or 5xx response, so requests fail fast instead of each
+    holding a threadpool thread for the whole timeout. Every `reset_timeout`
+    seconds one call is let through: a success closes the circuit, a failure
+    keeps it open. Used from threadpool threads, hence the lock.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.reset_timeout:
+                # Let this call through, the others wait for another period
+                self.opened_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 0
+        remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+        return max(1, math.ceil(remaining))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Stripe circuit closed")
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None:
+                self.opened_at = time.monotonic()
+            elif self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                logger.error(f"Stripe circuit opened after {self.failures} failures")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "threshold": self.threshold,
+            "reset_timeout": self.reset_timeout,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class AsyncStripeHTTPClient(stripe.HTTPClient):
+    """
+    Sends the requests of the library's *_async methods over at most
+    `max_connections` kept-alive connections. Timeouts work as for the sync
+    client. Implements only the public HTTPClient interface the library
+    calls: request_async, sleep_async and close_async.
+
+    The connections are spread over httpx clients of CONNECTIONS_PER_CLIENT
+    each, and a call takes a slot of one before sending, waiting here when
+    all are in use. The httpx pool does work per connection and per queued
+    request on every change, so one large or backed-up pool costs several
+    times the CPU per request of a few small ones that never queue.
+    """
+
+    name = "httpx"
+
+    def __init__(
+        self,
+        max_connections: int,
+        connect_timeout: float,
+        timeout: float,
+    ):
+        super().__init__()
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self._clients: List[httpx.AsyncClient] = []
+        # A slot per connection, taken in arrival order
+        self._slots = asyncio.Semaphore(max_connections)
+        self._free: List[httpx.AsyncClient] = []
+        for start in range(0, max_connections, CONNECTIONS_PER_CLIENT):
+            size = min(CONNECTIONS_PER_CLIENT, max_connections - start)
+            client = httpx.AsyncClient(
+                verify=stripe.ca_bundle_path,
+                limits=httpx.Limits(
+                    max_connections=size, max_keepalive_connections=size
+                ),
+            )
+            self._clients.append(client)
+            self._free.extend([client] * size)
+
+    async def request_async(
+        self,
+        method: str,
+        url: str,
+        headers: Mapping[str, str],
+        post_data: Any = None,
+    ) -> Tuple[bytes, int, Mapping[str, str]]:
+        timeout = call_timeout.get() or self.timeout
+        try:
+            async with asyncio.timeout(timeout):
+                await self._slots.acquire()
+        except TimeoutError as e:
+            raise connection_error(e)
+        client = self._free.pop()
+        try:
+            response = await client.request(
+                method,
+                url,
+                headers=headers,
+                content=post_data,
+                timeout=httpx.Timeout(timeout, connect=self.connect_timeout),
+            )
+        except Exception as e:
+            raise connection_error(e)
+        finally:
+            self._free.append(client)
+            self._slots.release()
+        return response.content, response.status_code, response.headers
+
+    async def sleep_async(self, secs: float) -> None:
+        await asyncio.sleep(secs)
+
+    async def close_async(self) -> None:
+        for client in self._clients:
+            await client.aclose()
+
+
+def connection_error(e: Exception) -> stripe.error.APIConnectionError:
+    # Retried by the library and counted by the circuit breaker
+    return stripe.error.APIConnectionError(
+        f"Error communicating with Stripe: {type(e).__name__}: {str(e)}",
+        should_retry=True,
+    )
+
+
+class StripeHTTPClient(stripe.HTTPClient):
+    """
+    The HTTP client every Stripe request goes through. Implements only the
+    public HTTPClient interface the library calls: request and close, with
+    the *_async methods handed to `async_client`.
+
+    All threads share one requests session, so connections to Stripe are
+    kept alive and reused from a pool of up to `pool_size`. The read
+    timeout is the one set in call_timeout by the call being made, or the
+    default. Retries are the library's: jittered exponential backoff, and
+    POSTs always carry an Idempotency-Key, so retrying one is safe.
+    """
+
+    name = "requests"
+
+    def __init__(
+        self,
+        async_client: AsyncStripeHTTPClient,
+        pool_size: int,
+        connect_timeout: float,
+        timeout: float,
+    ):
+        super().__init__(async_fallback_client=async_client)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Mapping[str, str],
+        post_data: Any = None,
+    ) -> Tuple[bytes, int, Mapping[str, str]]:
+        try:
+            response = self.session.request(
+                method,
+                url,
+                headers=headers,
+                data=post_data,
+                timeout=(self.connect_timeout, call_timeout.get() or self.timeout),
+                verify=stripe.ca_bundle_path,
+            )
+            # Reads the body, which can time out too
+            content = response.content
+        except requests.RequestException as e:
+            raise connection_error(e)
+        return content, response.status_code, response.headers
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class CallMetrics:
+    """
+    Latency and outcome counters of one wrapper in app.core.stripe, over the
+    last `keep` calls for the percentiles.
+    """
+
+    def __init__(self, keep: int):
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.max_latency = 0.0
+        self.latencies: Deque[float] = deque(maxlen=keep)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[int((len(latencies) - 1) * p)] * 1000, 1)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_latency * 1000, 1),
+        }
+
+
+class StripeMetrics:
+    def __init__(self, keep: int):
+        self.keep = keep
+        self.calls: Dict[str, CallMetrics] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CallMetrics:
+        with self._lock:
+            if name not in self.calls:
+                self.calls[name] = CallMetrics(self.keep)
+            return self.calls[name]
+
+    def reject(self, name: str) -> None:
+        metrics = self.get(name)
+        with self._lock:
+            metrics.rejected += 1
+
+    def record(self, name: str, latency: float, failed: bool) -> None:
+        metrics = self.get(name)
+        with self._lock:
+            metrics.calls += 1
+            metrics.errors += failed
+            metrics.max_latency = max(metrics.max_latency, latency)
+            metrics.latencies.append(latency)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: metrics.stats() for name, metrics in self.calls.items()}
+
+
+stripe_breaker = CircuitBreaker(
+    threshold=settings.STRIPE_BREAKER_THRESHOLD,
+    reset_timeout=settings.STRIPE_BREAKER_RESET_TIMEOUT,
+)
+stripe_metrics = StripeMetrics(keep=settings.STRIPE_LATENCY_SAMPLES)
+http_client = StripeHTTPClient(
+    async_client=AsyncStripeHTTPClient(
+        max_connections=settings.STRIPE_ASYNC_MAX_CONNECTIONS,
+        connect_timeout=settings.STRIPE_CONNECT_TIMEOUT,
+        timeout=settings.STRIPE_TIMEOUT,
+    ),
+    pool_size=settings.STRIPE_POOL_SIZE,
+    connect_timeout=settings.STRIPE_CONNECT_TIMEOUT,
+    timeout=settings.STRIPE_TIMEOUT,
+)
+
+
+def install() -> None:
+    """
+    Make the stripe library send everything through http_client.
+    """
+    stripe.default_http_client = http_client
+    stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+
+
+def check_circuit(name: str) -> None:
+    if not stripe_breaker.allow():
+        stripe_metrics.reject(name)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Payment provider unavailable, try again later",
+            headers={"Retry-After": str(stripe_breaker.retry_after())},
+        )
+
+
+def record_outcome(error: Optional[BaseException]) -> None:
+    """
+    Feed the outcome of a wrapper call, after the library's retries, to the
+    circuit breaker. Wrappers raise a Stripe error as an HTTPException from
+    it. Connection errors and 5xx responses are failures, other Stripe errors
+    mean Stripe answered, and errors of no Stripe request say nothing.
+    """
+    if error is not None and not isinstance(error, stripe.error.StripeError):
+        error = error.__cause__
+        if not isinstance(error, stripe.error.StripeError):
+            return
+    if error is not None and (
+        isinstance(error, stripe.error.APIConnectionError)
+        or (error.http_status or 0) >= 500
+    ):
+        stripe_breaker.record_failure()
+    else:
+        stripe_breaker.record_success()
+
+
+def stripe_call(name: str, timeout: Optional[float] = None) -> Callable:
+    """
+    Decorate a Stripe wrapper, blocking or async: reject it with 503 while
+    the circuit is open, bound its requests by `timeout`, feed its outcome
+    to the circuit breaker and record its latency as `name`.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                check_circuit(name)
+                token = call_timeout.set(timeout)
+                started = time.perf_counter()
+                error: Optional[BaseException] = None
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    call_timeout.reset(token)
+                    record_outcome(error)
+                    stripe_metrics.record(
+                        name, time.perf_counter() - started, error is not None
+                    )
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            check_circuit(name)
+            token = call_timeout.set(timeout)
+            started = time.perf_counter()
+            error: Optional[BaseException] = None
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                call_timeout.reset(token)
+                record_outcome(error)
+                stripe_metrics.record(
+                    name, time.perf_counter() - started, error is not None
+                )
+
+        return wrapper
+
+    return decorator
+
+
+async def close() -> None:
+    await http_client.close_async()
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "circuit": stripe_breaker.stats(),
+        "pool_size": http_client.pool_size,
+        "async_max_connections": settings.STRIPE_ASYNC_MAX_CONNECTIONS,
+        "max_network_retries": stripe.max_network_retries,
+        "calls": stripe_metrics.stats(),
+    }
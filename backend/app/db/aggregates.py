@@ -0,0 +1,46 @@
+import json
+from typing import Any, List
+
+from sqlalchemy import String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import GenericFunction
+from sqlalchemy.types import TypeDecorator
+
+
+class IdList(TypeDecorator):
+    """
+    Result type of id_array, always a list of ids and never NULL.
+    """
+
+    impl = String
+    cache_ok = True
+
+    def process_result_value(self, value: Any, dialect: Any) -> List[int]:
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = json.loads(value)
+        return list(value)
+
+
+class id_array(GenericFunction):
+    """
+    Aggregate a column of ids into one list value.
+
+    Compiles to array_agg on Postgres and json_group_array on SQLite, so
+    member lists come back in the row that needs them instead of as ORM
+    objects.
+    """
+
+    type = IdList()
+    inherit_cache = True
+
+
+@compiles(id_array)
+def compile_id_array(element: id_array, compiler: Any, **kw: Any) -> str:
+    return f"array_agg({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(id_array, "sqlite")
+def compile_id_array_sqlite(element: id_array, compiler: Any, **kw: Any) -> str:
+    return f"json_group_array({compiler.process(element.clauses, **kw)})"
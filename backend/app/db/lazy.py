@@ -0,0 +1,47 @@
+from contextvars import ContextVar
+from typing import Any, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+# Sessions handed out while serving the current request, see SessionReleasingRoute
+request_sessions: ContextVar[Optional[List["LazySession"]]] = ContextVar(
+    "request_sessions", default=None
+)
+
+
+class LazySession:
+    """
+    Stands in for an AsyncSession that is only created on first use.
+
+    Handlers that never touch the session never create one, and release()
+    hands the connection back without waiting for dependency teardown. Using
+    the proxy again after release() starts a fresh session.
+    """
+
+    __slots__ = ("_factory", "_session")
+
+    def __init__(self, factory: async_sessionmaker):
+        self._factory = factory
+        self._session: Optional[AsyncSession] = None
+        sessions = request_sessions.get()
+        if sessions is not None:
+            sessions.append(self)
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._factory()
+        return self._session
+
+    @property
+    def has_session(self) -> bool:
+        # Not is_active, which reaches the session's own through __getattr__
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.session, name)
+
+    async def release(self) -> None:
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
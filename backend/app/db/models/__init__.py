@@ -7,6 +7,11 @@ from app.db.models.subscription import (
     SubscriptionStatus,
 )
 from app.db.models.project import Project, project_members
+from app.db.models.firebase_sync import FirebaseSyncJob
+from app.db.models.refresh_token import RefreshToken
+from app.db.models.revoked_token import RevokedToken
+from app.db.models.invoice import Invoice
+from app.db.models.stripe_event import StripeEvent
 
 __all__ = [
     "User",
@@ -15,4 +20,9 @@ __all__ = [
     "SubscriptionStatus",
     "Project",
     "project_members",
+    "FirebaseSyncJob",
+    "RefreshToken",
+    "RevokedToken",
+    "Invoice",
+    "StripeEvent",
 ]
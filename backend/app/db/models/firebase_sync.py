@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, ForeignKey, Integer, Text
+
+from app.db.session import Base
+from app.db.types import UTCDateTime
+
+
+class FirebaseSyncJob(Base):
+    """
+    A user still waiting for a Firebase account to be linked or created.
+
+    Keyed by user, so enqueueing an already queued user is a no-op. The row
+    is deleted once the user has a firebase_uid.
+    """
+
+    __tablename__ = "firebase_sync_jobs"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(
+        UTCDateTime,
+        nullable=False,
+        index=True,
+        default=lambda: datetime.now(timezone.utc),
+    )
+    last_error = Column(Text, nullable=True)
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(
+        UTCDateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
@@ -0,0 +1,48 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
+
+from app.db.session import Base
+from app.db.types import UTCDateTime
+
+
+class Invoice(Base):
+    """
+    A Stripe invoice, mirrored from invoice.* webhook events so the billing
+    page never calls Stripe.
+
+    created_at is Stripe's creation time. last_event_at is the Stripe time
+    of the data the row holds, an event older than that is ignored.
+    """
+
+    __tablename__ = "invoices"
+
+    id = Column(Integer, primary_key=True, index=True)
+    stripe_invoice_id = Column(String, unique=True, nullable=False)
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    stripe_subscription_id = Column(String, nullable=True)
+    number = Column(String, nullable=True)
+    status = Column(String, nullable=True)
+    currency = Column(String, nullable=False)
+    amount_due = Column(Integer, nullable=False)  # In the currency's smallest unit
+    amount_paid = Column(Integer, nullable=False)
+    hosted_invoice_url = Column(String, nullable=True)
+    invoice_pdf = Column(String, nullable=True)
+    period_start = Column(UTCDateTime, nullable=True)
+    period_end = Column(UTCDateTime, nullable=True)
+    created_at = Column(UTCDateTime, nullable=False)
+    last_event_at = Column(UTCDateTime, nullable=False)
+    updated_at = Column(
+        UTCDateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+    # A user's invoices are listed newest first with keyset pagination
+    __table_args__ = (
+        Index("ix_invoices_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
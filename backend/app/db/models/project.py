@@ -4,8 +4,8 @@ from typing import Optional
 from sqlalchemy import (
     Boolean,
     Column,
-    DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
@@ -14,6 +14,7 @@ from sqlalchemy import (
 from sqlalchemy.orm import relationship
 
 from app.db.session import Base
+from app.db.types import UTCDateTime
 
 # Association table for many-to-many relationship between projects and users
 project_members = Table(
@@ -21,6 +22,8 @@ project_members = Table(
     Base.metadata,
     Column("project_id", Integer, ForeignKey("projects.id"), primary_key=True),
     Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    # The primary key leads with project_id, lookups by user need their own index
+    Index("ix_project_members_user_id", "user_id"),
 )
 
 
@@ -32,13 +35,18 @@ class Project(Base):
     description = Column(Text, nullable=True)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(
-        DateTime,
+        UTCDateTime,
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
     )
 
+    # Serves lookups by owner and their keyset pagination in (created_at, id) order
+    __table_args__ = (
+        Index("ix_projects_owner_id_created_at_id", "owner_id", "created_at", "id"),
+    )
+
     # Relationships
     owner = relationship(
         "User", back_populates="owned_projects", foreign_keys=[owner_id]
@@ -0,0 +1,31 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, ForeignKey, Integer, String
+
+from app.db.session import Base
+from app.db.types import UTCDateTime
+
+
+class RefreshToken(Base):
+    """
+    One issued refresh token, stored as an HMAC of its value.
+
+    Each refresh revokes the presented token and issues the next one in the
+    same family. Presenting a revoked token means it was copied, and the
+    whole family is revoked.
+    """
+
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    family_id = Column(String, nullable=False, index=True)
+    token_hash = Column(String, unique=True, nullable=False)
+    expires_at = Column(UTCDateTime, nullable=False)
+    revoked_at = Column(UTCDateTime, nullable=True)
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String
+
+from app.db.session import Base
+from app.db.types import UTCDateTime
+
+
+class RevokedToken(Base):
+    """
+    A revoked access token by its jti, or a "user:<id>" marker revoking every
+    token of that user issued up to revoked_at.
+
+    Rows are only needed until the tokens they cover would have expired.
+    """
+
+    __tablename__ = "revoked_tokens"
+
+    key = Column(String, primary_key=True)
+    revoked_at = Column(UTCDateTime, nullable=False, index=True)
+    expires_at = Column(UTCDateTime, nullable=False, index=True)
@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Index, Integer, String, Text, text
+
+from app.db.session import Base
+from app.db.types import UTCDateTime
+
+
+class StripeEvent(Base):
+    """
+    A verified Stripe webhook event, stored as received and processed later
+    by app.workers.stripe_events.
+
+    Keyed by Stripe's event id, so redeliveries are dropped on insert.
+    Events of one subscription are processed in order of creation, others
+    in any order. processed_at is set once the event was applied, or given
+    up on after too many attempts, with last_error saying why.
+    """
+
+    __tablename__ = "stripe_events"
+
+    id = Column(String, primary_key=True)
+    type = Column(String, nullable=False)
+    # The subscription the event is about, if any
+    stripe_subscription_id = Column(String, nullable=True)
+    stripe_created_at = Column(UTCDateTime, nullable=False)
+    received_at = Column(
+        UTCDateTime, nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
+    payload = Column(Text, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(
+        UTCDateTime, nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
+    processed_at = Column(UTCDateTime, nullable=True, index=True)
+    last_error = Column(Text, nullable=True)
+
+    # Workers only ever look at pending events
+    __table_args__ = (
+        Index(
+            "ix_stripe_events_pending",
+            "next_attempt_at",
+            postgresql_where=text("processed_at IS NULL"),
+        ),
+        Index(
+            "ix_stripe_events_pending_subscription",
+            "stripe_subscription_id",
+            "stripe_created_at",
+            "received_at",
+            postgresql_where=text("processed_at IS NULL"),
+        ),
+    )
@@ -2,11 +2,12 @@ from datetime import datetime, timezone
 from enum import Enum
 from typing import Optional
 
-from sqlalchemy import Boolean, Column, DateTime, Enum as SQLAlchemyEnum
-from sqlalchemy import ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, Column, Enum as SQLAlchemyEnum
+from sqlalchemy import ForeignKey, Index, Integer, String, Text, text
 from sqlalchemy.orm import relationship
 
 from app.db.session import Base
+from app.db.types import UTCDateTime
 
 
 class SubscriptionStatus(str, Enum):
@@ -25,11 +26,11 @@ class SubscriptionPlan(Base):
     description = Column(Text, nullable=True)
     price = Column(Integer, nullable=False)  # Price in cents
     interval = Column(String, nullable=False)  # 'month' or 'year'
-    stripe_price_id = Column(String, nullable=True)
+    stripe_price_id = Column(String, nullable=True, index=True)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(
-        DateTime,
+        UTCDateTime,
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
     )
@@ -47,17 +48,30 @@ class Subscription(Base):
     status = Column(
         SQLAlchemyEnum(SubscriptionStatus), default=SubscriptionStatus.ACTIVE
     )
-    stripe_subscription_id = Column(String, nullable=True)
-    current_period_start = Column(DateTime, nullable=True)
-    current_period_end = Column(DateTime, nullable=True)
+    stripe_subscription_id = Column(String, nullable=True, index=True)
+    current_period_start = Column(UTCDateTime, nullable=True)
+    current_period_end = Column(UTCDateTime, nullable=True)
     cancel_at_period_end = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # created of the newest Stripe event applied, older events are dropped
+    last_event_at = Column(UTCDateTime, nullable=True)
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(
-        DateTime,
+        UTCDateTime,
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
     )
 
+    __table_args__ = (
+        Index("ix_subscriptions_user_id_status", "user_id", "status"),
+        # Most lookups only want the user's active subscription
+        Index(
+            "ix_subscriptions_active_user_id",
+            "user_id",
+            "created_at",
+            postgresql_where=text("status = 'ACTIVE'"),
+        ),
+    )
+
     # Relationships
     user = relationship("User", back_populates="subscriptions")
     plan = relationship("SubscriptionPlan", back_populates="subscriptions")
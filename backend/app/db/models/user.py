@@ -1,10 +1,11 @@
 from datetime import datetime, timezone
 from typing import Optional
 
-from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from sqlalchemy import Boolean, Column, Index, Integer, String
 from sqlalchemy.orm import relationship
 
 from app.db.session import Base
+from app.db.types import UTCDateTime
 
 
 class User(Base):
@@ -17,13 +18,18 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
     firebase_uid = Column(String, unique=True, nullable=True)  # For Firebase auth
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Set on first checkout/subscribe or by app.scripts.backfill_stripe_customers
+    stripe_customer_id = Column(String, unique=True, index=True, nullable=True)
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(
-        DateTime,
+        UTCDateTime,
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
     )
 
+    # Keyset pagination walks users in (created_at, id) order
+    __table_args__ = (Index("ix_users_created_at_id", "created_at", "id"),)
+
     # Relationships
     subscriptions = relationship(
         "Subscription", back_populates="user", cascade="all, delete-orphan"
@@ -0,0 +1,170 @@
+import threading
+import time
+import uuid
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+
+
+class PoolStats:
+    """
+    Checkout counters for one named pool.
+
+    Counters are cumulative since process start; gauges such as the number of
+    checked out connections are read from the pool itself.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, waited: float, overflowed: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self, waited: float) -> None:
+        with self._lock:
+            self.timeouts += 1
+            self.wait_max = max(self.wait_max, waited)
+
+
+# Stats by pool logging name, shared by a pool and the pools it is recreated as
+_pool_stats: Dict[str, PoolStats] = {}
+_pools: Dict[str, QueuePool] = {}
+
+
+class InstrumentedPoolMixin:
+    """
+    Times every checkout and counts overflow connections and pool timeouts.
+    """
+
+    def _do_get(self) -> Any:
+        stats = _pool_stats.setdefault(
+            self._orig_logging_name, PoolStats(self._orig_logging_name)
+        )
+        overflow_before = self.overflow()
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            stats.record_timeout(time.perf_counter() - started)
+            raise
+        stats.record_checkout(
+            time.perf_counter() - started,
+            overflowed=self.overflow() > max(overflow_before, 0),
+        )
+        return record
+
+    def recreate(self) -> Any:
+        pool = super().recreate()
+        _pools[self._orig_logging_name] = pool
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def compute_pool_size(is_async: bool, replica: bool = False) -> Tuple[int, int]:
+    """
+    Return ``(pool_size, max_overflow)`` for one engine in one worker.
+
+    The per-worker share of DB_MAX_CONNECTIONS is split between the sync and
+    the async primary engine, so together they never hold more than it. The
+    sync engine gets up to DB_SYNC_MAX_CONNECTIONS, capped at the thread
+    limiter size since a sync handler needs a thread to use a connection. The
+    replica is another server and gets the whole share. Each engine's share is
+    then split between persistent and overflow connections.
+    """
+    budget = max(1, settings.DB_MAX_CONNECTIONS // max(1, settings.WEB_CONCURRENCY))
+    sync_budget = max(
+        1, min(settings.DB_SYNC_MAX_CONNECTIONS, settings.THREADPOOL_SIZE, budget // 2)
+    )
+    if not is_async:
+        budget = sync_budget
+    elif not replica:
+        budget = max(1, budget - sync_budget)
+    max_overflow = min(settings.DB_POOL_MAX_OVERFLOW, budget // 2)
+    pool_size = min(settings.DB_POOL_SIZE or budget, budget - max_overflow)
+    return pool_size, max_overflow
+
+
+def get_engine_options(
+    name: str, is_async: bool, backend: str, replica: bool = False
+) -> Dict[str, Any]:
+    """
+    Build create_engine/create_async_engine keyword arguments for a named pool.
+    """
+    if backend == "sqlite":
+        # SQLite uses its own single-file pools, nothing to size or ping
+        return {}
+
+    pool_size, max_overflow = compute_pool_size(is_async, replica)
+    options: Dict[str, Any] = {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_logging_name": name,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+    if settings.DB_PGBOUNCER and is_async:
+        # PgBouncer may hand each transaction a different server connection, so
+        # asyncpg must not cache prepared statements or reuse statement names
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return options
+
+
+def register_pool(name: str, engine: Any) -> None:
+    """
+    Track an engine's pool so it shows up in get_pool_stats().
+    """
+    pool = engine.pool
+    if isinstance(pool, InstrumentedPoolMixin):
+        _pool_stats.setdefault(name, PoolStats(name))
+        _pools[name] = pool
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Snapshot of every registered pool: gauges plus cumulative checkout counters.
+    """
+    snapshot = {}
+    for name, pool in _pools.items():
+        stats = _pool_stats[name]
+        snapshot[name] = {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": stats.checkouts,
+            "checkout_wait_avg_ms": (
+                stats.wait_total / stats.checkouts * 1000 if stats.checkouts else 0.0
+            ),
+            "checkout_wait_max_ms": stats.wait_max * 1000,
+            "overflow_events": stats.overflow_events,
+            "timeouts": stats.timeouts,
+        }
+    return snapshot
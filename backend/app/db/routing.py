@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Id of the authenticated user of the current request, set by get_current_user
+current_user_id: ContextVar[Optional[int]] = ContextVar("current_user_id", default=None)
+
+# Seconds since the last replayed transaction, 0 when the replica is caught up
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
+)
+
+
+class ReplicaRouter:
+    """
+    Decides whether a read may be served by the replica.
+
+    Reads go to the primary while the replica lag is unknown or above
+    REPLICA_MAX_LAG_SECONDS, and for READ_YOUR_WRITES_SECONDS after a user
+    writes so they see their own changes. Pins are tracked per process, so
+    with several workers a user is only pinned on the worker that took the
+    write.
+    """
+
+    def __init__(self, pin_seconds: float, max_lag: float):
+        self.pin_seconds = pin_seconds
+        self.max_lag = max_lag
+        self.lag: Optional[float] = None
+        self._pinned_until: Dict[int, float] = {}
+
+    def pin(self, user_id: int) -> None:
+        now = time.monotonic()
+        self._pinned_until[user_id] = now + self.pin_seconds
+        # Drop expired pins once in a while so the dict stays small
+        if len(self._pinned_until) > 10000:
+            self._pinned_until = {
+                uid: until for uid, until in self._pinned_until.items() if until > now
+            }
+
+    def is_pinned(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return False
+        until = self._pinned_until.get(user_id)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            self._pinned_until.pop(user_id, None)
+            return False
+        return True
+
+    def use_replica(self, user_id: Optional[int]) -> bool:
+        if self.lag is None or self.lag > self.max_lag:
+            return False
+        return not self.is_pinned(user_id)
+
+    async def measure_lag(self, engine: AsyncEngine) -> None:
+        try:
+            async with engine.connect() as connection:
+                lag = (await connection.execute(REPLICA_LAG_QUERY)).scalar()
+            self.lag = float(lag)
+        except Exception as e:
+            logger.warning(f"Could not measure replica lag: {str(e)}")
+            self.lag = None
+
+    async def monitor(self, engine: AsyncEngine) -> None:
+        """
+        Measure replica lag every REPLICA_LAG_CHECK_INTERVAL seconds, forever.
+        """
+        while True:
+            await self.measure_lag(engine)
+            await asyncio.sleep(settings.REPLICA_LAG_CHECK_INTERVAL)
+
+
+replica_router = ReplicaRouter(
+    pin_seconds=settings.READ_YOUR_WRITES_SECONDS,
+    max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+)
@@ -1,17 +1,112 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
+from app.db.pool import get_engine_options, register_pool
+from app.db.routing import current_user_id, replica_router
 
-# Create SQLAlchemy engine
+# asyncio drivers used in place of the sync DBAPI for each backend
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite",
+}
+
+
+def get_async_database_url(url: str) -> str:
+    """
+    Swap the sync DBAPI driver of a database URL for its asyncio counterpart.
+    """
+    url_obj = make_url(url)
+    backend = url_obj.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database '{backend}'")
+    return url_obj.set(
+        drivername=f"{backend}+{ASYNC_DRIVERS[backend]}"
+    ).render_as_string(hide_password=False)
+
+
+DATABASE_URL = str(settings.SQLALCHEMY_DATABASE_URI) or "sqlite:///./webapp_skeleton.db"
+
+DATABASE_BACKEND = make_url(DATABASE_URL).get_backend_name()
+
+# Create SQLAlchemy engine (sync fallback, used by scripts and sync handlers)
 engine = create_engine(
-    str(settings.SQLALCHEMY_DATABASE_URI) or "sqlite:///./webapp_skeleton.db"
+    DATABASE_URL,
+    **get_engine_options("primary-sync", is_async=False, backend=DATABASE_BACKEND),
 )
+register_pool("primary-sync", engine)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Create async engine used by the API routers
+async_engine = create_async_engine(
+    get_async_database_url(DATABASE_URL),
+    **get_engine_options("primary", is_async=True, backend=DATABASE_BACKEND),
+)
+register_pool("primary", async_engine)
+
+# Objects stay usable after commit so handlers can return them without a reload
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+# Replica engine for read-only handlers, only created when one is configured
+replica_engine = None
+if settings.SQLALCHEMY_REPLICA_DATABASE_URI:
+    replica_engine = create_async_engine(
+        get_async_database_url(str(settings.SQLALCHEMY_REPLICA_DATABASE_URI)),
+        **get_engine_options(
+            "replica", is_async=True, backend=DATABASE_BACKEND, replica=True
+        ),
+    )
+    register_pool("replica", replica_engine)
+
+
+class RoutingSession(Session):
+    """
+    Sends reads to the replica when the replica router allows it.
+
+    Flushes and any statement issued while the current user is pinned, or the
+    replica is lagging, go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            replica_engine is not None
+            and not self._flushing
+            and replica_router.use_replica(current_user_id.get())
+        ):
+            return replica_engine.sync_engine
+        return async_engine.sync_engine
+
+
+ReadSessionLocal = async_sessionmaker(
+    sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
+)
+
+
+@event.listens_for(Session, "after_flush")
+def pin_user_after_flush(session, flush_context):
+    user_id = current_user_id.get()
+    if user_id is not None:
+        replica_router.pin(user_id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def pin_user_after_dml(orm_execute_state):
+    user_id = current_user_id.get()
+    if user_id is not None and (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        replica_router.pin(user_id)
+
+
 # Create Base class
 Base = declarative_base()
 
@@ -0,0 +1,46 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import ColumnElement, Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.expression import Insert
+
+
+def dialect_insert(db: AsyncSession, table: Table) -> Insert:
+    """
+    INSERT for the dialect the session is bound to, which has ON CONFLICT.
+    """
+    dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+    return dialect.insert(table)
+
+
+def insert_ignoring_conflicts(db: AsyncSession, table: Table) -> Insert:
+    """
+    INSERT ... ON CONFLICT DO NOTHING for the dialect the session is bound to.
+    """
+    return dialect_insert(db, table).on_conflict_do_nothing()
+
+
+def upsert(
+    db: AsyncSession,
+    table: Table,
+    index_elements: List[str],
+    values: Dict[str, Any],
+    where: Optional[Callable[[Any], ColumnElement]] = None,
+) -> Insert:
+    """
+    INSERT ... ON CONFLICT DO UPDATE, overwriting the other columns with values.
+
+    `where` is called with the excluded row and returns the condition under
+    which the existing row is overwritten.
+    """
+    statement = dialect_insert(db, table).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={
+            name: statement.excluded[name]
+            for name in values
+            if name not in index_elements
+        },
+        where=where(statement.excluded) if where is not None else None,
+    )
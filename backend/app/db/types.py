@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from sqlalchemy import DateTime
+from sqlalchemy.types import TypeDecorator
+
+
+class UTCDateTime(TypeDecorator):
+    """
+    TIMESTAMP WITHOUT TIME ZONE holding UTC, that also accepts aware datetimes.
+
+    The models default to datetime.now(timezone.utc). psycopg2 binds those by
+    dropping the offset, asyncpg refuses them, so aware values are converted
+    to naive UTC before they reach either driver.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(
+        self, value: Optional[datetime], dialect: Any
+    ) -> Optional[datetime]:
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
@@ -1,13 +1,27 @@
+import asyncio
+import gc
+
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
+from app.core.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+from app.core.ratelimit import RateLimitMiddleware
 from app.api.auth.router import router as auth_router
 from app.api.users.router import router as users_router
 from app.api.payments.router import router as payments_router
 from app.api.blog.router import router as blog_router
 from app.api.projects.router import router as projects_router
+from app.api.internal.router import router as internal_router
+from app.core import firebase_admin
 from app.core.firebase_admin import initialize_firebase_admin
+from app.core.hashing import password_hasher
+from app.core.loop_monitor import loop_monitor
+from app.core.revocation import revocation_list
+from app.core import stripe_client
+from app.db.routing import replica_router
+from app.db.session import replica_engine
 
 # Initialize Firebase Admin SDK
 initialize_firebase_admin()
@@ -18,6 +32,11 @@ app = FastAPI(
     version="0.1.0",
 )
 
+# Rate limiting, added first so the CORS middleware wraps it and 429s carry
+# CORS headers too
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 # CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
@@ -25,11 +44,95 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*", "Authorization", "Content-Type"],
-    expose_headers=["*"],
+    expose_headers=["*", NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
     max_age=600,  # Cache preflight requests for 10 minutes
 )
 
 
+@app.on_event("startup")
+async def configure_threadpool():
+    # Sync pools are sized against this limit, keep them in step
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = settings.THREADPOOL_SIZE
+
+
+@app.on_event("shutdown")
+async def stop_password_hasher():
+    password_hasher.shutdown()
+
+
+@app.on_event("shutdown")
+async def close_stripe_client():
+    await stripe_client.close()
+
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    if settings.LOOP_LAG_MONITOR_ENABLED:
+        app.state.loop_monitor = asyncio.create_task(loop_monitor.run())
+
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    monitor = getattr(app.state, "loop_monitor", None)
+    if monitor is not None:
+        monitor.cancel()
+
+
+@app.on_event("startup")
+async def start_replica_lag_monitor():
+    if replica_engine is not None:
+        app.state.replica_lag_monitor = asyncio.create_task(
+            replica_router.monitor(replica_engine)
+        )
+
+
+@app.on_event("shutdown")
+async def stop_replica_lag_monitor():
+    monitor = getattr(app.state, "replica_lag_monitor", None)
+    if monitor is not None:
+        monitor.cancel()
+
+
+@app.on_event("startup")
+async def start_token_key_refresh():
+    # Preload the signing keys so the first requests don't wait on Google
+    verifier = firebase_admin.token_verifier
+    if verifier is not None:
+        await verifier.load()
+        app.state.token_key_refresh = asyncio.create_task(verifier.keep_fresh())
+
+
+@app.on_event("shutdown")
+async def stop_token_key_refresh():
+    refresh = getattr(app.state, "token_key_refresh", None)
+    if refresh is not None:
+        refresh.cancel()
+
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    # Until the filter is loaded every token check reads revoked_tokens
+    await revocation_list.load()
+    app.state.revocation_sync = asyncio.create_task(revocation_list.keep_synced())
+
+
+@app.on_event("shutdown")
+async def stop_revocation_sync():
+    sync = getattr(app.state, "revocation_sync", None)
+    if sync is not None:
+        sync.cancel()
+
+
+@app.on_event("startup")
+async def freeze_startup_objects():
+    # Last startup hook. Modules, models and caches loaded so far live for the
+    # whole process; moved out of the collected generations, full collections
+    # no longer walk them and stall the loop for 100ms+
+    gc.collect()
+    gc.freeze()
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Webapp Skeleton API"}
@@ -50,6 +153,9 @@ app.include_router(blog_router, prefix=f"{settings.API_V1_STR}/blog", tags=["blo
 app.include_router(
     projects_router, prefix=f"{settings.API_V1_STR}/projects", tags=["projects"]
 )
+app.include_router(
+    internal_router, prefix=f"{settings.API_V1_STR}/internal", tags=["internal"]
+)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class Invoice(BaseModel):
+    id: int
+    stripe_invoice_id: str
+    number: Optional[str] = None
+    status: Optional[str] = None
+    currency: str
+    amount_due: int
+    amount_paid: int
+    hosted_invoice_url: Optional[str] = None
+    invoice_pdf: Optional[str] = None
+    period_start: Optional[datetime] = None
+    period_end: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
@@ -1,7 +1,8 @@
 from datetime import datetime
+from enum import Enum
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class ProjectBase(BaseModel):
@@ -19,10 +20,42 @@ class ProjectUpdate(ProjectBase):
     is_active: Optional[bool] = None
 
 
+class ProjectRole(str, Enum):
+    OWNER = "owner"
+    MEMBER = "member"
+
+
 class ProjectMember(BaseModel):
     user_id: int
 
 
+class ProjectMembersAction(str, Enum):
+    ADD = "add"
+    REMOVE = "remove"
+
+
+class ProjectMembersBatch(BaseModel):
+    action: ProjectMembersAction
+    user_ids: List[int] = Field(..., min_length=1, max_length=5000)
+
+
+class ProjectMemberStatus(str, Enum):
+    ADDED = "added"
+    REMOVED = "removed"
+    ALREADY_MEMBER = "already_member"
+    NOT_MEMBER = "not_member"
+    USER_NOT_FOUND = "user_not_found"
+
+
+class ProjectMemberResult(BaseModel):
+    user_id: int
+    status: ProjectMemberStatus
+
+
+class ProjectMembersBatchResult(BaseModel):
+    results: List[ProjectMemberResult]
+
+
 class ProjectInDBBase(ProjectBase):
     id: int
     owner_id: int
@@ -6,11 +6,28 @@ from pydantic import BaseModel
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    # Also revoke this refresh token and the rest of its family
+    refresh_token: Optional[str] = None
 
 
 class TokenPayload(BaseModel):
     sub: Optional[str] = None
     exp: int
+    iat: Optional[int] = None
+    jti: Optional[str] = None
+    type: Optional[str] = None
+    # User claims of app-issued access tokens
+    su: bool = False
+    email: Optional[str] = None
+    name: Optional[str] = None
 
 
 class TokenData(BaseModel):
@@ -0,0 +1,71 @@
+import argparse
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import stripe
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.invoices import invoice_values, upsert_invoice
+from app.core.stripe_client import install
+from app.db.models.user import User
+from app.db.session import SessionLocal
+
+stripe.api_key = settings.STRIPE_API_KEY
+install()
+
+
+def backfill_invoices(db: Session, batch_size: int) -> int:
+    """
+    Mirror every invoice of a customer linked to a user into invoices.
+
+    Rows are stamped with the time the backfill started, so webhook events
+    delivered meanwhile for newer changes still win. Run it after
+    backfill_stripe_customers; invoices of unlinked customers are skipped.
+    """
+    started = datetime.now(timezone.utc)
+    users = dict(
+        db.query(User.stripe_customer_id, User.id).filter(
+            User.stripe_customer_id.isnot(None)
+        )
+    )
+    print(f"{len(users)} users linked to a Stripe customer")
+
+    stored = skipped = 0
+    for invoice in stripe.Invoice.list(limit=100).auto_paging_iter():
+        user_id = users.get(invoice.customer)
+        if user_id is None:
+            skipped += 1
+            continue
+        db.execute(upsert_invoice(db, invoice_values(invoice, user_id, started)))
+        stored += 1
+        if stored % batch_size == 0:
+            db.commit()
+            print(f"Stored {stored} invoices")
+    db.commit()
+    print(f"Skipped {skipped} invoices of customers without a user")
+    return stored
+
+
+def main() -> None:
+    """Fill the invoices table from Stripe, once, before relying on webhooks."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        stored = backfill_invoices(db, args.batch_size)
+        print(f"Done, {stored} invoices mirrored")
+    except Exception as e:
+        print(f"Error backfilling invoices: {e}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import stripe
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.stripe_client import install
+from app.db.models.user import User
+from app.db.session import SessionLocal
+
+stripe.api_key = settings.STRIPE_API_KEY
+install()
+
+
+def backfill_stripe_customers(db: Session, batch_size: int, dry_run: bool) -> int:
+    """
+    Store the Stripe customer of every user that has none yet.
+
+    Pages through all customers once instead of searching per user. The
+    list is newest first, so a user with several customers gets the newest,
+    as the email search in get_stripe_customer_async picked.
+    """
+    pending: Dict[str, int] = dict(
+        db.query(User.email, User.id).filter(User.stripe_customer_id.is_(None))
+    )
+    taken = {
+        customer_id
+        for (customer_id,) in db.query(User.stripe_customer_id).filter(
+            User.stripe_customer_id.isnot(None)
+        )
+    }
+    print(f"{len(pending)} users without a Stripe customer")
+
+    updates: List[Dict[str, object]] = []
+    stored = 0
+    for customer in stripe.Customer.list(limit=100).auto_paging_iter():
+        if customer.id in taken or customer.email not in pending:
+            continue
+        user_id = pending.pop(customer.email)
+        updates.append({"id": user_id, "stripe_customer_id": customer.id})
+        if len(updates) >= batch_size:
+            stored += store(db, updates, dry_run)
+            updates = []
+        if not pending:
+            break
+    if updates:
+        stored += store(db, updates, dry_run)
+    return stored
+
+
+def store(db: Session, updates: List[Dict[str, object]], dry_run: bool) -> int:
+    if dry_run:
+        for row in updates:
+            print(f"Would set user {row['id']} -> {row['stripe_customer_id']}")
+        return len(updates)
+    # Bulk UPDATE by primary key, one statement per batch
+    db.execute(update(User), updates)
+    db.commit()
+    print(f"Stored {len(updates)} customer IDs")
+    return len(updates)
+
+
+def main() -> None:
+    """Fill users.stripe_customer_id from the customers in Stripe."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        stored = backfill_stripe_customers(db, args.batch_size, args.dry_run)
+        print(f"Done, {stored} users linked to their Stripe customer")
+    except Exception as e:
+        print(f"Error backfilling Stripe customers: {e}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from fastapi import Request
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core import firebase_admin as firebase
+from app.core.dependencies import get_current_user
+from app.core.firebase_admin import FirebaseTokenVerifier, configure_token_verifier
+from app.core.principal import principal_cache
+from app.core.revocation import revocation_list
+from app.core.security import create_user_access_token
+from app.db.lazy import LazySession
+from app.db.models.user import User
+from app.db.session import Base
+from app.scripts.bench_token_verifier import PROJECT_ID, make_tokens
+
+
+async def measure(
+    label: str,
+    Session: async_sessionmaker,
+    tokens: List[str],
+    rounds: int,
+    before_each: Callable[[], None] = lambda: None,
+) -> None:
+    """
+    Run get_current_user on every token for a number of rounds.
+    """
+    request = Request({"type": "http", "headers": [], "client": ("127.0.0.1", 0)})
+    elapsed = 0.0
+    for _ in range(rounds):
+        for token in tokens:
+            before_each()
+            credentials = HTTPAuthorizationCredentials(
+                scheme="Bearer", credentials=token
+            )
+            db = LazySession(Session)
+            started = time.perf_counter()
+            await get_current_user(request, credentials, db)
+            await db.release()
+            elapsed += time.perf_counter() - started
+    calls = rounds * len(tokens)
+    print(f"{label:<36} {elapsed / calls * 1e6:9.1f} us/request  ({calls} calls)")
+
+
+def main() -> None:
+    """Measure per-request authentication cost of app-issued and Firebase tokens."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    key_source, firebase_tokens = make_tokens(args.users)
+    verifier = FirebaseTokenVerifier(PROJECT_ID, key_source)
+    verifier.refresh()
+    configure_token_verifier(verifier)
+
+    database = Path(tempfile.mkdtemp()) / "bench_auth.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    def clear_caches() -> None:
+        firebase.token_cache.clear()
+        principal_cache.clear()
+
+    async def bench() -> None:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with Session() as db:
+            users = [
+                User(
+                    email=f"bench-{i}@example.com",
+                    firebase_uid=f"bench-{i}",
+                    is_active=True,
+                )
+                for i in range(args.users)
+            ]
+            db.add_all(users)
+            await db.commit()
+        app_tokens = [create_user_access_token(user) for user in users]
+        async with Session() as db:
+            # Loaded as at startup, an unloaded list checks every token in the DB
+            await revocation_list.rebuild(db)
+
+        await measure(
+            "app token (HS256, claims only)", Session, app_tokens, args.rounds
+        )
+        await measure(
+            "firebase token, uncached",
+            Session,
+            firebase_tokens,
+            args.rounds,
+            before_each=clear_caches,
+        )
+        clear_caches()
+        await measure("firebase token, cached (first use)", Session, firebase_tokens, 1)
+        await measure(
+            "firebase token, cached (repeat)", Session, firebase_tokens, args.rounds
+        )
+        await engine.dispose()
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, List
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.api.auth.router import router as auth_router
+from app.core.config import settings
+from app.core.dependencies import get_async_db
+from app.core.hashing import password_hasher
+from app.core.security import get_password_hash
+from app.db.models.user import User
+from app.db.session import Base
+
+BENCH_EMAIL = "bench-login@example.com"
+BENCH_PASSWORD = "bench-password"
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[max(int(len(values) * fraction) - 1, 0)] * 1000
+
+
+async def storm(app: FastAPI, logins: int, concurrency: int) -> None:
+    """
+    Fire logins at /auth/login/email while a sync endpoint is probed every 10ms.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    login_latencies: List[float] = []
+    probe_latencies: List[float] = []
+    rejected = 0
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None
+    ) as client:
+
+        async def login() -> None:
+            nonlocal rejected
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    f"{settings.API_V1_STR}/auth/login/email",
+                    json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD},
+                )
+                if response.status_code == 503:
+                    rejected += 1
+                    return
+                response.raise_for_status()
+                login_latencies.append(time.perf_counter() - started)
+
+        async def probe() -> None:
+            while not done.is_set():
+                started = time.perf_counter()
+                (await client.get("/probe")).raise_for_status()
+                probe_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+
+    mode = (
+        f"{password_hasher.workers} processes"
+        if password_hasher.workers
+        else "threadpool"
+    )
+    print(
+        f"{mode:<12} logins {len(login_latencies) / elapsed:6.1f}/s "
+        f"(p50 {percentile(login_latencies, 0.5):7.1f}ms, {rejected} rejected)  "
+        f"probe p50 {statistics.median(probe_latencies) * 1000:6.1f}ms "
+        f"p99 {percentile(probe_latencies, 0.99):7.1f}ms"
+    )
+
+
+def main() -> None:
+    """Compare login throughput and other endpoints' latency during a login storm."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    database = Path(tempfile.mkdtemp()) / "bench_login.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def get_bench_db() -> Any:
+        async with Session() as db:
+            yield db
+
+    app = FastAPI()
+    app.dependency_overrides[get_async_db] = get_bench_db
+    app.include_router(auth_router, prefix=f"{settings.API_V1_STR}/auth")
+
+    @app.get("/probe")
+    def probe() -> dict:
+        # Any sync handler, it needs a threadpool slot to run at all
+        return {"status": "ok"}
+
+    async def bench() -> None:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with Session() as db:
+            db.add(
+                User(
+                    email=BENCH_EMAIL,
+                    hashed_password=get_password_hash(BENCH_PASSWORD),
+                    firebase_uid="bench-login",
+                    is_active=True,
+                )
+            )
+            await db.commit()
+
+        password_hasher.max_pending = args.logins
+        for workers in (0, args.workers):
+            password_hasher.workers = workers
+            await storm(app, args.logins, args.concurrency)
+        password_hasher.shutdown()
+        await engine.dispose()
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
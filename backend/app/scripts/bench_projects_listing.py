@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Generator, List, Tuple
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.core.dependencies import get_async_db, get_current_user, get_read_db
+from app.db.models import Project, User, project_members
+from app.db.session import Base, get_async_database_url
+from app.api.projects.router import router as projects_router
+from app.schemas.project import Project as ProjectSchema
+
+BENCH_EMAIL = "bench-projects@example.com"
+BENCH_OTHER_EMAIL = "bench-projects-other@example.com"
+
+
+def get_or_create_user(db: Session, email: str) -> User:
+    user = db.query(User).filter(User.email == email).first()
+    if not user:
+        user = User(email=email, full_name="Benchmark", is_active=True)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    return user
+
+
+def seed(
+    session_factory: Callable[[], Session], projects: int, memberships: int
+) -> int:
+    """
+    Create the benchmark user, the projects it owns and the projects of
+    another user it is a member of, returning the user id.
+    """
+    db = session_factory()
+    try:
+        user = get_or_create_user(db, BENCH_EMAIL)
+        other = get_or_create_user(db, BENCH_OTHER_EMAIL)
+
+        existing = db.query(Project).filter(Project.owner_id == user.id).count()
+        db.add_all(
+            Project(name=f"bench-{i}", owner_id=user.id)
+            for i in range(existing, projects)
+        )
+
+        existing = db.query(Project).filter(Project.owner_id == other.id).count()
+        shared = [
+            Project(name=f"bench-shared-{i}", owner_id=other.id)
+            for i in range(existing, memberships)
+        ]
+        db.add_all(shared)
+        db.flush()
+        if shared:
+            db.execute(
+                project_members.insert(),
+                [{"project_id": p.id, "user_id": user.id} for p in shared],
+            )
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def build_app(database_url: str, user_id: int) -> Tuple[FastAPI, AsyncEngine]:
+    """
+    Mount the async projects router next to a sync twin of the same listing.
+    """
+    sync_engine = create_engine(database_url)
+    SyncSession = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
+    async_engine = create_async_engine(get_async_database_url(database_url))
+    AsyncSession = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+    bench_user = SimpleNamespace(id=user_id, is_superuser=False)
+
+    def get_sync_db() -> Generator:
+        db = SyncSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_bench_async_db() -> Any:
+        async with AsyncSession() as db:
+            yield db
+
+    app = FastAPI()
+    app.dependency_overrides[get_async_db] = get_bench_async_db
+    app.dependency_overrides[get_read_db] = get_bench_async_db
+    app.dependency_overrides[get_current_user] = lambda: bench_user
+    app.include_router(projects_router, prefix=f"{settings.API_V1_STR}/projects")
+
+    @app.get("/sync/projects/", response_model=List[ProjectSchema])
+    def read_projects_sync(
+        db: Session = Depends(get_sync_db), skip: int = 0, limit: int = 100
+    ) -> Any:
+        owned_projects = db.query(Project).filter(Project.owner_id == user_id).all()
+        member_projects = (
+            db.query(Project)
+            .join(project_members)
+            .filter(project_members.c.user_id == user_id)
+            .all()
+        )
+        all_projects = list(
+            {p.id: p for p in owned_projects + member_projects}.values()
+        )
+        return all_projects[skip : skip + limit]
+
+    return app, async_engine
+
+
+async def run(app: FastAPI, path: str, total: int, concurrency: int) -> None:
+    """Fire ``total`` requests at ``path`` and print throughput and latency."""
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def one() -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(
+        f"{path:<40} {total / elapsed:8.1f} req/s  "
+        f"p50={statistics.median(latencies) * 1000:6.1f}ms  "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:6.1f}ms"
+    )
+
+
+def main() -> None:
+    """
+    Compare GET /projects/ on the sync twin, which dedups and slices in Python,
+    with the single-query async listing, with and without the total count.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--database-url", default=str(settings.SQLALCHEMY_DATABASE_URI))
+    parser.add_argument("--projects", type=int, default=100)
+    parser.add_argument("--memberships", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine)
+    user_id = seed(sessionmaker(bind=engine), args.projects, args.memberships)
+    engine.dispose()
+
+    app, async_engine = build_app(args.database_url, user_id)
+
+    async def bench() -> None:
+        listing = f"{settings.API_V1_STR}/projects/"
+        for path in (
+            "/sync/projects/",
+            listing,
+            f"{listing}?with_total=true",
+            f"{listing}?role=member",
+        ):
+            await run(app, path, args.requests, args.concurrency)
+        await async_engine.dispose()
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
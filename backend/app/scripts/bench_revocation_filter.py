@@ -0,0 +1,59 @@
+import argparse
+import secrets
+import sys
+import time
+from pathlib import Path
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.core.bloom import BloomFilter
+
+
+def sizing(capacity: int) -> None:
+    print(f"Sizing for {capacity:,} revocations:")
+    for error_rate in (0.01, 0.001, 0.0001):
+        bloom = BloomFilter(capacity, error_rate)
+        print(
+            f"  error rate {error_rate:<7} {len(bloom._bits) / 2**20:8.1f} MiB  "
+            f"{bloom.hash_count:>2} hashes"
+        )
+    # A set of str jtis: ~22 chars of token_urlsafe(16) each, plus set slots
+    sample = {secrets.token_urlsafe(16) for _ in range(10_000)}
+    per_key = sys.getsizeof(sample) / len(sample) + sys.getsizeof(next(iter(sample)))
+    print(f"  exact set of jtis    {per_key * capacity / 2**20:8.1f} MiB (estimated)")
+
+
+def main() -> None:
+    """Measure the revocation Bloom filter's false positive rate and lookup cost."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--revoked", type=int, default=1_000_000)
+    parser.add_argument("--probes", type=int, default=1_000_000)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--sizing", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    sizing(args.sizing)
+
+    bloom = BloomFilter(args.revoked, args.error_rate)
+    started = time.perf_counter()
+    bloom.update(secrets.token_urlsafe(16) for _ in range(args.revoked))
+    print(
+        f"\nBuilt with {args.revoked:,} jtis in {time.perf_counter() - started:.1f}s, "
+        f"{len(bloom._bits) / 2**20:.1f} MiB"
+    )
+
+    # Tokens that were never revoked, what nearly every request carries
+    probes = [secrets.token_urlsafe(16) for _ in range(args.probes)]
+    started = time.perf_counter()
+    false_positives = sum(1 for jti in probes if jti in bloom)
+    elapsed = time.perf_counter() - started
+    print(
+        f"False positives {false_positives:,}/{args.probes:,} = "
+        f"{false_positives / args.probes:.4%} (target {args.error_rate:.4%}), "
+        f"{elapsed / args.probes * 1e6:.2f} us/lookup"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, AsyncGenerator, Awaitable, Callable, List
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import anyio
+import httpx
+import stripe
+import uvicorn
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app.api.payments.router import router as payments_router
+from app.core import stripe_client
+from app.core.config import settings
+from app.core.dependencies import get_async_db, get_read_db
+from app.core.loop_monitor import LoopLagMonitor
+from app.core.security import create_user_access_token
+from app.core.stripe import create_checkout_session, create_checkout_session_async
+from app.db.lazy import LazySession
+from app.db.models.subscription import SubscriptionPlan
+from app.db.models.user import User
+from app.db.session import Base
+
+BENCH_PRICE = "price_bench"
+
+
+def serve_stand_in(port: int, latency: float) -> None:
+    """
+    A Stripe API stand-in answering checkout sessions after `latency` seconds.
+    """
+
+    async def checkout_session(request: Request) -> JSONResponse:
+        await asyncio.sleep(latency)
+        return JSONResponse(
+            {
+                "id": "cs_bench",
+                "object": "checkout.session",
+                "url": "https://checkout.stripe.com/c/pay/cs_bench",
+            }
+        )
+
+    app = Starlette(
+        routes=[Route("/v1/checkout/sessions", checkout_session, methods=["POST"])]
+    )
+    uvicorn.run(
+        app, host="127.0.0.1", port=port, log_level="warning", timeout_keep_alive=60
+    )
+
+
+def start_stand_in(latency: float) -> multiprocessing.Process:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # Its own process, so serving doesn't compete for this one's GIL
+    process = multiprocessing.Process(
+        target=serve_stand_in, args=(port, latency), daemon=True
+    )
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    stripe.api_base = f"http://127.0.0.1:{port}"
+    stripe.api_key = "sk_test_bench"
+    return process
+
+
+async def measure(
+    label: str, call: Callable[[], Awaitable[Any]], requests: int, concurrency: int
+) -> None:
+    """
+    Run `requests` calls, `concurrency` at a time, and print their throughput,
+    latency and the worst event loop lag seen meanwhile.
+    """
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+    monitor_task = asyncio.create_task(monitor.run())
+    remaining = iter(range(requests))
+    latencies: List[float] = []
+
+    async def client() -> None:
+        for _ in remaining:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    monitor_task.cancel()
+    latencies.sort()
+    print(
+        f"{label:<28} {concurrency:>5} {requests / elapsed:>9.0f}/s "
+        f"{statistics.median(latencies) * 1000:>9.0f} ms "
+        f"{latencies[int(len(latencies) * 0.99)] * 1000:>9.0f} ms "
+        f"{monitor.max_lag * 1000:>9.1f} ms"
+    )
+
+
+def main() -> None:
+    """Compare checkout throughput through the threadpool and the async client."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--stripe-latency-ms", type=float, default=200.0)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[40, 100, 200])
+    args = parser.parse_args()
+
+    # Per-request INFO lines from stripe and httpx would dominate the CPU time,
+    # and the stall stacks the output
+    for name in ("stripe", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    logging.getLogger("app.core.loop_monitor").setLevel(logging.ERROR)
+
+    database = Path(tempfile.mkdtemp()) / "bench_checkout.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def get_bench_db() -> AsyncGenerator:
+        db = LazySession(Session)
+        try:
+            yield db
+        finally:
+            await db.release()
+
+    app = FastAPI()
+    app.dependency_overrides[get_async_db] = get_bench_db
+    app.dependency_overrides[get_read_db] = get_bench_db
+    app.include_router(payments_router, prefix=f"{settings.API_V1_STR}/payments")
+
+    async def bench() -> None:
+        stand_in = start_stand_in(args.stripe_latency_ms / 1000)
+        # As the app's startup hook does
+        anyio.to_thread.current_default_thread_limiter().total_tokens = (
+            settings.THREADPOOL_SIZE
+        )
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with Session() as db:
+            user = User(
+                email="bench-checkout@example.com",
+                firebase_uid="bench-checkout",
+                stripe_customer_id="cus_bench",
+                is_active=True,
+            )
+            plan = SubscriptionPlan(
+                name="Bench", price=1000, interval="month", stripe_price_id=BENCH_PRICE
+            )
+            db.add_all([user, plan])
+            await db.commit()
+            token = create_user_access_token(user)
+            plan_id = plan.id
+
+        session_args = {
+            "customer_id": "cus_bench",
+            "price_id": BENCH_PRICE,
+            "success_url": f"{settings.FRONTEND_URL}/dashboard",
+            "cancel_url": f"{settings.FRONTEND_URL}/dashboard",
+        }
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench",
+            headers={"Authorization": f"Bearer {token}"},
+        ) as client:
+
+            async def threadpool() -> None:
+                await run_in_threadpool(create_checkout_session, **session_args)
+
+            async def native() -> None:
+                await create_checkout_session_async(**session_args)
+
+            async def endpoint() -> None:
+                response = await client.post(
+                    f"{settings.API_V1_STR}/payments/create-checkout-session/{plan_id}"
+                )
+                response.raise_for_status()
+
+            # Open the connections before measuring
+            for _ in range(2):
+                await asyncio.gather(
+                    *(native() for _ in range(settings.STRIPE_ASYNC_MAX_CONNECTIONS))
+                )
+                await asyncio.gather(
+                    *(threadpool() for _ in range(settings.THREADPOOL_SIZE))
+                )
+
+            print(
+                f"Stripe stand-in latency {args.stripe_latency_ms:.0f} ms, "
+                f"threadpool {settings.THREADPOOL_SIZE} threads, async client "
+                f"{settings.STRIPE_ASYNC_MAX_CONNECTIONS} connections\n"
+            )
+            print(
+                f"{'':<28} {'conc':>5} {'throughput':>11} {'p50':>12} "
+                f"{'p99':>12} {'loop lag':>12}"
+            )
+            for concurrency in args.concurrency:
+                for label, call in [
+                    ("create_checkout_session", threadpool),
+                    ("create_checkout_session_async", native),
+                    ("POST create-checkout-session", endpoint),
+                ]:
+                    await measure(label, call, args.requests, concurrency)
+
+        print(f"\nStripe circuit: {stripe_client.stats()['circuit']}")
+        await stripe_client.close()
+        await engine.dispose()
+        stand_in.terminate()
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
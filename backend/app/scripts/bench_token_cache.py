@@ -0,0 +1,85 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from firebase_admin import auth
+from jose import jwt
+
+from app.core import firebase_admin as firebase
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+
+def make_signer() -> Callable[[str], str]:
+    """
+    Return a function issuing Firebase-shaped ID tokens signed with a fresh
+    RSA key, and point the SDK's verify_id_token at that key.
+
+    Firebase itself can't be reached from a benchmark, so the SDK call is
+    replaced by an RS256 verification of the same cost minus the cert fetch.
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+    def sign(uid: str) -> str:
+        now = int(time.time())
+        claims = {"uid": uid, "sub": uid, "email": f"{uid}@example.com"}
+        claims.update(iat=now, exp=now + 3600, aud="bench")
+        return jwt.encode(claims, private_pem, algorithm="RS256")
+
+    def verify_id_token(token: str) -> dict:
+        return jwt.decode(token, public_pem, algorithms=["RS256"], audience="bench")
+
+    auth.verify_id_token = verify_id_token
+    return sign
+
+
+def measure(label: str, tokens: List[str], rounds: int) -> None:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            firebase.verify_firebase_token(token)
+    elapsed = time.perf_counter() - started
+    calls = rounds * len(tokens)
+    print(f"{label:<28} {elapsed / calls * 1e6:9.1f} us/request  ({calls} calls)")
+
+
+def main() -> None:
+    """Measure per-request token verification cost with and without the cache."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    sign = make_signer()
+    tokens = [sign(f"bench-{i}") for i in range(args.users)]
+
+    # A zero-sized cache keeps nothing, which is verification on every request
+    firebase.token_cache = TTLCache(maxsize=0, ttl=0)
+    measure("uncached", tokens, args.rounds)
+
+    firebase.token_cache = TTLCache(
+        maxsize=settings.FIREBASE_TOKEN_CACHE_SIZE,
+        ttl=settings.FIREBASE_TOKEN_CACHE_TTL,
+    )
+    measure("cached (first use)", tokens, 1)
+    measure("cached (repeat requests)", tokens, args.rounds)
+    print(firebase.token_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from app.core.firebase_admin import FirebaseTokenVerifier, StaticKeySource
+
+PROJECT_ID = "bench-project"
+
+
+def make_tokens(count: int) -> Tuple[StaticKeySource, List[str]]:
+    """
+    Sign Firebase-shaped ID tokens with two locally generated RSA keys.
+    """
+    public_keys = {}
+    tokens = []
+    private_keys = []
+    for kid in ("bench-key-1", "bench-key-2"):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        private_keys.append((kid, key))
+        public_keys[kid] = (
+            key.public_key()
+            .public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            )
+            .decode()
+        )
+
+    now = int(time.time())
+    for i in range(count):
+        kid, key = private_keys[i % len(private_keys)]
+        claims = {
+            "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+            "aud": PROJECT_ID,
+            "sub": f"bench-{i}",
+            "auth_time": now,
+            "iat": now,
+            "exp": now + 3600,
+        }
+        pem = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        tokens.append(jwt.encode(claims, pem, algorithm="RS256", headers={"kid": kid}))
+    return StaticKeySource(public_keys), tokens
+
+
+def verify_for(args: Tuple[StaticKeySource, List[str], float]) -> int:
+    """Verify tokens round-robin for a fixed time, returning how many were done."""
+    key_source, tokens, seconds = args
+    verifier = FirebaseTokenVerifier(PROJECT_ID, key_source)
+    verifier.refresh()
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        verifier.verify(tokens[done % len(tokens)])
+        done += 1
+    return done
+
+
+def main() -> None:
+    """Measure local ID token verification throughput per core."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    key_source, tokens = make_tokens(args.tokens)
+
+    for processes in sorted({1, args.processes}):
+        with multiprocessing.Pool(processes) as pool:
+            counts = pool.map(
+                verify_for, [(key_source, tokens, args.seconds)] * processes
+            )
+        total = sum(counts) / args.seconds
+        print(
+            f"{processes:>3} process(es): {total:10.0f} tokens/s  "
+            f"{total / processes:8.0f} tokens/s per core  "
+            f"{1e6 * processes / total:7.1f} us/token"
+        )
+
+
+if __name__ == "__main__":
+    main()
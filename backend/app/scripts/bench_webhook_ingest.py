@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, List, Tuple
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.api.payments.router import router as payments_router
+from app.core.config import settings
+from app.core.dependencies import get_async_db
+from app.db.lazy import LazySession
+from app.db.models import (
+    StripeEvent,
+    Subscription,
+    SubscriptionPlan,
+    SubscriptionStatus,
+    User,
+)
+from app.db.session import Base, get_async_database_url
+from app.workers.stripe_events import claim_events, process_events
+
+BENCH_PREFIX = "bench-ingest-"
+WEBHOOK_SECRET = "whsec_bench_ingest"
+
+
+def sign(payload: bytes) -> str:
+    timestamp = int(time.time())
+    signature = hmac.new(
+        WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def generate_events(count: int, subscriptions: int) -> List[Dict[str, Any]]:
+    """
+    A renewal-like burst: subscription updates and paid invoices spread over
+    the subscriptions, each newer than the last.
+    """
+    started = int(time.time()) - count
+    events = []
+    for i in range(count):
+        sub_id = f"sub_{BENCH_PREFIX}{random.randrange(subscriptions)}"
+        created = started + i
+        if i % 3:
+            data = {
+                "id": sub_id,
+                "object": "subscription",
+                "customer": f"cus_{BENCH_PREFIX}",
+                "status": "active",
+                "current_period_start": created,
+                "current_period_end": created + 30 * 86400,
+                "cancel_at_period_end": False,
+            }
+            event_type = "customer.subscription.updated"
+        else:
+            data = {
+                "id": f"in_{BENCH_PREFIX}{i}",
+                "object": "invoice",
+                "customer": f"cus_{BENCH_PREFIX}",
+                "subscription": sub_id,
+                "status": "paid",
+                "currency": "usd",
+                "amount_due": 1000,
+                "amount_paid": 1000,
+                "created": created,
+            }
+            event_type = "invoice.payment_succeeded"
+        events.append(
+            {
+                "id": f"evt_{BENCH_PREFIX}{i}",
+                "object": "event",
+                "type": event_type,
+                "created": created,
+                "data": {"object": data},
+            }
+        )
+    return events
+
+
+async def ingest(
+    app: FastAPI, bodies: List[bytes], concurrency: int
+) -> Tuple[float, List[float]]:
+    """
+    POST every body to the webhook endpoint, returning wall time and latencies.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+    latencies: List[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+
+        async def sender() -> None:
+            while not queue.empty():
+                body = queue.get_nowait()
+                started = time.perf_counter()
+                response = await c.post(
+                    f"{settings.API_V1_STR}/payments/webhook",
+                    content=body,
+                    headers={"stripe-signature": sign(body)},
+                )
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies
+
+
+def main() -> None:
+    """Measure webhook ingest throughput into stripe_events and worker drain rate."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--database-url", default=str(settings.SQLALCHEMY_DATABASE_URI))
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--subscriptions", type=int, default=200)
+    parser.add_argument("--duplicates", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=settings.STRIPE_EVENT_WORKERS)
+    args = parser.parse_args()
+
+    settings.STRIPE_WEBHOOK_SECRET = WEBHOOK_SECRET
+    engine = create_async_engine(
+        get_async_database_url(args.database_url), pool_size=args.concurrency
+    )
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    subscription_writes = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_subscription_writes(conn, cursor, statement, *args) -> None:
+        if statement.startswith("UPDATE subscriptions"):
+            subscription_writes.append(statement)
+
+    async def get_bench_db() -> AsyncGenerator:
+        db = LazySession(Session)
+        try:
+            yield db
+        finally:
+            await db.release()
+
+    app = FastAPI()
+    app.dependency_overrides[get_async_db] = get_bench_db
+    app.include_router(payments_router, prefix=f"{settings.API_V1_STR}/payments")
+
+    async def cleanup() -> None:
+        async with Session() as db:
+            await db.execute(
+                delete(StripeEvent).where(StripeEvent.id.like(f"evt_{BENCH_PREFIX}%"))
+            )
+            await db.execute(
+                delete(Subscription).where(
+                    Subscription.stripe_subscription_id.like(f"sub_{BENCH_PREFIX}%")
+                )
+            )
+            await db.execute(
+                delete(SubscriptionPlan).where(SubscriptionPlan.name == BENCH_PREFIX)
+            )
+            await db.execute(delete(User).where(User.email.like(f"{BENCH_PREFIX}%")))
+            await db.commit()
+
+    async def bench() -> None:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        await cleanup()
+        async with Session() as db:
+            user = User(email=f"{BENCH_PREFIX}user@example.com", is_active=True)
+            plan = SubscriptionPlan(name=BENCH_PREFIX, price=1000, interval="month")
+            db.add_all([user, plan])
+            await db.flush()
+            db.add_all(
+                Subscription(
+                    user_id=user.id,
+                    plan_id=plan.id,
+                    status=SubscriptionStatus.PAST_DUE,
+                    stripe_subscription_id=f"sub_{BENCH_PREFIX}{i}",
+                )
+                for i in range(args.subscriptions)
+            )
+            await db.commit()
+
+        events = generate_events(args.events, args.subscriptions)
+        bodies = [json.dumps(event).encode() for event in events]
+        redelivered = random.sample(bodies, int(len(bodies) * args.duplicates))
+        bodies += redelivered
+        random.shuffle(bodies)
+
+        elapsed, latencies = await ingest(app, bodies, args.concurrency)
+        latencies.sort()
+        async with Session() as db:
+            stored = await db.scalar(
+                select(func.count()).where(StripeEvent.id.like(f"evt_{BENCH_PREFIX}%"))
+            )
+        print(
+            f"Ingest: {len(bodies)} webhooks ({len(redelivered)} redelivered) in "
+            f"{elapsed:.2f}s = {len(bodies) / elapsed:.0f}/s, "
+            f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, "
+            f"{stored} events stored"
+        )
+
+        async def drain() -> int:
+            processed = 0
+            async with Session() as db:
+                while True:
+                    claimed = await claim_events(db, settings.STRIPE_EVENT_BATCH_SIZE)
+                    if not claimed:
+                        pending = await db.scalar(
+                            select(func.count()).where(
+                                StripeEvent.processed_at.is_(None)
+                            )
+                        )
+                        await db.commit()
+                        if not pending:
+                            return processed
+                        # Left are events of subscriptions other workers hold,
+                        # or still inside the coalescing window
+                        await asyncio.sleep(0.01)
+                        continue
+                    for event_ids, attempts in claimed:
+                        await process_events(db, event_ids, attempts)
+                        processed += len(event_ids)
+
+        subscription_writes.clear()
+        started = time.perf_counter()
+        counts = await asyncio.gather(*(drain() for _ in range(args.workers)))
+        elapsed = time.perf_counter() - started
+        print(
+            f"Drain: {sum(counts)} events by {args.workers} workers in "
+            f"{elapsed:.2f}s = {sum(counts) / elapsed:.0f}/s, "
+            f"{len(subscription_writes)} subscription updates"
+        )
+
+        # Applied in order, every subscription ends at its newest update
+        newest: Dict[str, int] = {}
+        for event in events:
+            data = event["data"]["object"]
+            if data["object"] == "subscription":
+                newest[data["id"]] = max(
+                    newest.get(data["id"], 0), data["current_period_end"]
+                )
+        async with Session() as db:
+            result = await db.execute(
+                select(
+                    Subscription.stripe_subscription_id,
+                    Subscription.current_period_end,
+                ).where(Subscription.stripe_subscription_id.in_(list(newest)))
+            )
+            current = dict(result.all())
+        in_order = sum(
+            1
+            for sub_id, end in newest.items()
+            if current.get(sub_id) == datetime.fromtimestamp(end)
+        )
+        print(f"Subscriptions at their newest update: {in_order}/{len(newest)}")
+
+        await cleanup()
+        await engine.dispose()
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
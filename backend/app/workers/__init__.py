@@ -0,0 +1 @@
+# Background workers, each runnable with python -m app.workers.<name>
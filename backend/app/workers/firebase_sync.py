@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.firebase_admin import (
+    get_firebase_user_by_email,
+    import_firebase_user,
+    initialize_firebase_admin,
+)
+from app.db.models.firebase_sync import FirebaseSyncJob
+from app.db.models.user import User
+from app.db.session import AsyncSessionLocal
+from app.db.statements import insert_ignoring_conflicts
+
+logger = logging.getLogger(__name__)
+
+
+async def enqueue_firebase_sync(db: AsyncSession, user_id: int) -> None:
+    """
+    Queue a user for Firebase sync, a no-op if they are already queued.
+
+    The caller commits.
+    """
+    await db.execute(
+        insert_ignoring_conflicts(db, FirebaseSyncJob.__table__).values(
+            user_id=user_id,
+            attempts=0,
+            next_attempt_at=datetime.now(timezone.utc),
+        )
+    )
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """
+    Exponential backoff after the given number of attempts, capped.
+    """
+    seconds = settings.FIREBASE_SYNC_RETRY_BASE * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, settings.FIREBASE_SYNC_RETRY_MAX))
+
+
+def firebase_uid_for(user: User) -> str:
+    """
+    Link to the Firebase account with the user's email, or import one.
+
+    Imported accounts get a uid derived from our id, so a retry after a lost
+    response overwrites the same account instead of creating a second one.
+    Blocking, run it in the threadpool.
+    """
+    firebase_user = get_firebase_user_by_email(user.email)
+    if firebase_user:
+        return firebase_user.uid
+    return import_firebase_user(
+        uid=f"app-user-{user.id}",
+        email=user.email,
+        password_hash=user.hashed_password,
+        display_name=user.full_name,
+    )
+
+
+async def claim_jobs(db: AsyncSession, limit: int) -> List[int]:
+    """
+    Take up to limit due jobs and push their next attempt out.
+
+    Rows locked by another worker are skipped. The claim is committed before
+    any Firebase call, so a worker that dies mid-job only delays it until the
+    backoff runs out.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(FirebaseSyncJob)
+        .where(FirebaseSyncJob.next_attempt_at <= now)
+        .order_by(FirebaseSyncJob.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    jobs = result.scalars().all()
+    for job in jobs:
+        job.attempts += 1
+        job.next_attempt_at = now + retry_delay(job.attempts)
+    user_ids = [job.user_id for job in jobs]
+    await db.commit()
+    return user_ids
+
+
+async def sync_user(db: AsyncSession, user_id: int) -> None:
+    """
+    Give one user a firebase_uid and drop their job, or record why not.
+    """
+    error: Optional[str] = None
+    user = await db.get(User, user_id)
+    if user is not None and not user.firebase_uid:
+        try:
+            user.firebase_uid = await run_in_threadpool(firebase_uid_for, user)
+            await db.flush()
+        except (ValueError, IntegrityError) as e:
+            await db.rollback()
+            error = str(e)
+
+    if error is None:
+        await db.execute(
+            delete(FirebaseSyncJob).where(FirebaseSyncJob.user_id == user_id)
+        )
+    else:
+        logger.warning(f"Firebase sync failed for user {user_id}: {error}")
+        await db.execute(
+            update(FirebaseSyncJob)
+            .where(FirebaseSyncJob.user_id == user_id)
+            .values(last_error=error)
+        )
+    await db.commit()
+
+
+async def run_once(batch_size: int) -> int:
+    """
+    Process one batch of due jobs, returning how many were claimed.
+    """
+    async with AsyncSessionLocal() as db:
+        user_ids = await claim_jobs(db, batch_size)
+        for user_id in user_ids:
+            await sync_user(db, user_id)
+    return len(user_ids)
+
+
+async def run() -> None:
+    """
+    Work through due jobs forever, polling when the queue is drained.
+    """
+    while True:
+        try:
+            claimed = await run_once(settings.FIREBASE_SYNC_BATCH_SIZE)
+        except Exception:
+            logger.exception("Firebase sync batch failed")
+            claimed = 0
+        if claimed < settings.FIREBASE_SYNC_BATCH_SIZE:
+            await asyncio.sleep(settings.FIREBASE_SYNC_POLL_INTERVAL)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    initialize_firebase_admin()
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
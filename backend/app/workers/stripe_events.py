@@ -0,0 +1,487 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import stripe
+from sqlalchemy import delete, exists, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.invoices import delete_invoice, record_invoice
+from app.core.stripe import cancel_subscription_async, get_customer_async
+from app.db.models.stripe_event import StripeEvent
+from app.db.models.subscription import (
+    Subscription,
+    SubscriptionPlan,
+    SubscriptionStatus,
+)
+from app.db.models.user import User
+from app.db.session import AsyncSessionLocal
+from app.db.statements import insert_ignoring_conflicts
+
+logger = logging.getLogger(__name__)
+
+
+def event_subscription_id(event: stripe.Event) -> Optional[str]:
+    """
+    The Stripe subscription an event is about, for ordering.
+    """
+    data = event.data.object
+    if data.get("object") == "subscription":
+        return data.get("id")
+    if data.get("object") == "invoice":
+        return data.get("subscription")
+    return None
+
+
+async def enqueue_stripe_event(
+    db: AsyncSession, event: stripe.Event, payload: bytes
+) -> None:
+    """
+    Store a verified event for the workers, a no-op for a redelivery.
+
+    The caller commits.
+    """
+    now = datetime.now(timezone.utc)
+    await db.execute(
+        insert_ignoring_conflicts(db, StripeEvent.__table__).values(
+            id=event.id,
+            type=event.type,
+            stripe_subscription_id=event_subscription_id(event),
+            stripe_created_at=datetime.fromtimestamp(event.created, tz=timezone.utc),
+            received_at=now,
+            payload=payload.decode(),
+            attempts=0,
+            next_attempt_at=now,
+        )
+    )
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """
+    Exponential backoff after the given number of attempts, capped.
+    """
+    seconds = settings.STRIPE_EVENT_RETRY_BASE * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, settings.STRIPE_EVENT_RETRY_MAX))
+
+
+async def claim_events(db: AsyncSession, limit: int) -> List[Tuple[List[str], int]]:
+    """
+    Take up to limit due batches of events and lease them for
+    STRIPE_EVENT_LEASE, returning each batch's event ids, oldest first, and
+    attempt number.
+
+    Only the oldest pending event of each subscription can be taken, once it
+    has waited STRIPE_EVENT_COALESCE_WINDOW, and it's taken together with all
+    later pending events of the subscription. A burst is applied at once and
+    a subscription's events are applied in order, whichever worker gets
+    them. Events of no subscription are batches of their own. Rows locked by
+    another worker are skipped. The claim is committed before processing, so
+    a worker that dies mid-batch only delays it until the lease runs out.
+    """
+    now = datetime.now(timezone.utc)
+    settled = now - timedelta(seconds=settings.STRIPE_EVENT_COALESCE_WINDOW)
+    order = (StripeEvent.stripe_created_at, StripeEvent.received_at)
+    earlier = aliased(StripeEvent)
+    result = await db.execute(
+        select(StripeEvent)
+        .where(
+            StripeEvent.processed_at.is_(None),
+            StripeEvent.next_attempt_at <= now,
+            or_(
+                StripeEvent.stripe_subscription_id.is_(None),
+                StripeEvent.received_at <= settled,
+            ),
+            ~exists().where(
+                earlier.stripe_subscription_id == StripeEvent.stripe_subscription_id,
+                earlier.processed_at.is_(None),
+                tuple_(earlier.stripe_created_at, earlier.received_at) < tuple_(*order),
+            ),
+        )
+        .order_by(*order)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    batches = {event.id: [event] for event in result.scalars().all()}
+    heads = {
+        batch[0].stripe_subscription_id: batch
+        for batch in batches.values()
+        if batch[0].stripe_subscription_id
+    }
+    if heads:
+        result = await db.execute(
+            select(StripeEvent)
+            .where(
+                StripeEvent.processed_at.is_(None),
+                StripeEvent.stripe_subscription_id.in_(list(heads)),
+                StripeEvent.id.notin_(list(batches)),
+            )
+            .order_by(*order)
+            .with_for_update(skip_locked=True)
+        )
+        for event in result.scalars().all():
+            heads[event.stripe_subscription_id].append(event)
+
+    claimed = []
+    # Not the retry backoff: no other worker may take a batch still being applied
+    lease_end = now + timedelta(seconds=settings.STRIPE_EVENT_LEASE)
+    for batch in batches.values():
+        attempts = max(event.attempts for event in batch) + 1
+        for event in batch:
+            event.attempts = attempts
+            event.next_attempt_at = lease_end
+        claimed.append(([event.id for event in batch], attempts))
+    await db.commit()
+    return claimed
+
+
+# Stripe subscription statuses kept in subscriptions, others leave it as is
+SUBSCRIPTION_STATUSES = {
+    "active": SubscriptionStatus.ACTIVE,
+    "past_due": SubscriptionStatus.PAST_DUE,
+    "unpaid": SubscriptionStatus.UNPAID,
+    "canceled": SubscriptionStatus.CANCELED,
+}
+
+# Invoice events that move their subscription's status
+PAYMENT_STATUSES = {
+    "invoice.payment_succeeded": SubscriptionStatus.ACTIVE,
+    "invoice.payment_failed": SubscriptionStatus.PAST_DUE,
+}
+
+
+def changes_invoice(event: stripe.Event) -> bool:
+    # Upcoming invoices don't exist yet
+    return event.type.startswith("invoice.") and event.type != "invoice.upcoming"
+
+
+async def subscription_created(db: AsyncSession, event: stripe.Event) -> None:
+    subscription_data = event.data.object
+    logger.info(f"Processing new subscription: {subscription_data.id}")
+
+    # Already recorded by /subscribe, or by an earlier attempt at this event
+    result = await db.execute(
+        select(Subscription.id).where(
+            Subscription.stripe_subscription_id == subscription_data.id
+        )
+    )
+    if result.scalar() is not None:
+        return
+
+    # Find the user by their stored Stripe customer ID
+    customer_id = subscription_data.customer
+    result = await db.execute(
+        select(User).where(User.stripe_customer_id == customer_id)
+    )
+    user = result.scalars().first()
+    if not user:
+        # Customers not stored yet: match the customer's email once
+        customer = await get_customer_async(customer_id)
+        logger.info(f"Retrieved customer: {customer.email}")
+        result = await db.execute(select(User).where(User.email == customer.email))
+        user = result.scalars().first()
+        if not user:
+            logger.error(f"User not found for email: {customer.email}")
+            return
+        if not user.stripe_customer_id:
+            user.stripe_customer_id = customer_id
+
+    # Cancel any existing active subscriptions
+    result = await db.execute(
+        select(Subscription).where(
+            Subscription.user_id == user.id,
+            Subscription.status == SubscriptionStatus.ACTIVE,
+        )
+    )
+    for existing_sub in result.scalars().all():
+        if existing_sub.stripe_subscription_id:
+            try:
+                # Cancel in Stripe
+                await cancel_subscription_async(existing_sub.stripe_subscription_id)
+            except Exception as e:
+                logger.error(f"Error canceling Stripe subscription: {str(e)}")
+
+        # Update in database
+        existing_sub.status = SubscriptionStatus.CANCELED
+        existing_sub.cancel_at_period_end = True
+
+    # Get the price ID from the subscription items
+    subscription_items = subscription_data.get("items", {})
+    if not subscription_items or not subscription_items.get("data"):
+        logger.error("No subscription items found")
+        return
+
+    price_id = subscription_items["data"][0]["price"]["id"]
+    logger.info(f"Retrieved price ID from subscription: {price_id}")
+
+    # Find the plan by Stripe Price ID
+    result = await db.execute(
+        select(SubscriptionPlan).where(SubscriptionPlan.stripe_price_id == price_id)
+    )
+    plan = result.scalars().first()
+    if not plan:
+        logger.error(f"Plan not found for price_id: {price_id}")
+        return
+
+    db.add(
+        Subscription(
+            user_id=user.id,
+            plan_id=plan.id,
+            status=(
+                SubscriptionStatus.ACTIVE
+                if subscription_data.status == "active"
+                else SubscriptionStatus.UNPAID
+            ),
+            stripe_subscription_id=subscription_data.id,
+            current_period_start=datetime.fromtimestamp(
+                subscription_data.current_period_start
+            ),
+            current_period_end=datetime.fromtimestamp(
+                subscription_data.current_period_end
+            ),
+            cancel_at_period_end=subscription_data.cancel_at_period_end,
+        )
+    )
+    logger.info(f"Created new subscription in database for user {user.id}")
+
+
+async def mirror_invoice(db: AsyncSession, event: stripe.Event) -> None:
+    # Keep the invoices mirror current
+    if event.type == "invoice.deleted":
+        await delete_invoice(db, event.data.object.id)
+    else:
+        await record_invoice(
+            db,
+            event.data.object,
+            datetime.fromtimestamp(event.created, tz=timezone.utc),
+        )
+
+
+async def update_subscription(
+    db: AsyncSession,
+    stripe_subscription_id: str,
+    snapshot: Optional[stripe.Event],
+    payment: Optional[stripe.Event],
+) -> None:
+    """
+    Write the newest state of a subscription in one UPDATE, from its newest
+    customer.subscription.* event, which carries the whole subscription, and
+    a paid or failed invoice newer than that. Nothing is written if the row
+    already holds a newer event.
+    """
+    events = [event for event in (snapshot, payment) if event is not None]
+    if not events:
+        return
+    newest = max(event.created for event in events)
+    values: Dict[str, Any] = {
+        "last_event_at": datetime.fromtimestamp(newest, tz=timezone.utc)
+    }
+    if snapshot is not None:
+        subscription_data = snapshot.data.object
+        if subscription_data["status"] in SUBSCRIPTION_STATUSES:
+            values["status"] = SUBSCRIPTION_STATUSES[subscription_data["status"]]
+        values["current_period_start"] = datetime.fromtimestamp(
+            subscription_data["current_period_start"]
+        )
+        values["current_period_end"] = datetime.fromtimestamp(
+            subscription_data["current_period_end"]
+        )
+        values["cancel_at_period_end"] = subscription_data["cancel_at_period_end"]
+        if snapshot.type == "customer.subscription.deleted":
+            values["status"] = SubscriptionStatus.CANCELED
+            values["cancel_at_period_end"] = True
+    if payment is not None:
+        values["status"] = PAYMENT_STATUSES[payment.type]
+
+    result = await db.execute(
+        update(Subscription)
+        .where(
+            Subscription.stripe_subscription_id == stripe_subscription_id,
+            or_(
+                Subscription.last_event_at.is_(None),
+                Subscription.last_event_at <= values["last_event_at"],
+            ),
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        logger.info(
+            f"Updated subscription {stripe_subscription_id} to its state at {newest}"
+        )
+    else:
+        logger.info(f"Dropped stale events for subscription {stripe_subscription_id}")
+
+
+async def handle_events(db: AsyncSession, events: List[stripe.Event]) -> None:
+    """
+    Apply a claimed batch, oldest first, to the database. Doesn't commit.
+
+    A subscription's events are coalesced: each invoice is written once and
+    the subscription once, with the newest state among them.
+    """
+    stripe_subscription_id = event_subscription_id(events[0])
+    if stripe_subscription_id is None:
+        for event in events:
+            if changes_invoice(event):
+                await mirror_invoice(db, event)
+        return
+
+    invoices: Dict[str, stripe.Event] = {}
+    created = snapshot = payment = None
+    for event in events:
+        if changes_invoice(event):
+            invoices[event.data.object.id] = event
+        if event.type in PAYMENT_STATUSES:
+            payment = event
+        elif event.type.startswith("customer.subscription."):
+            snapshot = event
+            if event.type == "customer.subscription.created":
+                created = event
+            # A newer status replaces the payment's, unknown ones don't
+            if snapshot.data.object["status"] in SUBSCRIPTION_STATUSES:
+                payment = None
+
+    for event in invoices.values():
+        await mirror_invoice(db, event)
+    if created is not None:
+        await subscription_created(db, created)
+        await db.flush()
+    await update_subscription(db, stripe_subscription_id, snapshot, payment)
+
+
+async def process_events(db: AsyncSession, event_ids: List[str], attempts: int) -> None:
+    """
+    Apply a claimed batch and mark it processed in the same transaction, or
+    record why it failed.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(StripeEvent.payload)
+        .where(StripeEvent.id.in_(event_ids))
+        .order_by(StripeEvent.stripe_created_at, StripeEvent.received_at)
+    )
+    events = [
+        stripe.Event.construct_from(json.loads(payload), stripe.api_key)
+        for payload in result.scalars().all()
+    ]
+    try:
+        await handle_events(db, events)
+        values = {"processed_at": now, "last_error": None}
+    except Exception as e:
+        await db.rollback()
+        logger.exception(f"Stripe events {', '.join(event_ids)} failed")
+        values = {
+            "last_error": str(e),
+            "next_attempt_at": datetime.now(timezone.utc) + retry_delay(attempts),
+        }
+        if attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS:
+            # Give up, or the subscription's later events would wait forever
+            logger.error(f"Giving up on Stripe events {event_ids} after {attempts}")
+            values["processed_at"] = now
+    await db.execute(
+        update(StripeEvent).where(StripeEvent.id.in_(event_ids)).values(**values)
+    )
+    await db.commit()
+
+
+async def run_once(batch_size: int) -> int:
+    """
+    Process up to batch_size due batches, returning how many were claimed.
+
+    Batches not started within half the lease are handed back, so none is
+    still being applied when its lease runs out.
+    """
+    async with AsyncSessionLocal() as db:
+        claimed = await claim_events(db, batch_size)
+        deadline = asyncio.get_running_loop().time() + settings.STRIPE_EVENT_LEASE / 2
+        for index, (event_ids, attempts) in enumerate(claimed):
+            if asyncio.get_running_loop().time() > deadline:
+                await release_events(db, claimed[index:])
+                break
+            await process_events(db, event_ids, attempts)
+    return len(claimed)
+
+
+async def release_events(
+    db: AsyncSession, claimed: List[Tuple[List[str], int]]
+) -> None:
+    """
+    Make claimed batches due again, without counting the claim as an attempt.
+    """
+    event_ids = [event_id for batch, _ in claimed for event_id in batch]
+    await db.execute(
+        update(StripeEvent)
+        .where(StripeEvent.id.in_(event_ids))
+        .values(
+            attempts=StripeEvent.attempts - 1,
+            next_attempt_at=datetime.now(timezone.utc),
+        )
+    )
+    await db.commit()
+
+
+async def prune_events(db: AsyncSession) -> int:
+    """
+    Delete events processed longer ago than the retention period.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(
+        days=settings.STRIPE_EVENT_RETENTION_DAYS
+    )
+    result = await db.execute(
+        delete(StripeEvent)
+        .where(StripeEvent.processed_at < cutoff)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def work() -> None:
+    """
+    Work through due events forever, polling when none are left.
+    """
+    while True:
+        try:
+            claimed = await run_once(settings.STRIPE_EVENT_BATCH_SIZE)
+        except Exception:
+            logger.exception("Stripe event batch failed")
+            claimed = 0
+        if claimed < settings.STRIPE_EVENT_BATCH_SIZE:
+            await asyncio.sleep(settings.STRIPE_EVENT_POLL_INTERVAL)
+
+
+async def prune() -> None:
+    """
+    Prune processed events once an hour, forever.
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                pruned = await prune_events(db)
+            if pruned:
+                logger.info(f"Pruned {pruned} processed Stripe events")
+        except Exception:
+            logger.exception("Pruning Stripe events failed")
+        await asyncio.sleep(3600)
+
+
+async def run() -> None:
+    """
+    STRIPE_EVENT_WORKERS workers sharing the queue, and the pruner.
+    """
+    await asyncio.gather(
+        prune(), *(work() for _ in range(settings.STRIPE_EVENT_WORKERS))
+    )
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
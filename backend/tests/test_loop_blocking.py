@@ -0,0 +1,312 @@
+import asyncio
+import gc
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, Iterator, List, Optional, Tuple
+
+import anyio
+import httpx
+import pytest
+import stripe
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from app.api.auth.router import router as auth_router
+from app.api.payments.router import router as payments_router
+from app.api.projects.router import router as projects_router
+from app.api.users.router import router as users_router
+from app.core.config import settings
+from app.core.dependencies import get_async_db, get_read_db
+from app.core.loop_monitor import LoopLagMonitor
+from app.core.security import create_user_access_token
+from app.db.lazy import LazySession
+from app.db.models.subscription import SubscriptionPlan
+from app.db.models.user import User
+from app.db.session import Base
+
+# Longest a route may hold the event loop, and how long each Stripe call takes
+MAX_BLOCK = 0.05
+STRIPE_LATENCY = 0.2
+
+CHECK_EMAIL = "loop-check@example.com"
+CHECK_CUSTOMER = "cus_loopcheck"
+CHECK_PRICE = "price_loopcheck"
+WEBHOOK_SECRET = "whsec_loopcheck"
+
+
+class StripeStandIn(BaseHTTPRequestHandler):
+    """
+    Answers the Stripe calls the payments routes make, each after `latency`
+    seconds, like a slow round trip to the real API would.
+    """
+
+    latency = STRIPE_LATENCY
+    subscriptions = 0
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def respond(self, body: Dict[str, Any]) -> None:
+        time.sleep(self.latency)
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        path = self.path.split("?")[0]
+        if path == "/v1/customers":
+            self.respond(stripe_list([stripe_customer()]))
+        elif path.startswith("/v1/customers/"):
+            self.respond(stripe_customer())
+        else:
+            self.respond(stripe_list([]))
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/v1/checkout/sessions"):
+            self.respond(
+                {
+                    "id": "cs_loopcheck",
+                    "object": "checkout.session",
+                    "url": "https://checkout.stripe.com/c/cs_loopcheck",
+                }
+            )
+        elif self.path.startswith("/v1/subscriptions"):
+            StripeStandIn.subscriptions += 1
+            self.respond(stripe_subscription(f"sub_{self.subscriptions}"))
+        else:
+            self.respond(stripe_customer())
+
+    def do_DELETE(self) -> None:
+        self.respond(stripe_subscription(self.path.rsplit("/", 1)[-1], "canceled"))
+
+
+def stripe_list(data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"object": "list", "data": data, "has_more": False, "url": "/v1/x"}
+
+
+def stripe_customer() -> Dict[str, Any]:
+    return {"id": CHECK_CUSTOMER, "object": "customer", "email": CHECK_EMAIL}
+
+
+def stripe_subscription(id: str, status: str = "active") -> Dict[str, Any]:
+    now = int(time.time())
+    return {
+        "id": id,
+        "object": "subscription",
+        "customer": CHECK_CUSTOMER,
+        "status": status,
+        "current_period_start": now,
+        "current_period_end": now + 30 * 86400,
+        "cancel_at_period_end": False,
+        "items": {
+            "object": "list",
+            "data": [{"object": "subscription_item", "price": {"id": CHECK_PRICE}}],
+        },
+    }
+
+
+def signed_event(event_type: str, data: Dict[str, Any]) -> Tuple[bytes, str]:
+    """
+    A webhook body and the stripe-signature header that verifies it.
+    """
+    payload = json.dumps(
+        {
+            "id": f"evt_{int(time.time() * 1000)}",
+            "object": "event",
+            "type": event_type,
+            "created": int(time.time()),
+            "data": {"object": data},
+        }
+    ).encode()
+    timestamp = int(time.time())
+    signature = hmac.new(
+        WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256
+    ).hexdigest()
+    return payload, f"t={timestamp},v1={signature}"
+
+
+@pytest.fixture
+def stripe_stand_in(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    """
+    Point the stripe library at a local StripeStandIn for the test.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StripeStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(stripe, "api_base", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(stripe, "api_key", "sk_test_loopcheck")
+    monkeypatch.setattr(stripe, "max_network_retries", 0)
+    monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    # The first call imports the HTTP client, which holds the GIL long enough
+    # to show up as a stall in whichever route happens to go first
+    stripe.Customer.retrieve(CHECK_CUSTOMER)
+    yield
+    server.shutdown()
+
+
+@pytest.fixture
+def app(tmp_path: Path) -> Tuple[FastAPI, AsyncEngine, async_sessionmaker]:
+    """
+    The API routers on a throwaway SQLite database, its engine and sessions.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'check_loop.db'}")
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def get_check_db() -> AsyncGenerator:
+        db = LazySession(Session)
+        try:
+            yield db
+        finally:
+            await db.release()
+
+    app = FastAPI()
+    app.dependency_overrides[get_async_db] = get_check_db
+    app.dependency_overrides[get_read_db] = get_check_db
+    prefix = settings.API_V1_STR
+    app.include_router(auth_router, prefix=f"{prefix}/auth")
+    app.include_router(users_router, prefix=f"{prefix}/users")
+    app.include_router(payments_router, prefix=f"{prefix}/payments")
+    app.include_router(projects_router, prefix=f"{prefix}/projects")
+    return app, engine, Session
+
+
+async def check(
+    client: httpx.AsyncClient,
+    label: str,
+    method: str,
+    path: str,
+    **kwargs: Any,
+) -> Tuple[Optional[str], httpx.Response]:
+    """
+    Send one request with a lag monitor running, and describe what went wrong
+    if it stalled the loop or failed.
+    """
+    monitor = LoopLagMonitor(interval=0.005, threshold=MAX_BLOCK)
+    sampling = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.02)
+    response = await client.request(method, path, **kwargs)
+    await asyncio.sleep(0.02)
+    sampling.cancel()
+    try:
+        await sampling
+    except asyncio.CancelledError:
+        pass
+
+    if response.status_code >= 400:
+        return f"{label}: {response.status_code} {response.text[:200]}", response
+    if monitor.max_lag >= MAX_BLOCK:
+        # The innermost frames are where the loop was stuck
+        stack = monitor.stalls[0]["stack"][-6:] if monitor.stalls else []
+        return (
+            "\n    ".join(
+                [f"{label}: blocked the loop {monitor.max_lag * 1000:.1f} ms"] + stack
+            ),
+            response,
+        )
+    return None, response
+
+
+def test_routes_do_not_block_the_loop(
+    stripe_stand_in: None, app: Tuple[FastAPI, AsyncEngine, async_sessionmaker]
+) -> None:
+    app, engine, Session = app
+
+    async def run() -> List[str]:
+        try:
+            return await check_routes()
+        finally:
+            await engine.dispose()
+
+    async def check_routes() -> List[str]:
+        # As the app's startup hook does, which also loads anyio's backend
+        anyio.to_thread.current_default_thread_limiter().total_tokens = (
+            settings.THREADPOOL_SIZE
+        )
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with Session() as db:
+            user = User(
+                email=CHECK_EMAIL,
+                full_name="Loop Check",
+                firebase_uid="loop-check",
+                is_active=True,
+            )
+            plan = SubscriptionPlan(
+                name="Loop check",
+                price=10.0,
+                interval="month",
+                stripe_price_id=CHECK_PRICE,
+                is_active=True,
+            )
+            db.add_all([user, plan])
+            await db.commit()
+            token = create_user_access_token(user)
+            plan_id = plan.id
+
+        headers = {"Authorization": f"Bearer {token}"}
+        payload, signature = signed_event(
+            "customer.subscription.created", stripe_subscription("sub_webhook")
+        )
+        prefix = settings.API_V1_STR
+        failures = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://check", headers=headers
+        ) as client:
+            for label, method, path, kwargs in [
+                ("GET /auth/me", "GET", "/auth/me", {}),
+                ("GET /users/{id}", "GET", f"/users/{user.id}", {}),
+                ("GET /projects/", "GET", "/projects/", {}),
+                ("GET /payments/plans", "GET", "/payments/plans", {}),
+                (
+                    "POST /payments/create-checkout-session",
+                    "POST",
+                    f"/payments/create-checkout-session/{plan_id}",
+                    {},
+                ),
+                (
+                    "POST /payments/subscribe",
+                    "POST",
+                    "/payments/subscribe",
+                    {"json": {"plan_id": plan_id, "payment_method_id": "pm_card_visa"}},
+                ),
+                ("GET /payments/invoices", "GET", "/payments/invoices", {}),
+                (
+                    "POST /payments/webhook",
+                    "POST",
+                    "/payments/webhook",
+                    {"content": payload, "headers": {"stripe-signature": signature}},
+                ),
+                ("GET /payments/subscriptions", "GET", "/payments/subscriptions", {}),
+            ]:
+                failure, response = await check(
+                    client, label, method, prefix + path, **kwargs
+                )
+                failures += [failure] if failure else []
+            subscription_id = response.json()[0]["id"]
+            failure, _ = await check(
+                client,
+                "POST /payments/cancel",
+                "POST",
+                f"{prefix}/payments/cancel",
+                params={"subscription_id": subscription_id},
+            )
+            failures += [failure] if failure else []
+        return failures
+
+    # As the app's last startup hook does
+    gc.collect()
+    gc.freeze()
+    try:
+        failures = asyncio.run(run())
+    finally:
+        gc.unfreeze()
+    assert not failures, "\n".join(failures)
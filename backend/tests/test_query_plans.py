@@ -0,0 +1,199 @@
+import os
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.engine import Connection
+
+from app.db.models import (
+    Invoice,
+    Project,
+    Subscription,
+    SubscriptionPlan,
+    SubscriptionStatus,
+    User,
+    project_members,
+)
+
+# A migrated Postgres database to EXPLAIN against, left untouched
+DATABASE_URL = os.getenv("QUERY_PLAN_DATABASE_URL")
+SEED_USERS = int(os.getenv("QUERY_PLAN_USERS", "100000"))
+SEED_PREFIX = "plan-check-"
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO users (email, firebase_uid, stripe_customer_id, is_active, is_superuser, created_at, updated_at)
+    SELECT :prefix || g || '@example.com', :prefix || g, 'cus_' || :prefix || g, true, false, now(), now()
+    FROM generate_series(1, :users) AS g
+    """,
+    """
+    INSERT INTO subscription_plans (name, price, interval, stripe_price_id, is_active, created_at, updated_at)
+    SELECT :prefix || g, 1000, 'month', 'price_' || :prefix || g, true, now(), now()
+    FROM generate_series(1, :plans) AS g
+    """,
+    """
+    INSERT INTO subscriptions (user_id, plan_id, status, stripe_subscription_id, cancel_at_period_end, created_at, updated_at)
+    SELECT u.id, p.id,
+           CASE WHEN (u.id + g) % 4 = 0 THEN 'ACTIVE' ELSE 'CANCELED' END::subscriptionstatus,
+           'sub_' || :prefix || u.id || '_' || g, false, now(), now()
+    FROM users u
+    CROSS JOIN generate_series(1, 3) AS g
+    JOIN subscription_plans p ON p.name = :prefix || (u.id % :plans + 1)
+    WHERE u.email LIKE :prefix || '%'
+    """,
+    """
+    INSERT INTO projects (name, owner_id, is_active, created_at, updated_at)
+    SELECT :prefix || u.id || '-' || g, u.id, true, now(), now()
+    FROM users u
+    CROSS JOIN generate_series(1, 5) AS g
+    WHERE u.email LIKE :prefix || '%'
+    """,
+    """
+    INSERT INTO project_members (project_id, user_id)
+    SELECT p.id, m.id
+    FROM projects p
+    CROSS JOIN generate_series(1, 2) AS g
+    JOIN users m ON m.id = p.owner_id + g
+    WHERE p.name LIKE :prefix || '%' AND m.email LIKE :prefix || '%'
+    """,
+    """
+    INSERT INTO invoices (stripe_invoice_id, user_id, status, currency, amount_due, amount_paid, created_at, last_event_at, updated_at)
+    SELECT 'in_' || :prefix || u.id || '_' || g, u.id, 'paid', 'usd', 1000, 1000,
+           now() - g * interval '30 days', now(), now()
+    FROM users u
+    CROSS JOIN generate_series(1, 5) AS g
+    WHERE u.email LIKE :prefix || '%'
+    """,
+]
+
+pytestmark = pytest.mark.skipif(
+    DATABASE_URL is None, reason="QUERY_PLAN_DATABASE_URL is not set"
+)
+
+
+def hot_queries(user_id: int, seed: int) -> List[Tuple[str, Any]]:
+    """The lookups every request or webhook runs, with seeded parameters."""
+    return [
+        (
+            "user by firebase_uid",
+            select(User).where(User.firebase_uid == f"{SEED_PREFIX}{seed}"),
+        ),
+        (
+            "active subscription by user",
+            select(Subscription)
+            .where(
+                Subscription.user_id == user_id,
+                Subscription.status == SubscriptionStatus.ACTIVE,
+            )
+            .order_by(Subscription.created_at.desc())
+            .limit(1),
+        ),
+        (
+            "latest canceled subscription by user",
+            select(Subscription)
+            .where(
+                Subscription.user_id == user_id,
+                Subscription.status == SubscriptionStatus.CANCELED,
+            )
+            .order_by(Subscription.updated_at.desc())
+            .limit(1),
+        ),
+        (
+            "subscription by stripe id",
+            select(Subscription).where(
+                Subscription.stripe_subscription_id == f"sub_{SEED_PREFIX}{user_id}_1"
+            ),
+        ),
+        (
+            "plan by stripe price id",
+            select(SubscriptionPlan).where(
+                SubscriptionPlan.stripe_price_id == f"price_{SEED_PREFIX}7"
+            ),
+        ),
+        (
+            "user by stripe customer id",
+            select(User.id).where(
+                User.stripe_customer_id == f"cus_{SEED_PREFIX}{seed}"
+            ),
+        ),
+        (
+            "invoices by user, newest first",
+            select(Invoice)
+            .where(Invoice.user_id == user_id)
+            .order_by(Invoice.created_at.desc(), Invoice.id.desc())
+            .limit(101),
+        ),
+        (
+            "invoice by stripe id",
+            select(Invoice).where(
+                Invoice.stripe_invoice_id == f"in_{SEED_PREFIX}{user_id}_1"
+            ),
+        ),
+        ("projects by owner", select(Project).where(Project.owner_id == user_id)),
+        (
+            "projects by member",
+            select(Project)
+            .join(project_members)
+            .where(project_members.c.user_id == user_id),
+        ),
+    ]
+
+
+def iter_plan_nodes(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from iter_plan_nodes(child)
+
+
+@pytest.fixture(scope="module")
+def seeded() -> Iterator[Tuple[Connection, int, int]]:
+    """
+    A connection to a synthetic dataset, with a user id and seed number in it.
+
+    Everything runs in one transaction that is rolled back, so the target
+    database is left untouched.
+    """
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            for statement in SEED_STATEMENTS:
+                connection.execute(
+                    text(statement),
+                    {
+                        "prefix": SEED_PREFIX,
+                        "users": SEED_USERS,
+                        # Enough plans that an index beats scanning the table
+                        "plans": max(SEED_USERS // 10, 50),
+                    },
+                )
+            connection.execute(
+                text(
+                    "ANALYZE users, subscriptions, subscription_plans, projects, "
+                    "project_members, invoices"
+                )
+            )
+            seed = SEED_USERS // 2
+            user_id = connection.execute(
+                select(User.id).where(User.email == f"{SEED_PREFIX}{seed}@example.com")
+            ).scalar_one()
+            yield connection, user_id, seed
+        finally:
+            transaction.rollback()
+    engine.dispose()
+
+
+@pytest.mark.parametrize("name", [name for name, _ in hot_queries(0, 0)])
+def test_hot_query_uses_indexes(seeded: Tuple[Connection, int, int], name: str) -> None:
+    connection, user_id, seed = seeded
+    query = dict(hot_queries(user_id, seed))[name]
+    compiled = query.compile(
+        dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+    )
+    plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    seq_scans = [
+        node["Relation Name"]
+        for node in iter_plan_nodes(plan[0]["Plan"])
+        if node["Node Type"] == "Seq Scan"
+    ]
+    assert not seq_scans, f"sequential scan on {', '.join(seq_scans)}"
@@ -0,0 +1,100 @@
+import asyncio
+from pathlib import Path
+from typing import AsyncGenerator, Tuple
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from app.api.users.router import router as users_router
+from app.core.config import settings
+from app.core.dependencies import get_async_db, get_read_db
+from app.core.refresh_tokens import issue_refresh_token
+from app.core.revocation import user_key
+from app.core.security import create_user_access_token
+from app.db.lazy import LazySession
+from app.db.models.refresh_token import RefreshToken
+from app.db.models.revoked_token import RevokedToken
+from app.db.models.user import User
+from app.db.session import Base
+
+
+@pytest.fixture
+def app(tmp_path: Path) -> Tuple[FastAPI, AsyncEngine, async_sessionmaker]:
+    """
+    The users router on a throwaway SQLite database, its engine and sessions.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}")
+    Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def get_test_db() -> AsyncGenerator:
+        db = LazySession(Session)
+        try:
+            yield db
+        finally:
+            await db.release()
+
+    app = FastAPI()
+    app.dependency_overrides[get_async_db] = get_test_db
+    app.dependency_overrides[get_read_db] = get_test_db
+    app.include_router(users_router, prefix=f"{settings.API_V1_STR}/users")
+    return app, engine, Session
+
+
+def test_update_without_flags_keeps_them_and_the_tokens(
+    app: Tuple[FastAPI, AsyncEngine, async_sessionmaker]
+) -> None:
+    app, engine, Session = app
+
+    async def run() -> None:
+        try:
+            await check_update()
+        finally:
+            await engine.dispose()
+
+    async def check_update() -> None:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with Session() as db:
+            user = User(
+                email="users-check@example.com",
+                full_name="Users Check",
+                firebase_uid="users-check",
+                is_active=True,
+                is_superuser=True,
+            )
+            db.add(user)
+            await db.flush()
+            await issue_refresh_token(db, user.id)
+            await db.commit()
+            token = create_user_access_token(user)
+
+        path = f"{settings.API_V1_STR}/users/{user.id}"
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://check",
+            headers={"Authorization": f"Bearer {token}"},
+        ) as client:
+            response = await client.put(path, json={"full_name": "Renamed"})
+            assert response.status_code == 200, response.text
+            assert response.json()["full_name"] == "Renamed"
+            assert response.json()["is_superuser"] is True
+
+            # The access token still works
+            response = await client.get(path)
+            assert response.status_code == 200, response.text
+
+        async with Session() as db:
+            revoked = await db.execute(
+                select(RevokedToken).where(RevokedToken.key == user_key(user.id))
+            )
+            assert revoked.scalar() is None
+            refresh = await db.execute(
+                select(RefreshToken.revoked_at).where(RefreshToken.user_id == user.id)
+            )
+            assert refresh.scalar_one() is None
+
+    asyncio.run(run())